@@ -0,0 +1,84 @@
+"""Run the benchmark suite against a synthetic registry.
+
+Usage::
+
+    python -m benchmarks --publishers 20 --activities 500 \\
+        --output results.json
+"""
+import argparse
+import json
+from os.path import abspath, dirname, join
+import shutil
+import sys
+import tempfile
+
+from iatikit.utils.config import CONFIG
+
+from .server import LocalServer
+from .suite import BENCHMARKS, Context, environment, run
+from .synthetic import generate_registry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--publishers', type=int, default=10)
+    parser.add_argument('--datasets', type=int, default=5,
+                        help='activity datasets per publisher')
+    parser.add_argument('--activities', type=int, default=100,
+                        help='activities per dataset')
+    parser.add_argument('--versions', default='1.03,2.03',
+                        help='comma-separated IATI versions to cycle through')
+    parser.add_argument('--broken', type=float, default=0.05,
+                        help='fraction of datasets with broken XML')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--standard', default=join(
+        dirname(dirname(abspath(__file__))), 'tests', 'fixtures',
+        'standard'), help='path to IATI standard schemas and codelists')
+    parser.add_argument('--only', action='append', choices=list(BENCHMARKS),
+                        help='only run this benchmark (can be repeated)')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    parameters = {
+        'publishers': args.publishers,
+        'datasets_per_publisher': args.datasets,
+        'activities_per_dataset': args.activities,
+        'versions': args.versions.split(','),
+        'broken': args.broken,
+        'seed': args.seed,
+    }
+    workdir = tempfile.mkdtemp()
+    CONFIG.read_dict({'paths': {'standard': args.standard}})
+    try:
+        with LocalServer(workdir) as server:
+            summary = generate_registry(
+                join(workdir, 'registry'),
+                publishers=args.publishers,
+                datasets_per_publisher=args.datasets,
+                activities_per_dataset=args.activities,
+                versions=parameters['versions'],
+                broken=args.broken,
+                base_url=server.url + '/registry/data',
+                seed=args.seed)
+            context = Context(workdir, summary, server)
+            context.make_dump()
+            results = run(context, names=args.only, repeat=args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        'environment': environment(),
+        'parameters': parameters,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handler:
+            json.dump(output, handler, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""A local stand-in for publisher servers, for download benchmarks."""
+import os
+from os.path import join, relpath
+import threading
+try:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    # the directory to serve. SimpleHTTPRequestHandler only takes
+    # a ``directory`` argument from python 3.7, so paths are
+    # translated from the working directory instead
+    root = None
+
+    def translate_path(self, path):
+        path = SimpleHTTPRequestHandler.translate_path(self, path)
+        return join(self.root, relpath(path, os.getcwd()))
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class LocalServer(object):
+    """Serve the files in ``directory`` over HTTP, on a free local port,
+    from a background thread.
+
+    Use as a context manager::
+
+        with LocalServer('registry/data') as server:
+            requests.get(server.url + '/publisher/dataset.xml')
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def __enter__(self):
+        handler = type('Handler', (_QuietHandler,),
+                       {'root': self.directory})
+        self._server = HTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,362 @@
+"""Benchmarks, run against a synthetic registry."""
+from collections import OrderedDict
+import logging
+import os
+from os.path import join
+import platform
+import shutil
+import sys
+import time
+import zipfile
+
+import lxml
+
+import iatikit
+from iatikit.data.registry import Registry
+from iatikit.data.sector import Sector
+from iatikit.index.catalog import Catalog
+from iatikit.standard.codelist import CodelistSet
+from iatikit.utils import download
+from iatikit.utils.config import CONFIG
+from iatikit.utils.filters import Q
+
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """Register a benchmark. Benchmarks take a ``Context``, and return
+    the number of items they processed. They can also return a tuple of
+    the number of items and a dictionary of other measurements, which
+    are added to the results.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class Context(object):
+    """Everything a benchmark needs: the synthetic registry,
+    a summary of what it contains, and a local server
+    that serves it.
+    """
+
+    def __init__(self, workdir, summary, server):
+        self.workdir = workdir
+        self.registry_path = join(workdir, 'registry')
+        self.scratch_path = join(workdir, 'scratch')
+        self.compiled_path = join(workdir, 'compiled')
+        self.summary = summary
+        self.server = server
+
+    @property
+    def registry(self):
+        return Registry(self.registry_path)
+
+    @property
+    def compiled_registry(self):
+        """Return a copy of the synthetic registry, with every
+        dataset compiled. The copy is made the first time it's used.
+        """
+        if not os.path.exists(self.compiled_path):
+            for directory in ('data', 'metadata'):
+                shutil.copytree(join(self.registry_path, directory),
+                                join(self.compiled_path, directory))
+            shutil.copy(join(self.registry_path, 'metadata.json'),
+                        self.compiled_path)
+            Catalog(self.compiled_path).compile()
+        return Registry(self.compiled_path)
+
+    @property
+    def dump_url(self):
+        return self.server.url + '/dump/iati_dump.zip'
+
+    def make_dump(self):
+        """Zip up the registry, to act as the data dump.
+
+        The dump is kept in its own directory, since ``download.data()``
+        downloads to (and then deletes) ``iati_dump.zip`` alongside
+        the scratch registry.
+        """
+        os.makedirs(join(self.workdir, 'dump'))
+        dump_path = join(self.workdir, 'dump', 'iati_dump.zip')
+        with zipfile.ZipFile(dump_path, 'w') as ziph:
+            for root, _, files in os.walk(self.registry_path):
+                for filename in files:
+                    fullpath = join(root, filename)
+                    ziph.write(fullpath,
+                               fullpath[len(self.registry_path):])
+
+    def scratch_registry(self):
+        """Point the config at an empty registry, with a copy of
+        the synthetic metadata in it.
+        """
+        shutil.rmtree(self.scratch_path, ignore_errors=True)
+        shutil.copytree(join(self.registry_path, 'metadata'),
+                        join(self.scratch_path, 'metadata'))
+        CONFIG.read_dict({'paths': {'registry': self.scratch_path}})
+
+
+@benchmark('datasets.iterate')
+def datasets_iterate(context):
+    return sum(1 for _ in context.registry.datasets)
+
+
+@benchmark('activities.iterate')
+def activities_iterate(context):
+    return sum(1 for _ in context.registry.activities)
+
+
+@benchmark('activities.iterate.prefetch')
+def activities_iterate_prefetch(context):
+    return sum(1 for _ in context.registry.activities.prefetch(4))
+
+
+@benchmark('activities.count')
+def activities_count(context):
+    context.registry.activities.count()
+    return context.summary['datasets']
+
+
+@benchmark('activities.get')
+def activities_get(context):
+    identifier = context.summary['identifiers'][-1]
+    assert context.registry.activities.get(identifier) is not None
+    return 1
+
+
+@benchmark('activities.where.sector')
+def activities_where_sector(context):
+    sector = Sector('73010', vocabulary='1')
+    return len(context.registry.activities.where(sector=sector))
+
+
+@benchmark('activities.where.sector_in')
+def activities_where_sector_in(context):
+    category = Sector('151', vocabulary='2')
+    return len(context.registry.activities.where(sector__in=category))
+
+
+@benchmark('activities.where.combined')
+def activities_where_combined(context):
+    category = Sector('151', vocabulary='2')
+    return len(context.registry.activities.where(
+        (Q(humanitarian=True) | Q(sector__in=category)) &
+        ~Q(version='1.03')))
+
+
+@benchmark('activities.where.planned_start')
+def activities_where_planned_start(context):
+    return len(context.registry.activities.where(
+        planned_start__gte='2010-01-01'))
+
+
+@benchmark('activities.where.active_during')
+def activities_where_active_during(context):
+    return len(context.registry.activities.where(
+        active_during=('2012-01-01', '2012-12-31')))
+
+
+@benchmark('activities.where.humanitarian')
+def activities_where_humanitarian(context):
+    return len(context.registry.activities.where(humanitarian=True))
+
+
+@benchmark('activities.fields')
+def activities_fields(context):
+    total = 0
+    for activity in context.registry.activities:
+        _ = (activity.iati_identifier, activity.title, activity.sector,
+             activity.planned_start, activity.end, activity.humanitarian)
+        total += 1
+    return total
+
+
+@benchmark('activities.records')
+def activities_records(context):
+    fields = ['iati_identifier', 'title', 'sector', 'planned_start',
+              'end', 'humanitarian']
+    return sum(1 for _ in context.registry.activities.records(fields))
+
+
+@benchmark('catalog.compile')
+def catalog_compile(context):
+    context.compiled_registry  # pylint: disable=pointless-statement
+    return Catalog(context.compiled_path).compile(force=True)
+
+
+@benchmark('compiled.activities.get')
+def compiled_activities_get(context):
+    identifier = context.summary['identifiers'][-1]
+    assert context.compiled_registry.activities.get(identifier) is not None
+    return 1
+
+
+@benchmark('index.bloom.false_positives')
+def index_bloom_false_positives(context):
+    context.compiled_registry  # pylint: disable=pointless-statement
+    indexes = [index for index in Catalog(context.compiled_path)
+               if index.bloom is not None]
+    checks = false_positives = 0
+    for index in indexes:
+        for idx in range(1000):
+            checks += 1
+            if index.may_contain('id', 'XX-MISSING-{}'.format(idx)):
+                false_positives += 1
+    error_rates = set(index._record['bloom']['error_rate']
+                      for index in indexes)
+    return checks, {
+        'false_positive_rate': false_positives / float(checks or 1),
+        'target_error_rate': error_rates.pop() if error_rates else None,
+    }
+
+
+@benchmark('compiled.activities.count')
+def compiled_activities_count(context):
+    return len(context.compiled_registry.activities)
+
+
+@benchmark('compiled.activities.where.planned_start')
+def compiled_activities_where_planned_start(context):
+    return len(context.compiled_registry.activities.where(
+        planned_start__gte='2010-01-01'))
+
+
+@benchmark('compiled.activities.where.active_during')
+def compiled_activities_where_active_during(context):
+    return len(context.compiled_registry.activities.where(
+        active_during=('2012-01-01', '2012-12-31')))
+
+
+@benchmark('compiled.activities.where.sector')
+def compiled_activities_where_sector(context):
+    sector = Sector('73010', vocabulary='1')
+    return len(context.compiled_registry.activities.where(sector=sector))
+
+
+@benchmark('compiled.activities.where.sector_in')
+def compiled_activities_where_sector_in(context):
+    category = Sector('151', vocabulary='2')
+    return len(context.compiled_registry.activities.where(
+        sector__in=category))
+
+
+@benchmark('compiled.activities.where.combined')
+def compiled_activities_where_combined(context):
+    category = Sector('151', vocabulary='2')
+    return len(context.compiled_registry.activities.where(
+        (Q(humanitarian=True) | Q(sector__in=category)) &
+        ~Q(version='1.03')))
+
+
+@benchmark('index.sector_postings')
+def index_sector_postings(context):
+    context.compiled_registry  # pylint: disable=pointless-statement
+    category = Sector('151', vocabulary='2')
+    return sum(1 for _ in Catalog(context.compiled_path).sector_postings(
+        category, category=True))
+
+
+@benchmark('compiled.activities.where.humanitarian')
+def compiled_activities_where_humanitarian(context):
+    return len(context.compiled_registry.activities.where(
+        humanitarian=True))
+
+
+@benchmark('compiled.activities.records')
+def compiled_activities_records(context):
+    fields = ['iati_identifier', 'title', 'sector', 'planned_start',
+              'end', 'humanitarian']
+    return sum(1 for _ in context.compiled_registry.activities.records(
+        fields))
+
+
+@benchmark('validate.xsd')
+def validate_xsd(context):
+    total = 0
+    for dataset in context.registry.datasets:
+        dataset.validate_iati()
+        total += 1
+    return total
+
+
+@benchmark('validate.codelists')
+def validate_codelists(context):
+    total = 0
+    for dataset in context.registry.datasets:
+        dataset.validate_codelists()
+        total += 1
+    return total
+
+
+@benchmark('codelists.lookup')
+def codelists_lookup(context):
+    sectors = CodelistSet().get('Sector')
+    total = 0
+    for _ in range(100):
+        for code in ['15153', '15163', '73010', '99999']:
+            sectors.get(code)
+            total += 1
+    return total
+
+
+@benchmark('download.datasets')
+def download_datasets(context):
+    context.scratch_registry()
+    statuses = download.datasets()
+    return len(statuses)
+
+
+@benchmark('download.data')
+def download_data(context):
+    CONFIG.read_dict({'paths': {'registry': context.scratch_path}})
+    download.data(url=context.dump_url, retries=0)
+    return context.summary['datasets']
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'iatikit': iatikit.__version__,
+        'lxml': '.'.join(str(x) for x in lxml.etree.LXML_VERSION),
+        'argv': sys.argv,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def run(context, names=None, repeat=3):
+    """Run the benchmarks in ``names`` (or all of them),
+    ``repeat`` times each. Returns a list of results.
+    """
+    results = []
+    logger = logging.getLogger('iatikit')
+    log_level = logger.level
+    logger.setLevel(logging.ERROR)
+    try:
+        for name, func in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            timings = []
+            for _ in range(repeat):
+                started = time.time()
+                items = func(context)
+                timings.append(time.time() - started)
+            measurements = {}
+            if isinstance(items, tuple):
+                items, measurements = items
+            best = min(timings)
+            results.append(dict(
+                measurements,
+                name=name,
+                items=items,
+                timings=timings,
+                best=best,
+                mean=sum(timings) / len(timings),
+                items_per_second=items / best if best else None,
+            ))
+    finally:
+        logger.setLevel(log_level)
+    return results
@@ -0,0 +1,195 @@
+"""Generate synthetic registries, of any size, for benchmarking."""
+from datetime import date, datetime, timedelta
+import json
+from os import makedirs
+from os.path import join
+import random
+
+from lxml import etree as ET
+
+
+SECTORS = {
+    '151': ['15153', '15163'],
+    '730': ['73010'],
+}
+ACTIVITY_STATUSES = ['1', '2', '3', '4', '5', '6']
+DATE_TYPES = {
+    'v1': ['start-planned', 'start-actual', 'end-planned', 'end-actual'],
+    'v2': ['1', '2', '3', '4'],
+}
+
+
+def _publisher_ref(publisher_idx):
+    return 'XM-SYN-{:04d}'.format(publisher_idx)
+
+
+def _narrative(parent, text, v2):
+    if v2:
+        ET.SubElement(parent, 'narrative').text = text
+    else:
+        parent.text = text
+
+
+def _activity(rand, identifier, org_ref, related, v2):
+    activity = ET.Element('iati-activity')
+    activity.set('last-updated-datetime', '2020-01-01T00:00:00')
+    if v2 and rand.random() < 0.2:
+        activity.set('humanitarian', '1')
+    ET.SubElement(activity, 'iati-identifier').text = identifier
+    reporting_org = ET.SubElement(activity, 'reporting-org', ref=org_ref,
+                                  type='21')
+    _narrative(reporting_org, 'Synthetic Organisation ' + org_ref, v2)
+    _narrative(ET.SubElement(activity, 'title'),
+               'Activity ' + identifier, v2)
+    _narrative(ET.SubElement(activity, 'description'),
+               'Synthetic activity description. ' * rand.randint(1, 20), v2)
+    ET.SubElement(activity, 'activity-status',
+                  code=rand.choice(ACTIVITY_STATUSES))
+
+    start = date(2000, 1, 1) + timedelta(days=rand.randint(0, 7300))
+    end = start + timedelta(days=rand.randint(30, 3650))
+    dates = [start, start + timedelta(days=rand.randint(0, 90)),
+             end, end + timedelta(days=rand.randint(0, 90))]
+    date_types = DATE_TYPES['v2' if v2 else 'v1']
+    for date_type, activity_date in zip(date_types, dates):
+        if rand.random() < 0.8:
+            ET.SubElement(activity, 'activity-date', type=date_type,
+                          **{'iso-date': activity_date.isoformat()})
+
+    codes = [code for codes in SECTORS.values() for code in codes]
+    sectors = rand.sample(codes, rand.randint(0, len(codes)))
+    for sector_code in sectors:
+        sector = ET.SubElement(activity, 'sector', code=sector_code,
+                               vocabulary='1' if v2 else 'DAC')
+        sector.set('percentage', str(100 // len(sectors)))
+    if related is not None:
+        ET.SubElement(activity, 'related-activity', ref=related,
+                      type='1')
+    for _ in range(rand.randint(0, 5)):
+        transaction = ET.SubElement(activity, 'transaction')
+        ET.SubElement(transaction, 'transaction-type', code='3')
+        ET.SubElement(transaction, 'transaction-date',
+                      **{'iso-date': start.isoformat()})
+        ET.SubElement(transaction, 'value', currency='USD').text = \
+            str(rand.randint(1000, 1000000))
+    return activity
+
+
+def _activities_xml(rand, version, identifiers, org_ref, all_identifiers):
+    v2 = not version.startswith('1.')
+    root = ET.Element('iati-activities', version=version)
+    root.set('generated-datetime', '2020-01-01T00:00:00')
+    for identifier in identifiers:
+        related = None
+        if all_identifiers and rand.random() < 0.1:
+            related = rand.choice(all_identifiers)
+        root.append(_activity(rand, identifier, org_ref, related, v2))
+    return ET.tostring(root, pretty_print=True, xml_declaration=True,
+                       encoding='UTF-8')
+
+
+def _organisations_xml(version, org_ref):
+    v2 = not version.startswith('1.')
+    root = ET.Element('iati-organisations', version=version)
+    root.set('generated-datetime', '2020-01-01T00:00:00')
+    organisation = ET.SubElement(root, 'iati-organisation')
+    organisation.set('last-updated-datetime', '2020-01-01T00:00:00')
+    ET.SubElement(
+        organisation,
+        'organisation-identifier' if v2 else 'iati-identifier').text = \
+        org_ref
+    _narrative(ET.SubElement(organisation, 'name'),
+               'Synthetic Organisation ' + org_ref, v2)
+    return ET.tostring(root, pretty_print=True, xml_declaration=True,
+                       encoding='UTF-8')
+
+
+def _dataset_metadata(publisher_name, dataset_name, filetype, url):
+    return {
+        'name': dataset_name,
+        'organization': {'name': publisher_name},
+        'resources': [{'url': url}],
+        'extras': [{'key': 'filetype', 'value': filetype}],
+    }
+
+
+def generate_registry(path, publishers=10, datasets_per_publisher=5,
+                      activities_per_dataset=100,
+                      versions=('1.03', '2.03'), broken=0.0,
+                      organisations=True, base_url='http://localhost',
+                      seed=0):
+    """Write a synthetic registry to ``path``.
+
+    Each of the ``publishers`` gets ``datasets_per_publisher`` activity
+    datasets, each with ``activities_per_dataset`` activities, plus
+    (optionally) an organisation dataset. Datasets cycle through the
+    IATI ``versions`` given. A ``broken`` fraction of the datasets are
+    truncated, so that they aren't valid XML.
+
+    Metadata resource URLs point to ``base_url``, in the form
+    ``<base_url>/<publisher>/<dataset>.xml``.
+
+    The same ``seed`` always produces the same registry. Returns a
+    dictionary describing what was generated.
+    """
+    rand = random.Random(seed)
+    summary = {
+        'publishers': publishers,
+        'datasets': 0,
+        'activities': 0,
+        'broken_datasets': 0,
+        'identifiers': [],
+    }
+    makedirs(join(path, 'data'), exist_ok=True)
+    makedirs(join(path, 'metadata'), exist_ok=True)
+    with open(join(path, 'metadata.json'), 'w') as handler:
+        json.dump({
+            'updated_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }, handler)
+
+    dataset_idx = 0
+    for publisher_idx in range(publishers):
+        publisher_name = 'synthetic-{:04d}'.format(publisher_idx)
+        org_ref = _publisher_ref(publisher_idx)
+        data_path = join(path, 'data', publisher_name)
+        metadata_path = join(path, 'metadata', publisher_name)
+        makedirs(data_path, exist_ok=True)
+        makedirs(metadata_path, exist_ok=True)
+        with open(metadata_path + '.json', 'w') as handler:
+            json.dump({'name': publisher_name,
+                       'title': 'Synthetic Organisation ' + org_ref},
+                      handler)
+
+        datasets = []
+        for idx in range(datasets_per_publisher):
+            version = versions[dataset_idx % len(versions)]
+            dataset_idx += 1
+            dataset_name = '{}-activities-{}'.format(publisher_name, idx)
+            identifiers = [
+                '{}-{}-{}'.format(org_ref, idx, activity_idx)
+                for activity_idx in range(activities_per_dataset)]
+            xml = _activities_xml(rand, version, identifiers, org_ref,
+                                  summary['identifiers'])
+            summary['identifiers'] += identifiers
+            summary['activities'] += len(identifiers)
+            datasets.append((dataset_name, 'activity', xml))
+        if organisations:
+            dataset_name = '{}-org'.format(publisher_name)
+            version = versions[publisher_idx % len(versions)]
+            datasets.append((dataset_name, 'organisation',
+                             _organisations_xml(version, org_ref)))
+
+        for dataset_name, filetype, xml in datasets:
+            if broken and rand.random() < broken:
+                xml = xml[:len(xml) // 2]
+                summary['broken_datasets'] += 1
+            summary['datasets'] += 1
+            with open(join(data_path, dataset_name + '.xml'), 'wb') as f:
+                f.write(xml)
+            url = '{}/{}/{}.xml'.format(base_url, publisher_name,
+                                        dataset_name)
+            with open(join(metadata_path, dataset_name + '.json'),
+                      'w') as handler:
+                json.dump(_dataset_metadata(
+                    publisher_name, dataset_name, filetype, url), handler)
+    return summary
@@ -1,18 +1,56 @@
+from importlib import import_module
 import logging
+import sys
 
-from .standard.codelist import codelists  # noqa: F401
-from .data.registry import Registry
-from .data.publisher import Publisher  # noqa: F401
-from .data.dataset import Dataset  # noqa: F401
-from .data.activity import Activity  # noqa: F401
-from .data.sector import Sector  # noqa: F401
-from .utils import download  # noqa: F401
+# Import the (empty) ``data`` package up front. Otherwise, lazily
+# importing one of its modules would replace the ``data()`` helper
+# below with the package.
+from . import data  # noqa: F401
 from .utils.config import CONFIG  # noqa: F401
 from .__version__ import __version__  # noqa: F401
 
 
-def data(path=None):
+# These are only imported when first accessed, so that
+# ``import iatikit`` stays fast.
+_LAZY_ATTRIBUTES = {
+    'codelists': ('.standard.codelist', 'codelists'),
+    'Registry': ('.data.registry', 'Registry'),
+    'Publisher': ('.data.publisher', 'Publisher'),
+    'Dataset': ('.data.dataset', 'Dataset'),
+    'Activity': ('.data.activity', 'Activity'),
+    'ActivitySnapshot': ('.data.activity', 'ActivitySnapshot'),
+    'Sector': ('.data.sector', 'Sector'),
+    'Q': ('.utils.filters', 'Q'),
+    'download': ('.utils.download', None),
+    'instrument': ('.utils.instrument', None),
+}
+
+
+def __getattr__(name):
+    try:
+        module_name, attr_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+    module = import_module(module_name, __name__)
+    value = getattr(module, attr_name) if attr_name else module
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(list(globals().keys()) + list(_LAZY_ATTRIBUTES)))
+
+
+if sys.version_info < (3, 7):
+    # module-level __getattr__ isn't supported, so import everything now
+    for _name in _LAZY_ATTRIBUTES:
+        __getattr__(_name)
+
+
+def data(path=None):  # noqa: F811
     """Helper function for constructing a Registry object."""
+    from .data.registry import Registry
     return Registry(path)
 
 
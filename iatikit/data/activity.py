@@ -8,19 +8,35 @@ from lxml import etree as ET
 
 from ..standard.schema import get_schema
 from ..standard.xsd_schema import XSDSchema
-from ..utils.abstract import GenericSet
-from ..utils.exceptions import SchemaError
-from ..utils.querybuilder import XPathQueryBuilder
+from .elements import ElementSet
 
 
 class Activity(object):
     """Class representing an IATI activity."""
 
     def __init__(self, etree, dataset=None, schema=None):
-        self.etree = etree
+        self._etree = etree
+        self._load_etree = None
         self.dataset = dataset
         self._schema = schema
         self.version = self.schema.version
+        self._values = {}
+
+    @property
+    def etree(self):
+        """Return the XML of this activity, as an lxml element.
+
+        Items read from a compiled dataset only parse
+        their XML when it's first needed.
+        """
+        if self._etree is None and self._load_etree is not None:
+            self._etree = self._load_etree()
+            self._load_etree = None
+        return self._etree
+
+    @etree.setter
+    def etree(self, etree):
+        self._etree = etree
 
     def __repr__(self):
         id_ = self.iati_identifier
@@ -43,6 +59,19 @@ class Activity(object):
             pass
         return self._schema
 
+    def _value(self, field):
+        """Extract ``field`` from the activity XML, using the schema.
+
+        Values are memoized, so each field is only extracted once. Any
+        changes made to ``etree`` afterwards won't be reflected.
+        """
+        try:
+            return self._values[field]
+        except KeyError:
+            value = getattr(self.schema, field)().run(self.etree)
+            self._values[field] = value
+            return value
+
     @property
     def xml(self):
         """Return the raw XML of this activity, as a byte-string."""
@@ -53,11 +82,17 @@ class Activity(object):
         """Return the iati-identifier for this activity,
         or ``None`` if it isn't provided.
         """
-        id_ = self.schema.iati_identifier().run(self.etree)
+        id_ = self._value('iati_identifier')
         if id_:
             return id_[0].strip()
         return None
 
+    def snapshot(self):
+        """Return a compact, picklable ``ActivitySnapshot``
+        of this activity.
+        """
+        return ActivitySnapshot.from_activity(self)
+
     def validate_iati(self):
         etree = ET.Element('iati-activities')
         etree.set('version', self.version)
@@ -70,37 +105,47 @@ class Activity(object):
         """Alias of ``iati_identifier``."""
         return self.iati_identifier
 
+    @property
+    def reporting_org(self):
+        """Return the reporting-org ref for this activity,
+        or ``None`` if it isn't provided.
+        """
+        ref = self._value('reporting_org')
+        if ref:
+            return ref[0].strip()
+        return None
+
     @property
     def title(self):
         """Return a list of titles for this activity."""
-        return self.schema.title().run(self.etree)
+        return self._value('title')
 
     @property
     def description(self):
         """Return a list of descriptions for this activity."""
-        return self.schema.description().run(self.etree)
+        return self._value('description')
 
     @property
     def location(self):
         """Return a list of locations for this activity."""
-        return self.schema.location().run(self.etree)
+        return self._value('location')
 
     @property
     def sector(self):
         """Return a list of sectors for this activity."""
-        return self.schema.sector().run(self.etree)
+        return self._value('sector')
 
     @property
     def humanitarian(self):
         """Return True if the humanitarian flag is set for this activity."""
-        return self.schema.humanitarian().run(self.etree)
+        return self._value('humanitarian')
 
     @property
     def planned_start(self):
         """Return the planned start date for this activity,
         as a python ``date``.
         """
-        date = self.schema.planned_start().run(self.etree)
+        date = self._value('planned_start')
         return date[0] if date else None
 
     @property
@@ -108,7 +153,7 @@ class Activity(object):
         """Return the actual start date for this activity,
         as a python ``date``.
         """
-        date = self.schema.actual_start().run(self.etree)
+        date = self._value('actual_start')
         return date[0] if date else None
 
     @property
@@ -126,7 +171,7 @@ class Activity(object):
         """Return the planned end date for this activity,
         as a python ``date``.
         """
-        date = self.schema.planned_end().run(self.etree)
+        date = self._value('planned_end')
         return date[0] if date else None
 
     @property
@@ -134,7 +179,7 @@ class Activity(object):
         """Return the actual end date for this activity,
         as a python ``date``.
         """
-        date = self.schema.actual_end().run(self.etree)
+        date = self._value('actual_end')
         return date[0] if date else None
 
     @property
@@ -148,7 +193,59 @@ class Activity(object):
         return self.planned_end
 
 
-class ActivitySet(GenericSet):
+class ActivitySnapshot(object):
+    """Class representing a serialized IATI activity.
+
+    Snapshots are small and picklable, so they can be stored, or sent
+    between processes. The activity XML is only parsed when one of
+    its fields is first accessed. Fields are then read from a rebuilt
+    ``Activity``, e.g. ``snapshot.title``.
+    """
+
+    __slots__ = ('xml', 'dataset_name', 'version', '_activity')
+
+    def __init__(self, xml, dataset_name=None, version=None):
+        self.xml = xml
+        self.dataset_name = dataset_name
+        self.version = version
+        self._activity = None
+
+    @classmethod
+    def from_activity(cls, activity):
+        dataset_name = activity.dataset.name if activity.dataset else None
+        return cls(ET.tostring(activity.etree), dataset_name,
+                   activity.version)
+
+    def __repr__(self):
+        return '<{} ({})>'.format(
+            self.__class__.__name__, self.activity.iati_identifier or
+            '[No identifier]')
+
+    def __getstate__(self):
+        return (self.xml, self.dataset_name, self.version)
+
+    def __setstate__(self, state):
+        self.xml, self.dataset_name, self.version = state
+        self._activity = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.activity, name)
+
+    @property
+    def activity(self):
+        """Return the ``Activity`` for this snapshot,
+        parsing it if necessary.
+        """
+        if self._activity is None:
+            schema = get_schema('activity', self.version)
+            self._activity = Activity(ET.fromstring(self.xml),
+                                      schema=schema)
+        return self._activity
+
+
+class ActivitySet(ElementSet):
     """Class representing a grouping of ``Activity`` objects.
 
     Objects in this grouping can be filtered and iterated over.
@@ -158,58 +255,16 @@ class ActivitySet(GenericSet):
 
     _key = 'iati_identifier'
     _multi_filters = [
-        'id', 'iati_identifier', 'title', 'description',
+        'id', 'iati_identifier', 'reporting_org', 'title', 'description',
         'location', 'sector', 'planned_start',
         'actual_start', 'planned_end', 'actual_end',
-        'xpath', 'humanitarian',
+        'active_during', 'xpath', 'humanitarian',
     ]
+    _bloom_keys = {
+        'id': 'id',
+        'iati_identifier': 'id',
+        'reporting_org': 'reporting_org',
+    }
     _instance_class = Activity
     _filetype = 'activity'
     _element = '/iati-activities/iati-activity'
-
-    def __init__(self, datasets, **kwargs):
-        super(ActivitySet, self).__init__()
-        self.wheres = kwargs
-        self.datasets = datasets
-
-    def __len__(self):
-        total = 0
-        for dataset in self.datasets:
-            if dataset.filetype != self._filetype:
-                continue
-            if not dataset.validate_xml():
-                continue
-            try:
-                schema = get_schema(dataset.filetype, dataset.version)
-            except SchemaError:
-                continue
-            prefix = self._element
-            query = XPathQueryBuilder(
-                schema,
-                prefix=prefix,
-                count=True
-            ).where(**self.wheres)
-            total += int(dataset.etree.xpath(query))
-        return total
-
-    def _query(self, schema=None):
-        if schema is None:
-            schema = get_schema(self._filetype, '2.03')
-        return XPathQueryBuilder(
-            schema,
-            prefix=self._element,
-        ).where(**self.wheres)
-
-    def __iter__(self):
-        for dataset in self.datasets:
-            if dataset.filetype != self._filetype:
-                continue
-            if not dataset.validate_xml():
-                continue
-            try:
-                schema = get_schema(dataset.filetype, dataset.version)
-            except SchemaError:
-                continue
-            activity_etrees = dataset.etree.xpath(self._query(schema))
-            for tree in activity_etrees:
-                yield self._instance_class(tree, dataset, schema)
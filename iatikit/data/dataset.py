@@ -1,4 +1,5 @@
-from os.path import basename, exists, splitext
+from copy import deepcopy
+from os.path import basename, exists, getsize, splitext
 from glob import glob
 import json
 import logging
@@ -7,15 +8,32 @@ import webbrowser
 from past.builtins import basestring
 from lxml import etree as ET
 
-from ..utils.abstract import GenericSet
+from ..utils import instrument
+from ..utils.abstract import GenericSet, compiled_xpath
+from ..utils.explain import QueryPlan, QueryTracker
+from ..utils.mapping import chunks, open_mapping
 from ..utils.exceptions import SchemaNotFoundError, MappingsNotFoundError
 from ..utils.validator import Validator, ValidationError
 from ..standard.xsd_schema import XSDSchema
 from ..standard.codelist_mappings import CodelistMappings
+from ..index.catalog import DatasetIndex
+from ..index.compiled import CompiledDataset
 from .activity import ActivitySet
 from .organisation import OrganisationSet
 
 
+def _parse_mapping(mapping, parser, start=0, end=None, **kwargs):
+    """Parse ``mapping[start:end]`` without copying it, if lxml can
+    parse from a buffer (lxml 6+). Older versions can only parse
+    strings, so they're given a copy of the bytes.
+    """
+    try:
+        return ET.fromstring(memoryview(mapping)[start:end], parser,
+                             **kwargs)
+    except ValueError:
+        return ET.fromstring(mapping[start:end], parser, **kwargs)
+
+
 class Dataset(object):
     """Class representing an IATI dataset."""
 
@@ -30,6 +48,8 @@ class Dataset(object):
         self._etree = None
         self._metadata = None
         self._schema = None
+        self._index = None
+        self._compiled = None
 
     @property
     def name(self):
@@ -41,21 +61,128 @@ class Dataset(object):
         else:
             return 'dataset'
 
+    @property
+    def mapping(self):
+        """Return a read-only memory map of the dataset file, or
+        ``None`` if it can't be mapped (e.g. it's missing or empty).
+
+        The map is shared by every ``Dataset`` for the same file,
+        so reading from it doesn't open the file again.
+        """
+        if not isinstance(self.data_path, basestring):
+            return None
+        try:
+            return open_mapping(self.data_path)
+        except (IOError, OSError, ValueError):
+            return None
+
     @property
     def etree(self):
-        """Return the XML of this dataset, as an lxml element tree."""
+        """Return the XML of this dataset, as an lxml element tree.
+
+        The file is parsed straight from its memory map, if possible.
+        """
         if not self._etree:
+            instrument.emit('etree_cache_miss', dataset=self.name)
             if not self.data_path:
                 raise IOError('XML file not found')
+            if instrument.enabled() and exists(self.data_path):
+                instrument.emit('files_opened', dataset=self.name)
+                instrument.emit('bytes_parsed', getsize(self.data_path),
+                                dataset=self.name)
             try:
                 parser = ET.XMLParser(remove_blank_text=True, huge_tree=True)
-                self._etree = ET.parse(self.data_path, parser)
+                mapping = self.mapping
+                with instrument.timer('parse', dataset=self.name):
+                    if mapping is None:
+                        self._etree = ET.parse(self.data_path, parser)
+                    else:
+                        self._etree = _parse_mapping(
+                            mapping, parser,
+                            base_url=self.data_path).getroottree()
             except ET.XMLSyntaxError:
                 logging.getLogger(__name__).warning(
                     'Dataset "%s" XML is invalid', self.name)
                 raise
+        else:
+            instrument.emit('etree_cache_hit')
         return self._etree
 
+    def aetree(self, executor=None):
+        """Parse this dataset in ``executor`` (by default, a shared
+        thread pool), and return an awaitable of the element tree.
+        Python 3 only.
+        """
+        from ..utils.aio import run
+        return run(lambda: self.etree, executor=executor)
+
+    @property
+    def index(self):
+        """Return the ``DatasetIndex`` for this dataset, or ``None``
+        if it hasn't been indexed (or the index is out of date).
+        """
+        if self._index is None and isinstance(self.data_path, basestring):
+            self._index = DatasetIndex.load(self.data_path)
+        return self._index
+
+    @property
+    def compiled(self):
+        """Return the ``CompiledDataset`` for this dataset, or ``None``
+        if it hasn't been compiled (or the index is out of date).
+        """
+        if self._compiled is None:
+            self._compiled = False
+            index = self.index
+            if index is not None and index.sha256:
+                self._compiled = CompiledDataset.load(
+                    self.data_path, index.sha256) or False
+        return self._compiled or None
+
+    def _read_element(self, ordinal, path):
+        """Return the element at ``ordinal`` (among those at XPath
+        ``path``), parsing just its bytes using the offsets in the index.
+
+        Falls back to parsing the whole dataset, if the element
+        can't be parsed on its own (e.g. if it uses a namespace
+        declared on the root element).
+        """
+        index = self.index
+        mapping = self.mapping
+        if self._etree is None and index is not None and \
+                index.offsets is not None and mapping is not None:
+            start, end = index.offsets[ordinal]
+            parser = ET.XMLParser(remove_blank_text=True, huge_tree=True,
+                                  encoding=index.encoding)
+            try:
+                return _parse_mapping(mapping, parser, start, end)
+            except ET.XMLSyntaxError:
+                pass
+        return compiled_xpath(path)(self.etree)[ordinal]
+
+    def _read_header(self):
+        """Return the tag and attributes of the XML root node,
+        reading as little of the file as possible.
+
+        Returns ``(None, {})`` if the file can't be read.
+        """
+        if self._etree is not None:
+            root = self._etree.getroot()
+            return root.tag, dict(root.attrib)
+        if self.index is not None and self.index.valid:
+            return self.index.root, self.index.attributes
+        mapping = self.mapping
+        if mapping is None:
+            return None, {}
+        parser = ET.XMLPullParser(events=('start',), huge_tree=True)
+        try:
+            for chunk in chunks(mapping):
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    return element.tag, dict(element.attrib)
+        except ET.XMLSyntaxError:
+            pass
+        return None, {}
+
     @property
     def xml(self):
         """Return the raw XML of this dataset, as a byte-string."""
@@ -96,6 +223,11 @@ class Dataset(object):
 
     def validate_xml(self):
         """Check whether the XML in this dataset can be parsed."""
+        if self._etree is None and self.index is not None:
+            if not self.index.valid:
+                return Validator(
+                    False, [ValidationError(self.index.error)])
+            return Validator(True)
         try:
             self.etree
         except (IOError, ET.XMLSyntaxError) as error:
@@ -175,6 +307,9 @@ class Dataset(object):
     @property
     def root(self):
         """Return the name of the XML root node."""
+        if self._etree is None and self.index is not None \
+                and self.index.valid:
+            return self.index.root
         try:
             return self.etree.getroot().tag
         except ET.XMLSyntaxError:
@@ -186,6 +321,9 @@ class Dataset(object):
 
         Return "1.01" if the version can't be determined.
         """
+        if self._etree is None and self.index is not None \
+                and self.index.valid:
+            return self.index.version
         version = self.etree.getroot().get('version')
         if version is not None:
             return version
@@ -225,14 +363,15 @@ class DatasetSet(GenericSet):
         self.metadata_path = metadata_path
 
     def __iter__(self):
-        data_paths = {
-            splitext(basename(x))[0]: x
-            for x in glob(self.data_path)
-        } if self.data_path else {}
-        metadata_paths = {
-            splitext(basename(x))[0]: x
-            for x in glob(self.metadata_path)
-        } if self.metadata_path else {}
+        with instrument.timer('glob'):
+            data_paths = {
+                splitext(basename(x))[0]: x
+                for x in glob(self.data_path)
+            } if self.data_path else {}
+            metadata_paths = {
+                splitext(basename(x))[0]: x
+                for x in glob(self.metadata_path)
+            } if self.metadata_path else {}
 
         paths = {x: (data_paths.get(x), metadata_paths.get(x))
                  for x in set(list(data_paths.keys()) +
@@ -247,18 +386,50 @@ class DatasetSet(GenericSet):
         where_filetype = self.wheres.get('filetype')
         where_xpaths = self.wheres.get('xpath', [])
 
-        for data_path, metadata_path in paths:
-            dataset = Dataset(data_path, metadata_path)
-            if where_filetype is not None and \
-                    dataset.filetype != where_filetype:
-                continue
-            if where_xpaths != []:
-                if not dataset.validate_xml():
+        with QueryTracker(self, 'iterate') as tracker:
+            for data_path, metadata_path in paths:
+                dataset = Dataset(data_path, metadata_path)
+                instrument.emit('datasets_yielded')
+                if where_filetype is not None and \
+                        dataset.filetype != where_filetype:
                     continue
-                for where_xpath in where_xpaths:
-                    if dataset.etree.xpath(where_xpath) == []:
-                        break
-                else:
-                    yield dataset
-                continue
-            yield dataset
+                if where_xpaths != []:
+                    if not dataset.validate_xml():
+                        continue
+                    for where_xpath in where_xpaths:
+                        if dataset.etree.xpath(where_xpath) == []:
+                            break
+                    else:
+                        tracker.results += 1
+                        tracker.pause()
+                        yield dataset
+                        tracker.resume()
+                    continue
+                tracker.results += 1
+                tracker.pause()
+                yield dataset
+                tracker.resume()
+
+    def explain(self):
+        """Return a ``QueryPlan``, describing how this query will
+        be run (without running it).
+
+        Datasets only need to be parsed if there are ``xpath`` filters.
+        """
+        where_xpaths = self.wheres.get('xpath', [])
+        queries = {'*': ' and '.join(where_xpaths)} if where_xpaths else {}
+        plan = QueryPlan(self.__class__.__name__, self.wheres, queries)
+        candidates = deepcopy(self)
+        candidates.wheres.pop('xpath', None)
+        for dataset in candidates:
+            try:
+                size = getsize(dataset.data_path)
+            except (OSError, TypeError):
+                size = 0
+            root, attributes = \
+                dataset._read_header()  # pylint: disable=protected-access
+            version = attributes.get('version', '1.01') if root else None
+            plan.add_dataset(dataset.name, size, version=version,
+                             query=queries.get('*'),
+                             parse=bool(where_xpaths))
+        return plan
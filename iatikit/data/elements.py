@@ -0,0 +1,594 @@
+from copy import copy, deepcopy
+from functools import partial
+from itertools import groupby
+from os.path import basename, dirname, getsize
+
+from ..index.bitmaps import from_bitmap, to_bitmap
+from ..index.compiled import CompiledValues, predicates
+from ..standard.schema import get_schema
+from ..utils import instrument
+from ..utils.abstract import GenericSet, expand_code_sets, make_xpath
+from ..utils.exceptions import FilterError, SchemaError
+from ..utils.explain import QueryPlan, QueryTracker
+from ..utils.filters import Q
+from ..utils.prefetch import prefetch
+from ..utils.querybuilder import XPathQueryBuilder
+from ..utils.records import RecordReader
+
+
+def _file_size(dataset):
+    try:
+        return getsize(dataset.data_path)
+    except (OSError, TypeError):
+        return 0
+
+
+class ElementSet(GenericSet):
+    """Base class for groupings of elements (activities or
+    organisations) found across a set of datasets.
+    """
+
+    _filetype = None
+    _element = None
+    _prefetch = None
+    _detached = None
+    # Filters that can be checked against dataset Bloom filters,
+    # mapped to the Bloom filter key.
+    _bloom_keys = {}
+    # Filters on the dataset an element is in, rather than the element
+    _dataset_filters = ['version', 'publisher', 'filetype']
+
+    def __init__(self, datasets, *conditions, **kwargs):
+        self.conditions = list(conditions)
+        super(ElementSet, self).__init__()
+        self.wheres = {}
+        for key, values in kwargs.items():
+            if key in self._dataset_filters:
+                self.conditions.extend(Q(**{key: value}) for value in values)
+            else:
+                self.wheres[key] = values
+        self.datasets = datasets
+
+    def where(self, *conditions, **kwargs):
+        """Return a new set, with the filters provided in ``**kwargs``,
+        and any ``Q`` combinations of filters in ``*conditions``.
+        """
+        conditions = list(conditions)
+        for key in list(kwargs):
+            if key in self._dataset_filters:
+                conditions.append(Q(**{key: kwargs.pop(key)}))
+        for condition in conditions:
+            if not isinstance(condition, Q):
+                raise FilterError('{!r} is not a Q object'.format(condition))
+            for key in condition.filters():
+                if key not in self._dataset_filters and \
+                        key.split('__')[0] not in self._multi_filters:
+                    raise FilterError('Unknown filter: {}'.format(key))
+        out = super(ElementSet, self).where(**kwargs)
+        out.conditions = out.conditions + conditions
+        return out
+
+    @property
+    def _filtered(self):
+        return bool(self.wheres or self.conditions)
+
+    def prefetch(self, datasets=4, max_bytes=256 * 1024 * 1024,
+                 slots=None):
+        """Return a new set, that parses up to ``datasets`` datasets
+        in background threads, ahead of the one being iterated over.
+
+        Prefetching stops while the total size of the parsed (but not
+        yet iterated over) dataset files would exceed ``max_bytes``.
+        Pass ``datasets=0`` to turn prefetching off.
+
+        If ``slots`` (a semaphore) is given, it's held while each
+        dataset is parsed, so sets sharing it parse no more datasets
+        at once than it allows.
+        """
+        out = copy(self)
+        out._prefetch = {'ahead': datasets, 'max_bytes': max_bytes,
+                         'slots': slots} if datasets else None
+        return out
+
+    def detached(self, max_trees=2):
+        """Return a new set, that yields items holding a standalone
+        copy of their XML, rather than a part of the dataset's tree.
+
+        Each dataset's parsed tree is released once iteration moves
+        past it, so items can be kept around without keeping whole
+        datasets in memory. At most ``max_trees`` parsed trees are
+        alive at once (including any being prefetched).
+        """
+        out = copy(self)
+        out._detached = max(1, max_trees)
+        return out
+
+    def _prefetch_options(self):
+        """Return the options to pass to ``prefetch``, or ``None``
+        if datasets shouldn't be prefetched.
+        """
+        if not self._prefetch:
+            return None
+        options = dict(self._prefetch)
+        if self._detached:
+            # one tree is the dataset currently being iterated over
+            options['ahead'] = min(options['ahead'], self._detached - 1)
+        return options if options['ahead'] > 0 else None
+
+    def _query(self, schema=None, dataset=None):
+        if schema is None:
+            schema = get_schema(self._filetype, '2.03')
+        return XPathQueryBuilder(
+            schema,
+            prefix=self._element,
+        ).where(*self._condition_xpaths(schema, dataset), **self.wheres)
+
+    def _compile(self, schema, count=False, conditions=()):
+        """Return a compiled XPath query for ``schema``."""
+        with instrument.timer('xpath_compile', version=schema.version):
+            query = XPathQueryBuilder(
+                schema,
+                prefix=self._element,
+                count=count,
+            ).where(*conditions, **self.wheres)
+            return make_xpath(query)
+
+    def _query_for(self, dataset, schema, queries, count=False):
+        """Return the compiled XPath query to run against ``dataset``.
+        Queries are cached in ``queries``.
+        """
+        conditions = tuple(self._condition_xpaths(schema, dataset))
+        key = (schema, conditions, count)
+        if key not in queries:
+            queries[key] = self._compile(schema, count, conditions)
+        return queries[key]
+
+    def _dataset_value(self, dataset, key):
+        """Return the value of a dataset filter for ``dataset``."""
+        if key == 'version':
+            # pylint: disable=protected-access
+            root, attributes = dataset._read_header()
+            if root is None:
+                return None
+            return attributes.get('version', '1.01')
+        elif key == 'filetype':
+            return dataset.filetype
+        index = dataset.index
+        if index is not None and index.publisher:
+            return index.publisher
+        if dataset.data_path is None:
+            return None
+        return basename(dirname(dataset.data_path))
+
+    def _condition_xpaths(self, schema, dataset=None):
+        """Return this set's ``Q`` conditions as XPath predicates.
+        Dataset filters are checked against ``dataset``, if given.
+        """
+        def predicate(key, value):
+            if key in self._dataset_filters:
+                if dataset is None:
+                    return True
+                return self._dataset_value(dataset, key) == str(value)
+            field, _, operation = key.partition('__')
+            return getattr(schema, field)().where(operation or 'eq', value)
+
+        xpaths = []
+        for condition in self.conditions:
+            xpath = condition.xpath(predicate)
+            if xpath is False:
+                xpath = 'false()'
+            if xpath is not True:
+                xpaths.append(xpath)
+        return xpaths
+
+    def _condition_bounds(self, dataset):
+        """Return the ``(lower, upper)`` bounds of the bitmap of elements
+        in ``dataset`` that match this set's ``Q`` conditions.
+
+        Dataset filters are answered from the dataset, and other filters
+        from its indexes (where they can be). The bounds are the same if
+        the conditions are fully answered.
+        """
+        index = dataset.index
+        if index is not None and index.valid:
+            everything = (1 << index.count) - 1
+            indexes = [found_in for found_in in (
+                index.bitmaps, index.dates, index.sectors)
+                if found_in is not None]
+        else:
+            # every bit is set in -1
+            everything = -1
+            indexes = []
+
+        def find(key, value):
+            if key in self._dataset_filters:
+                matches = self._dataset_value(dataset, key) == str(value)
+                return everything if matches else 0
+            field, _, operation = key.partition('__')
+            for found_in in indexes:
+                if hasattr(found_in, 'bitmap'):
+                    bitmap = found_in.bitmap(field, operation or 'eq', value)
+                    if bitmap is not None:
+                        return bitmap
+                    continue
+                found = found_in.find(field, operation or 'eq', value)
+                if found is not None:
+                    return to_bitmap(found)
+            return None
+
+        lower, upper = everything, everything
+        for condition in self.conditions:
+            condition_lower, condition_upper = condition.bounds(
+                find, everything)
+            lower &= condition_lower
+            upper &= condition_upper
+        return lower, upper
+
+    def _may_match(self, dataset):
+        """Check whether ``dataset`` might include items that match
+        this query, using its index. Identifier filters are checked
+        against its Bloom filter, and date and sector filters against
+        its date and sector indexes.
+        """
+        if self.conditions:
+            _, upper = self._condition_bounds(dataset)
+            if not upper:
+                instrument.emit('index_skips', dataset=dataset.name)
+                return False
+        index = dataset.index if self.wheres else None
+        if index is None:
+            return True
+        for filter_name, key in self._bloom_keys.items():
+            for value in self.wheres.get(filter_name, []):
+                if not index.may_contain(key, value):
+                    instrument.emit('bloom_skips', dataset=dataset.name)
+                    return False
+        ordinals, _ = self._index_matches(dataset)
+        if ordinals is not None and not ordinals:
+            instrument.emit('index_skips', dataset=dataset.name)
+            return False
+        return True
+
+    def _index_matches(self, dataset):
+        """Return the ordinals of the elements in ``dataset`` that
+        match the filters its indexes can answer, and whether those are
+        all of this query's filters. The ordinals are ``None`` if the
+        indexes can't answer any of them.
+
+        ``Q`` conditions are resolved as bitmaps, before the
+        other filters are checked.
+        """
+        index = dataset.index
+        if index is None or not self._filtered:
+            return None, False
+        ordinals = None
+        complete = True
+        if self.conditions:
+            lower, upper = self._condition_bounds(dataset)
+            if lower == upper:
+                ordinals = set(from_bitmap(lower))
+            else:
+                complete = False
+        indexes = [found_in for found_in in (
+            index.bitmaps, index.dates, index.sectors)
+            if found_in is not None]
+        if not indexes:
+            return ordinals, complete and not self.wheres
+        for key, values in self.wheres.items():
+            field, _, operation = key.partition('__')
+            for value in values:
+                for found_in in indexes:
+                    found = found_in.find(field, operation or 'eq', value)
+                    if found is not None:
+                        break
+                if found is None:
+                    complete = False
+                elif ordinals is None:
+                    ordinals = found
+                else:
+                    ordinals &= found
+        return ordinals, complete
+
+    def _indexed(self, dataset):
+        """Return the sorted ordinals of the elements in ``dataset``
+        that match this query, if its index can answer the query on
+        its own. Otherwise, return ``None``.
+        """
+        ordinals, complete = self._index_matches(dataset)
+        if ordinals is None or not complete or \
+                dataset.index.offsets is None:
+            return None
+        return sorted(ordinals)
+
+    def _compiled(self, dataset, cache, schema=None):
+        """Return ``(compiled dataset, predicates)`` if this query can
+        be run against the compiled form of ``dataset``, or ``None`` if
+        its XML needs to be queried. Predicates are cached in ``cache``.
+        """
+        compiled = dataset.compiled
+        if compiled is None or self.conditions:
+            return None
+        if schema is None:
+            try:
+                schema = get_schema(self._filetype, compiled.version)
+            except SchemaError:
+                return None
+        key = ('compiled', schema)
+        if key not in cache:
+            cache[key] = predicates(schema, self.wheres)
+        if cache[key] is None:
+            return None
+        return compiled, cache[key]
+
+    def _datasets(self, count=False, cache=None):
+        """Yield each dataset this set covers, along with its schema.
+
+        Datasets of the wrong filetype, with invalid XML or an
+        unknown version are skipped.
+
+        Datasets that can be queried using their compiled form (or, if
+        ``count`` is ``True``, counted using their index) aren't parsed.
+        """
+        if cache is None:
+            cache = {}
+
+        def load(dataset):
+            # pylint: disable=protected-access
+            fresh = dataset._etree is None
+            valid = dataset.validate_xml()
+            if valid and not (count and not self._filtered and
+                              dataset.index is not None) and \
+                    self._compiled(dataset, cache) is None and \
+                    self._indexed(dataset) is None:
+                dataset.etree  # pylint: disable=pointless-statement
+            return valid, fresh
+
+        datasets = (dataset for dataset in self.datasets
+                    if dataset.filetype == self._filetype and
+                    self._may_match(dataset))
+        options = self._prefetch_options()
+        if options:
+            loaded = prefetch(datasets, load, size=_file_size, **options)
+        else:
+            loaded = ((dataset, load(dataset)) for dataset in datasets)
+        for dataset, (valid, fresh) in loaded:
+            if not valid:
+                continue
+            try:
+                schema = get_schema(dataset.filetype, dataset.version)
+            except SchemaError:
+                continue
+            try:
+                yield dataset, schema
+            finally:
+                if self._detached and fresh:
+                    # release the tree we parsed
+                    dataset._etree = None  # pylint: disable=protected-access
+
+    def _select(self, dataset, schema, queries):
+        """Run this query against ``dataset``, and return the matching
+        elements. Compiled queries are cached in ``queries``.
+        """
+        query = self._query_for(dataset, schema, queries)
+        with instrument.timer('xpath_eval', dataset=dataset.name):
+            return query(dataset.etree)
+
+    def _load_element(self, dataset, ordinal):
+        # pylint: disable=protected-access
+        parsed = dataset._etree is not None
+        element = dataset._read_element(ordinal, self._element)
+        if self._detached and element.getparent() is not None:
+            element = deepcopy(element)
+            if not parsed:
+                # the whole dataset was parsed just for this item
+                dataset._etree = None
+        return element
+
+    def _items(self, dataset, schema, cache):
+        """Yield the items in ``dataset`` that match this query.
+
+        If possible, the query is answered by the dataset's index, or run
+        against its compiled form. Each item's XML is then only parsed
+        if it's needed, and field values are read from the compiled
+        dataset (if there is one).
+        """
+        ordinals = self._indexed(dataset)
+        if ordinals is None:
+            compiled = self._compiled(dataset, cache, schema)
+            if compiled is not None:
+                compiled, compiled_predicates = compiled
+                with instrument.timer('compiled_eval', dataset=dataset.name):
+                    ordinals = compiled.matching(compiled_predicates)
+        if ordinals is None:
+            for tree in self._select(dataset, schema, cache):
+                if self._detached:
+                    tree = deepcopy(tree)
+                yield self._instance_class(tree, dataset, schema)
+            return
+        compiled = dataset.compiled
+        for ordinal in ordinals:
+            item = self._instance_class(None, dataset, schema)
+            # pylint: disable=protected-access
+            item._load_etree = partial(self._load_element, dataset, ordinal)
+            if compiled is not None:
+                item._values = CompiledValues(compiled, ordinal, schema)
+            yield item
+
+    def records(self, fields, as_dict=False):
+        """Yield a tuple of the values of ``fields`` (or a dictionary,
+        if ``as_dict`` is ``True``) for each item in this set.
+
+        Fields are properties, e.g. ``iati_identifier`` or ``title``.
+        Schema fields are read in a single pass over each element,
+        using the schema for its IATI version.
+        """
+        fields = list(fields)
+        for _, values in self._records(fields):
+            if as_dict:
+                yield dict(zip(fields, values))
+            else:
+                yield values
+
+    def _records(self, fields):
+        """Yield each item in this set, along with a tuple of
+        the values of ``fields``.
+        """
+        readers = {}
+        for item in self:
+            # pylint: disable=protected-access
+            values = item._values
+            # fields held in a compiled dataset don't need to be read
+            loadable = getattr(values, 'loadable', None)
+            key = (item.schema, tuple(
+                field for field in fields
+                if loadable is None or not loadable(field)))
+            if key not in readers:
+                readers[key] = RecordReader(*key)
+            if readers[key].fields:
+                values.update(readers[key].read(item.etree))
+            yield item, tuple(getattr(item, field) for field in fields)
+
+    def export(self, path, fields, format='csv', compress=None,
+               processes=None):  # pylint: disable=redefined-builtin
+        """Write ``fields`` for each item in this set to a file at
+        ``path``, and return the number of rows written.
+
+        ``format`` is ``"csv"`` or ``"jsonl"``. The output is gzipped
+        if ``compress="gzip"``, or if ``path`` ends with ``.gz``.
+
+        Pass ``processes`` to split the work by dataset across a pool
+        of processes. Rows are still written in dataset order.
+        """
+        from ..utils.export import export
+        return export(self, path, fields, format=format,
+                      compress=compress, processes=processes)
+
+    def write_xml(self, path):
+        """Write the items in this set to an IATI XML file at ``path``,
+        and return a dictionary of the number written to each file.
+
+        Items are streamed to disk, so memory use stays flat. Each file
+        can only have one IATI version, so if this set covers several,
+        include ``{version}`` in ``path`` to write a file per version.
+        """
+        from ..utils.export import write_xml
+        return write_xml(self, path)
+
+    def to_columns(self, fields):
+        """Return an ordered dictionary of NumPy arrays, one per field.
+        Requires numpy.
+
+        Dates are ``datetime64[D]`` arrays (with ``NaT`` for missing
+        values) and ``humanitarian`` is a boolean array. Identifiers and
+        versions are dictionary-encoded, as ``Categorical(codes,
+        categories)``. Titles, descriptions and sectors are
+        ``Ragged(offsets, values)``.
+
+        Columns are built one dataset at a time.
+        """
+        try:
+            from ..utils.columns import build_columns
+        except ImportError:
+            raise ImportError(
+                'to_columns() requires numpy. Install it with: '
+                'pip install iatikit[numpy]')
+        fields = list(fields)
+        chunks = (
+            [values for _, values in rows]
+            for _, rows in groupby(self._records(fields),
+                                   key=lambda row: row[0].dataset))
+        return build_columns(chunks, fields)
+
+    def aiter(self, limit=4, executor=None):
+        """Return an asynchronous iterator over this set, for use
+        with ``async for``. Python 3 only.
+
+        Datasets are parsed and queried in ``executor`` (by default, a
+        shared thread pool), with up to ``limit`` datasets parsed ahead.
+        """
+        from ..utils.aio import ElementIterator
+        return ElementIterator(self, limit=limit, executor=executor)
+
+    def acount(self, executor=None):
+        """Count the items in this set in ``executor``, and return
+        an awaitable. Python 3 only.
+        """
+        from ..utils.aio import run
+        return run(len, self, executor=executor)
+
+    def explain(self):
+        """Return a ``QueryPlan``, describing how this query will
+        be run (without running it).
+
+        The plan includes the compiled XPath query for each IATI
+        version, and the datasets the query will touch.
+        """
+        filters = dict(self.wheres)
+        if self.conditions:
+            filters['conditions'] = self.conditions
+        plan = QueryPlan(self.__class__.__name__, filters)
+        queries = {}
+        for dataset in self.datasets:
+            if dataset.filetype != self._filetype or \
+                    not self._may_match(dataset):
+                continue
+            root, attributes = \
+                dataset._read_header()  # pylint: disable=protected-access
+            if root is None:
+                continue
+            version = attributes.get('version', '1.01')
+            try:
+                schema = get_schema(self._filetype, version)
+            except SchemaError:
+                continue
+            if version not in queries:
+                queries[version] = self._query(schema, dataset)
+                # list the codes, rather than naming the set they're in
+                plan.queries[version] = expand_code_sets(queries[version])
+            index = dataset.index
+            elements = index.count if index is not None else None
+            plan.add_dataset(dataset.name, _file_size(dataset),
+                             version=version,
+                             elements=elements,
+                             query=queries[version],
+                             parse=self._indexed(dataset) is None,
+                             compiled=self._compiled(
+                                 dataset, {}, schema) is not None)
+        return plan
+
+    def __len__(self):
+        total = 0
+        queries = {}
+        with QueryTracker(self, 'count') as tracker:
+            for dataset, schema in self._datasets(count=True,
+                                                  cache=queries):
+                if not self._filtered and dataset.index is not None:
+                    total += dataset.index.count
+                    continue
+                ordinals = self._indexed(dataset)
+                if ordinals is not None:
+                    total += len(ordinals)
+                    continue
+                compiled = self._compiled(dataset, queries, schema)
+                if compiled is not None:
+                    compiled, compiled_predicates = compiled
+                    with instrument.timer('compiled_eval',
+                                          dataset=dataset.name):
+                        total += len(compiled.matching(compiled_predicates))
+                    continue
+                query = self._query_for(dataset, schema, queries, count=True)
+                with instrument.timer('xpath_eval', dataset=dataset.name):
+                    total += int(query(dataset.etree))
+            tracker.results = total
+        return total
+
+    def __iter__(self):
+        queries = {}
+        with QueryTracker(self, 'iterate') as tracker:
+            for dataset, schema in self._datasets(cache=queries):
+                for item in self._items(dataset, schema, queries):
+                    instrument.emit('objects_yielded')
+                    tracker.results += 1
+                    tracker.pause()
+                    yield item
+                    tracker.resume()
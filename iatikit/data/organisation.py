@@ -6,21 +6,36 @@ except ImportError:
 
 from lxml import etree as ET
 
-from ..standard.schema import get_schema
 from ..standard.xsd_schema import XSDSchema
-from ..utils.abstract import GenericSet
-from ..utils.exceptions import SchemaError
-from ..utils.querybuilder import XPathQueryBuilder
+from .elements import ElementSet
 
 
 class Organisation(object):
     """Class representing an IATI organisation."""
 
     def __init__(self, etree, dataset=None, schema=None):
-        self.etree = etree
+        self._etree = etree
+        self._load_etree = None
         self.dataset = dataset
         self._schema = schema
         self.version = self.schema.version
+        self._values = {}
+
+    @property
+    def etree(self):
+        """Return the XML of this organisation, as an lxml element.
+
+        Items read from a compiled dataset only parse
+        their XML when it's first needed.
+        """
+        if self._etree is None and self._load_etree is not None:
+            self._etree = self._load_etree()
+            self._load_etree = None
+        return self._etree
+
+    @etree.setter
+    def etree(self, etree):
+        self._etree = etree
 
     def __repr__(self):
         id_ = self.org_identifier
@@ -40,6 +55,18 @@ class Organisation(object):
     def schema(self):
         return self._schema
 
+    def _value(self, field):
+        """Extract ``field`` from the organisation XML, using the schema.
+
+        Values are memoized, so each field is only extracted once.
+        """
+        try:
+            return self._values[field]
+        except KeyError:
+            value = getattr(self.schema, field)().run(self.etree)
+            self._values[field] = value
+            return value
+
     @property
     def xml(self):
         """Return the raw XML of this organisation, as a byte-string."""
@@ -50,7 +77,7 @@ class Organisation(object):
         """Return the org-identifier for this organisation,
         or ``None`` if it isn't provided.
         """
-        id_ = self.schema.org_identifier().run(self.etree)
+        id_ = self._value('org_identifier')
         if id_:
             return id_[0].strip()
         return None
@@ -68,7 +95,7 @@ class Organisation(object):
         return self.org_identifier
 
 
-class OrganisationSet(GenericSet):
+class OrganisationSet(ElementSet):
     """Class representing a grouping of ``Organisation`` objects.
 
     Objects in this grouping can be filtered and iterated over.
@@ -80,53 +107,10 @@ class OrganisationSet(GenericSet):
     _multi_filters = [
         'id', 'org_identifier', 'xpath',
     ]
+    _bloom_keys = {
+        'id': 'id',
+        'org_identifier': 'id',
+    }
     _instance_class = Organisation
     _filetype = 'organisation'
     _element = '/iati-organisations/iati-organisation'
-
-    def __init__(self, datasets, **kwargs):
-        super(OrganisationSet, self).__init__()
-        self.wheres = kwargs
-        self.datasets = datasets
-
-    def __len__(self):
-        total = 0
-        for dataset in self.datasets:
-            if dataset.filetype != self._filetype:
-                continue
-            if not dataset.validate_xml():
-                continue
-            try:
-                schema = get_schema(dataset.filetype, dataset.version)
-            except SchemaError:
-                continue
-            prefix = self._element
-            query = XPathQueryBuilder(
-                schema,
-                prefix=prefix,
-                count=True
-            ).where(**self.wheres)
-            total += int(dataset.etree.xpath(query))
-        return total
-
-    def _query(self, schema=None):
-        if schema is None:
-            schema = get_schema(self._filetype, '2.03')
-        return XPathQueryBuilder(
-            schema,
-            prefix=self._element,
-        ).where(**self.wheres)
-
-    def __iter__(self):
-        for dataset in self.datasets:
-            if dataset.filetype != self._filetype:
-                continue
-            if not dataset.validate_xml():
-                continue
-            try:
-                schema = get_schema(dataset.filetype, dataset.version)
-            except SchemaError:
-                continue
-            organisation_etrees = dataset.etree.xpath(self._query(schema))
-            for tree in organisation_etrees:
-                yield self._instance_class(tree, dataset, schema)
@@ -1,67 +1,143 @@
+import threading
+
 from ..standard.codelist import CodelistSet, CodelistItem
+from ..utils.config import CONFIG
 from ..utils.exceptions import UnknownSectorVocabError, \
                                UnknownSectorCodeError, InvalidSectorCodeError
 
 
+SECTOR_CACHE_SIZE = 16384
+
+# (standard path, code, vocabulary) -> (code, vocabulary), or the
+# error raised when looking them up
+_SECTORS = {}
+_LOCK = threading.Lock()
+
+
+def clear_sector_cache():
+    """Forget every code and vocabulary that sectors have looked up,
+    e.g. after the codelists are updated.
+    """
+    with _LOCK:
+        _SECTORS.clear()
+
+
+def _lookup(code, vocabulary):
+    """Look up a sector code and vocabulary in the codelists,
+    returning a ``(code, vocabulary)`` tuple.
+    """
+    codelists = CodelistSet()
+    vocab_lookup = {
+        '1': 'Sector',
+        '2': 'SectorCategory',
+    }
+
+    def get_vocabulary(vocabulary_code):
+        old_vocab_item = codelists.get(
+            'Vocabulary').get(vocabulary_code)
+
+        if old_vocab_item is not None:
+            new_vocab_code = {
+                'ADT': '6', 'COFOG': '3',
+                'DAC': '1', 'DAC-3': '2',
+                'ISO': None, 'NACE': '4',
+                'NTEE': '5', 'RO': '99',
+                'RO2': '98', 'WB': None,
+            }.get(old_vocab_item.code)
+            if new_vocab_code:
+                vocab_item = codelists.get(
+                    'SectorVocabulary').get(new_vocab_code)
+        else:
+            vocab_item = codelists.get(
+                'SectorVocabulary').get(vocabulary_code)
+            if vocab_item is None:
+                raise UnknownSectorVocabError()
+        return vocab_item
+
+    if isinstance(code, CodelistItem):
+        if code.codelist.slug == 'Sector':
+            vocabulary = codelists.get(
+                'SectorVocabulary').get('1')
+        elif code.codelist.slug == 'SectorCategory':
+            vocabulary = codelists.get(
+                'SectorVocabulary').get('2')
+        else:
+            raise InvalidSectorCodeError(
+                'Not a sector code: {}'.format(code))
+        return code, vocabulary
+    elif vocabulary:
+        vocabulary = get_vocabulary(vocabulary)
+
+        vocab_codelist_name = vocab_lookup.get(vocabulary.code)
+        if vocab_codelist_name:
+            code_item = codelists.get(vocab_codelist_name).get(code)
+            if code_item is None:
+                raise UnknownSectorCodeError()
+            return code_item, vocabulary
+        return str(code), vocabulary
+    return str(code), None
+
+
+def _cached_lookup(code, vocabulary, standard_path=None):
+    """Like ``_lookup``, but each distinct code and vocabulary is only
+    looked up once. Codelist items are shared between sectors.
+    """
+    if standard_path is None:
+        standard_path = CONFIG.get('paths', 'standard', raw=True)
+    vocabulary = str(vocabulary) if vocabulary else None
+    key = (standard_path, str(code), vocabulary)
+    try:
+        result = _SECTORS[key]
+    except KeyError:
+        try:
+            result = _lookup(code, vocabulary)
+        except (UnknownSectorVocabError, UnknownSectorCodeError) as error:
+            result = error
+        with _LOCK:
+            if len(_SECTORS) >= SECTOR_CACHE_SIZE:
+                _SECTORS.clear()
+            _SECTORS[key] = result
+    if isinstance(result, Exception):
+        raise result.__class__(*result.args)
+    return result
+
+
 class Sector(object):
+    """Class representing a sector (a code and vocabulary), and the
+    percentage of an activity it accounts for.
+
+    Codes and vocabularies are looked up in the codelists once, and
+    then shared by every sector with the same code and vocabulary.
+    """
+
+    __slots__ = ('code', 'vocabulary', 'percentage')
+
     def __init__(self, code, vocabulary=None, percentage=None):
-        codelists = CodelistSet()
-        vocab_lookup = {
-            '1': 'Sector',
-            '2': 'SectorCategory',
-        }
-
-        def get_vocabulary(vocabulary_code):
-            old_vocab_item = codelists.get(
-                'Vocabulary').get(vocabulary_code)
-
-            if old_vocab_item is not None:
-                new_vocab_code = {
-                    'ADT': '6', 'COFOG': '3',
-                    'DAC': '1', 'DAC-3': '2',
-                    'ISO': None, 'NACE': '4',
-                    'NTEE': '5', 'RO': '99',
-                    'RO2': '98', 'WB': None,
-                }.get(old_vocab_item.code)
-                if new_vocab_code:
-                    vocab_item = codelists.get(
-                        'SectorVocabulary').get(new_vocab_code)
-            else:
-                vocab_item = codelists.get(
-                    'SectorVocabulary').get(vocabulary_code)
-                if vocab_item is None:
-                    raise UnknownSectorVocabError()
-            return vocab_item
+        if isinstance(code, CodelistItem):
+            self.code, self.vocabulary = _lookup(code, vocabulary)
+        else:
+            self.code, self.vocabulary = _cached_lookup(code, vocabulary)
 
         if percentage is not None:
             self.percentage = float(percentage)
         else:
             self.percentage = None
 
-        if isinstance(code, CodelistItem):
-            if code.codelist.slug == 'Sector':
-                self.vocabulary = codelists.get(
-                    'SectorVocabulary').get('1')
-            elif code.codelist.slug == 'SectorCategory':
-                self.vocabulary = codelists.get(
-                    'SectorVocabulary').get('2')
-            else:
-                raise InvalidSectorCodeError(
-                    'Not a sector code: {}'.format(code))
-            self.code = code
-        elif vocabulary:
-            self.vocabulary = get_vocabulary(vocabulary)
-
-            vocab_codelist_name = vocab_lookup.get(self.vocabulary.code)
-            if vocab_codelist_name:
-                self.code = codelists.get(vocab_codelist_name).get(code)
-                if self.code is None:
-                    raise UnknownSectorCodeError()
-            else:
-                self.code = str(code)
-        else:
-            self.code = str(code)
-            self.vocabulary = None
+    @classmethod
+    def batch(cls, sectors):
+        """Return a list of sectors, from an iterable of
+        ``(code, vocabulary, percentage)`` tuples.
+        """
+        standard_path = CONFIG.get('paths', 'standard', raw=True)
+        out = []
+        for code, vocabulary, percentage in sectors:
+            sector = cls.__new__(cls)
+            sector.code, sector.vocabulary = _cached_lookup(
+                code, vocabulary, standard_path)
+            sector.percentage = float(percentage) \
+                if percentage is not None else None
+            out.append(sector)
+        return out
 
     def __repr__(self):
         if isinstance(self.code, CodelistItem):
@@ -0,0 +1,96 @@
+"""Bitmap indexes over the activities in a dataset.
+
+Bitmaps are python ints, where bit ``n`` is set if the activity at
+ordinal ``n`` is in the set. They're stored as hex strings.
+"""
+import binascii
+
+from ..utils.abstract import compiled_xpath
+
+
+# Boolean fields with a bitmap, for when the filter is ``True``
+# and for when it's ``False``
+BITMAP_FIELDS = ('humanitarian',)
+
+
+def to_bitmap(ordinals):
+    """Return a bitmap with the bit for each of ``ordinals`` set."""
+    ordinals = list(ordinals)
+    if not ordinals:
+        return 0
+    bits = bytearray(max(ordinals) // 8 + 1)
+    for ordinal in ordinals:
+        bits[ordinal >> 3] |= 1 << (ordinal & 7)
+    # most significant byte first, for int()
+    bits.reverse()
+    return int(binascii.hexlify(bytes(bits)), 16)
+
+
+def from_bitmap(bitmap):
+    """Return the sorted list of ordinals set in ``bitmap``."""
+    ordinals = []
+    if not bitmap:
+        return ordinals
+    hex_bitmap = '{:x}'.format(bitmap)
+    if len(hex_bitmap) % 2:
+        hex_bitmap = '0' + hex_bitmap
+    data = bytearray(binascii.unhexlify(hex_bitmap))
+    # least significant byte first
+    data.reverse()
+    for idx, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            ordinals.append((idx << 3) + low.bit_length() - 1)
+            byte ^= low
+    return ordinals
+
+
+def extract_flags(schema, element):
+    """Return whether ``element`` matches each boolean filter in
+    ``BITMAP_FIELDS`` (with ``True``, and with ``False``), using the
+    same XPath as the filter.
+    """
+    flags = {}
+    for field in BITMAP_FIELDS:
+        type_ = getattr(schema, field)()
+        flags[field] = tuple(
+            bool(compiled_xpath(type_.where('eq', value))(element))
+            for value in (True, False))
+    return flags
+
+
+class BitmapIndex(object):
+    """Bitmap indexes over the boolean fields (e.g. ``humanitarian``)
+    of the activities in a dataset.
+    """
+
+    def __init__(self, bitmaps, count):
+        # field -> (hex bitmap when True, hex bitmap when False)
+        self._bitmaps = {
+            field: tuple(int(bitmap, 16) for bitmap in bitmaps[field])
+            for field in bitmaps}
+        self.count = count
+
+    @property
+    def all(self):
+        """Return a bitmap with every activity set."""
+        return (1 << self.count) - 1
+
+    def bitmap(self, field, operation, value):
+        """Return the bitmap of activities matching a filter, or
+        ``None`` if this index can't answer it.
+        """
+        if field not in self._bitmaps or operation != 'eq' or \
+                value is not bool(value):
+            return None
+        when_true, when_false = self._bitmaps[field]
+        return when_true if value else when_false
+
+    def find(self, field, operation, value):
+        """Return the set of ordinals matching a filter, or ``None``
+        if it isn't a filter this index can answer.
+        """
+        bitmap = self.bitmap(field, operation, value)
+        if bitmap is None:
+            return None
+        return set(from_bitmap(bitmap))
@@ -0,0 +1,116 @@
+import hashlib
+import math
+from os import makedirs
+from os.path import dirname, exists
+import struct
+
+from ..utils.config import CONFIG
+
+
+# (version 1 filters were hashed with BLAKE2, so can't be read)
+_MAGIC = b'IATIBLM2'
+_HEADER = struct.Struct('<QI')
+DEFAULT_ERROR_RATE = 0.01
+
+
+def _next_prime(number):
+    """Return the smallest prime number >= ``number``."""
+    number = max(number, 2)
+    while any(number % divisor == 0
+              for divisor in range(2, int(number ** 0.5) + 1)):
+        number += 1
+    return number
+
+
+def bloom_error_rate():
+    """Return the target false positive rate for dataset Bloom
+    filters, from the ``[index]`` section of the config.
+    """
+    error_rate = CONFIG.get('index', 'bloom_error_rate', fallback=None)
+    if not error_rate:
+        return DEFAULT_ERROR_RATE
+    return float(error_rate)
+
+
+class BloomFilter(object):
+    """A Bloom filter, for checking whether a string might be in a set.
+
+    False positives are possible (at roughly the rate the filter was
+    sized for), but false negatives aren't: if a string isn't in the
+    filter, it certainly wasn't added.
+    """
+
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8) if bits is None \
+            else bytearray(bits)
+
+    def __repr__(self):
+        return '<{} ({} bits, {} hashes)>'.format(
+            self.__class__.__name__, self.size, self.hashes)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=DEFAULT_ERROR_RATE):
+        """Return an empty filter, sized to hold ``capacity`` strings
+        with a false positive rate of ``error_rate``.
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError(
+                'Bloom filter error rate must be between 0 and 1')
+        capacity = max(capacity, 1)
+        # very small filters are padded out, since their false
+        # positive rate is far from the theoretical one
+        size = max(64, int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)))
+        hashes = max(1, int(round(-math.log(error_rate, 2))))
+        # with a prime number of bits, every step between positions
+        # is coprime with the size, so positions never repeat
+        return cls(_next_prime(size), hashes)
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode('utf-8')).digest()
+        first, second = struct.unpack('<QQ', digest[:16])
+        step = second % (self.size - 1) + 1
+        return ((first + idx * step) % self.size
+                for idx in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+    def save(self, path):
+        if not exists(dirname(path)):
+            try:
+                makedirs(dirname(path))
+            except OSError:
+                # another worker got there first
+                if not exists(dirname(path)):
+                    raise
+        with open(path, 'wb') as handler:
+            handler.write(_MAGIC)
+            handler.write(_HEADER.pack(self.size, self.hashes))
+            handler.write(self.bits)
+
+    @classmethod
+    def load(cls, path):
+        """Load a filter saved at ``path``. Returns ``None`` if the
+        file is missing or isn't a Bloom filter.
+        """
+        try:
+            with open(path, 'rb') as handler:
+                data = handler.read()
+        except (IOError, OSError):
+            return None
+        start = len(_MAGIC) + _HEADER.size
+        if data[:len(_MAGIC)] != _MAGIC or len(data) < start:
+            return None
+        size, hashes = _HEADER.unpack(data[len(_MAGIC):start])
+        if len(data) - start != (size + 7) // 8:
+            return None
+        return cls(size, hashes, data[start:])
@@ -0,0 +1,585 @@
+from glob import glob
+import hashlib
+import json
+import logging
+from os import makedirs, stat
+from os.path import basename, dirname, exists, join, splitext
+import re
+
+from lxml import etree as ET
+
+from ..standard.schema import get_schema
+from ..utils.exceptions import FilterError, SchemaError
+from ..utils.mapping import chunks, open_mapping
+from .bitmaps import BITMAP_FIELDS, BitmapIndex, extract_flags, to_bitmap
+from .bloom import BloomFilter, bloom_error_rate
+from .dates import DATE_FIELDS, DateIndex, extract_dates
+from .sectors import SectorIndex, extract_sectors
+
+
+_INDEX_FORMAT = 6
+_CHUNK_SIZE = 65536
+_FILETYPES = {
+    'iati-activities': 'activity',
+    'iati-organisations': 'organisation',
+}
+_ELEMENTS = {
+    'iati-activities': 'iati-activity',
+    'iati-organisations': 'iati-organisation',
+}
+_TOKEN_RE = re.compile(
+    br'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|'
+    br'<(iati-activity|iati-organisation)(?=[\s/>])|'
+    br'</(iati-activity|iati-organisation)\s*>', re.DOTALL)
+_UNTERMINATED_RE = re.compile(br'<!--|<!\[CDATA\[|<\?')
+_ENCODING_RE = re.compile(
+    br'^(?:\xef\xbb\xbf)?\s*<\?xml[^>]*?encoding=["\']([A-Za-z][\w.-]*)["\']')
+
+
+def index_path(data_path):
+    """Return the path of the index file for the dataset at
+    ``data_path``. Indexes live alongside the ``data`` directory,
+    at ``index/<publisher>/<dataset>.json``.
+    """
+    publisher_path, filename = dirname(data_path), basename(data_path)
+    registry_path = dirname(dirname(publisher_path))
+    return join(registry_path, 'index', basename(publisher_path),
+                splitext(filename)[0] + '.json')
+
+
+def bloom_path(data_path):
+    """Return the path of the Bloom filter sidecar for the dataset
+    at ``data_path``, which lives next to its index.
+    """
+    return splitext(index_path(data_path))[0] + '.bloom'
+
+
+def _bloom_key(key, value):
+    return '{}:{}'.format(key, value)
+
+
+class _OffsetScanner(object):
+    """Find the byte offsets of top-level activity and organisation
+    elements, in a stream of raw XML bytes.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self._carry = b''
+        self._position = 0
+
+    def feed(self, data):
+        buf = self._carry + data
+        base = self._position - len(self._carry)
+        last_end = 0
+        for match in _TOKEN_RE.finditer(buf):
+            last_end = match.end()
+            if match.group(1):
+                self.starts.append(base + match.start())
+            elif match.group(2):
+                self.ends.append(base + match.end())
+        # hang on to anything that might be the start of a token
+        unterminated = _UNTERMINATED_RE.search(buf, last_end)
+        if unterminated:
+            carry_from = unterminated.start()
+        else:
+            carry_from = buf.rfind(b'<', last_end)
+            if carry_from == -1 or len(buf) - carry_from > 64:
+                carry_from = len(buf)
+        self._carry = buf[carry_from:]
+        self._position += len(data)
+
+
+class DatasetIndex(object):
+    """Class representing the index of a single dataset.
+
+    Indexes record the dataset header, plus the identifier and byte
+    offsets of every activity or organisation in the dataset, so that
+    questions about the dataset can be answered without parsing it.
+    """
+
+    def __init__(self, record, bloom=None):
+        self._record = record
+        self._bloom = bloom
+        self._bloom_path = None
+        self._dates = None
+        self._sectors = None
+        self._bitmaps = None
+
+    def __repr__(self):
+        return '<{} ({})>'.format(self.__class__.__name__, self.name)
+
+    @property
+    def name(self):
+        return self._record['name']
+
+    @property
+    def bloom(self):
+        """Return the ``BloomFilter`` over the identifiers (``id``)
+        and reporting-org refs (``reporting_org``) in this dataset,
+        or ``None`` if there isn't one.
+        """
+        if self._bloom is None and self._bloom_path is not None:
+            bloom = BloomFilter.load(self._bloom_path)
+            expected = self._record.get('bloom', {})
+            if bloom is not None and bloom.size == expected.get('size') \
+                    and bloom.hashes == expected.get('hashes'):
+                self._bloom = bloom
+            self._bloom_path = None
+        return self._bloom
+
+    def may_contain(self, key, value):
+        """Check whether this dataset might include ``value`` for
+        ``key`` (``id`` or ``reporting_org``).
+
+        ``False`` means it certainly doesn't. If there's no Bloom
+        filter, this always returns ``True``.
+        """
+        bloom = self.bloom
+        if bloom is None:
+            return True
+        return _bloom_key(key, value) in bloom
+
+    @property
+    def publisher(self):
+        return self._record.get('publisher')
+
+    @property
+    def valid(self):
+        """Return ``True`` if the dataset XML could be parsed."""
+        return self._record['valid']
+
+    @property
+    def error(self):
+        """Return the XML parsing error, if the dataset is invalid."""
+        return self._record.get('error')
+
+    @property
+    def root(self):
+        """Return the name of the XML root node."""
+        return self._record.get('root')
+
+    @property
+    def attributes(self):
+        """Return the attributes of the XML root node."""
+        return self._record.get('attributes', {})
+
+    @property
+    def filetype(self):
+        return self._record.get('filetype')
+
+    @property
+    def version(self):
+        return self._record.get('version')
+
+    @property
+    def count(self):
+        """Return the number of activities or organisations."""
+        return self._record.get('count', 0)
+
+    @property
+    def identifiers(self):
+        return self._record.get('identifiers', [])
+
+    @property
+    def encoding(self):
+        """Return the encoding from the XML declaration, if any."""
+        return self._record.get('encoding')
+
+    @property
+    def dates(self):
+        """Return a ``DateIndex`` over the dates of each activity,
+        or ``None`` if this isn't a (valid) activity dataset.
+        """
+        if self._dates is None and self.valid and self._record.get('dates'):
+            self._dates = DateIndex(self._record['dates'])
+        return self._dates
+
+    @property
+    def sectors(self):
+        """Return a ``SectorIndex`` over the sectors of each activity,
+        or ``None`` if this isn't a (valid) activity dataset.
+        """
+        if self._sectors is None and self.valid and \
+                self._record.get('sectors') is not None:
+            try:
+                schema = get_schema('activity', self.version)
+            except SchemaError:
+                return None
+            self._sectors = SectorIndex(
+                self._record['sectors'], self.count, schema)
+        return self._sectors
+
+    @property
+    def bitmaps(self):
+        """Return a ``BitmapIndex`` over the boolean fields of each
+        activity, or ``None`` if this isn't a (valid) activity dataset.
+        """
+        if self._bitmaps is None and self.valid and \
+                self._record.get('bitmaps') is not None:
+            self._bitmaps = BitmapIndex(self._record['bitmaps'], self.count)
+        return self._bitmaps
+
+    @property
+    def sha256(self):
+        """Return the SHA-256 hex digest of the dataset file."""
+        return self._record.get('sha256')
+
+    @property
+    def offsets(self):
+        """Return a list of ``(start, end)`` byte offsets for each
+        activity or organisation, or ``None`` if they couldn't
+        be determined.
+        """
+        return self._record.get('offsets')
+
+    def is_fresh(self, data_path):
+        """Check whether this index matches the file at ``data_path``."""
+        try:
+            file_stat = stat(data_path)
+        except OSError:
+            return False
+        return self._record.get('format') == _INDEX_FORMAT and \
+            self._record.get('size') == file_stat.st_size and \
+            self._record.get('mtime') == file_stat.st_mtime
+
+    def save(self, data_path):
+        """Write this index to disk, for the dataset at ``data_path``."""
+        file_stat = stat(data_path)
+        self._record['size'] = file_stat.st_size
+        self._record['mtime'] = file_stat.st_mtime
+        filepath = index_path(data_path)
+        if not exists(dirname(filepath)):
+            try:
+                makedirs(dirname(filepath))
+            except OSError:
+                # datasets can be indexed in parallel
+                if not exists(dirname(filepath)):
+                    raise
+        with open(filepath, 'w') as handler:
+            json.dump(self._record, handler)
+        if self._bloom is not None:
+            self._bloom.save(bloom_path(data_path))
+
+    @classmethod
+    def load(cls, data_path):
+        """Load the index for the dataset at ``data_path``.
+
+        Returns ``None`` if there is no index, or if it is out of date.
+        """
+        filepath = index_path(data_path)
+        if not exists(filepath):
+            return None
+        with open(filepath) as handler:
+            index = cls(json.load(handler))
+        if not index.is_fresh(data_path):
+            return None
+        if 'bloom' in index._record:
+            index._bloom_path = bloom_path(data_path)
+        return index
+
+
+class StreamIndexer(object):
+    """Build a ``DatasetIndex`` from a stream of raw XML bytes.
+
+    Bytes are fed to lxml's ``XMLPullParser`` as they arrive, so the
+    index can be built while a dataset is being downloaded. Elements
+    are discarded once they have been indexed, so memory use stays
+    flat, regardless of the size of the dataset.
+
+    A Bloom filter over identifiers and reporting-org refs is built
+    too, sized for a false positive rate of ``error_rate`` (by default,
+    ``bloom_error_rate`` from the ``[index]`` section of the config).
+    """
+
+    def __init__(self, name, publisher=None, error_rate=None):
+        self._error_rate = error_rate
+        self._bloom_keys = set()
+        self._record = {
+            'format': _INDEX_FORMAT,
+            'name': name,
+            'publisher': publisher,
+            'valid': True,
+            'count': 0,
+            'identifiers': [],
+        }
+        self._parser = ET.XMLPullParser(
+            events=('start', 'end'), huge_tree=True)
+        self._scanner = _OffsetScanner()
+        self._hash = hashlib.sha256()
+        # the start of the file, until the XML declaration is read
+        self._head = b''
+        self._root = None
+        self._schema = None
+        self._element = None
+        self._depth = 0
+        # field -> (ordinals when True, ordinals when False)
+        self._flags = None
+
+    def feed(self, data):
+        if self._head is not None:
+            self._head += data[:256]
+            if b'>' in self._head or len(self._head) >= 256:
+                self._read_encoding()
+        self._hash.update(data)
+        self._scanner.feed(data)
+        if not self._record['valid']:
+            return
+        try:
+            self._parser.feed(data)
+            self._read_events()
+        except ET.XMLSyntaxError as error:
+            self._invalid(error)
+
+    def _read_encoding(self):
+        match = _ENCODING_RE.match(self._head)
+        self._record['encoding'] = \
+            match.group(1).decode('ascii') if match else None
+        self._head = None
+
+    def _invalid(self, error):
+        self._record['valid'] = False
+        self._record['error'] = str(error)
+
+    def _start_root(self, element):
+        self._root = element
+        self._record['root'] = element.tag
+        self._record['attributes'] = dict(element.attrib)
+        filetype = _FILETYPES.get(element.tag)
+        self._record['filetype'] = filetype
+        self._element = _ELEMENTS.get(element.tag)
+        version = element.get('version', '1.01')
+        self._record['version'] = version
+        if filetype:
+            try:
+                self._schema = get_schema(filetype, version)
+            except SchemaError:
+                pass
+        if self._schema is not None and filetype == 'activity':
+            self._record['dates'] = {field: [] for field in DATE_FIELDS}
+            self._record['sectors'] = []
+            self._flags = {field: ([], []) for field in BITMAP_FIELDS}
+
+    def _end_element(self, element):
+        self._record['count'] += 1
+        identifier = None
+        if self._schema is not None:
+            identifiers = self._schema.id().extract(element)
+            identifier = identifiers[0].strip() if identifiers else None
+            self._bloom_keys.update(
+                _bloom_key('id', value) for value in identifiers)
+            if 'dates' in self._record:
+                for field, date in extract_dates(
+                        self._schema, element).items():
+                    self._record['dates'][field].append(date)
+            ordinal = self._record['count'] - 1
+            if self._flags is not None:
+                for field, flags in extract_flags(
+                        self._schema, element).items():
+                    for ordinals, flag in zip(self._flags[field], flags):
+                        if flag:
+                            ordinals.append(ordinal)
+            if 'sectors' in self._record:
+                self._record['sectors'].extend(
+                    [vocabulary, code, ordinal, percentage]
+                    for vocabulary, code, percentage in extract_sectors(
+                        self._schema, element))
+            reporting_org = getattr(self._schema, 'reporting_org', None)
+            if reporting_org is not None:
+                self._bloom_keys.update(
+                    _bloom_key('reporting_org', value)
+                    for value in reporting_org().extract(element))
+        self._record['identifiers'].append(identifier)
+
+    def _read_events(self):
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._depth += 1
+                if self._depth == 1:
+                    self._start_root(element)
+                continue
+            self._depth -= 1
+            if self._depth == 1 and element.tag == self._element:
+                self._end_element(element)
+                # free up memory
+                element.clear()
+                while element.getprevious() is not None:
+                    del self._root[0]
+
+    def close(self):
+        """Finish indexing, and return a ``DatasetIndex``."""
+        if self._head is not None:
+            self._read_encoding()
+        if self._record['valid']:
+            try:
+                self._parser.close()
+                self._read_events()
+            except ET.XMLSyntaxError as error:
+                self._invalid(error)
+        if self._root is None and self._record['valid']:
+            self._invalid('Document is empty')
+        self._record['sha256'] = self._hash.hexdigest()
+        count = self._record['count']
+        starts, ends = self._scanner.starts, self._scanner.ends
+        if self._record['valid'] and \
+                len(starts) == len(ends) == count:
+            self._record['offsets'] = list(zip(starts, ends))
+        else:
+            self._record['offsets'] = None
+        if self._flags is not None:
+            self._record['bitmaps'] = {
+                field: ['{:x}'.format(to_bitmap(ordinals))
+                        for ordinals in flags]
+                for field, flags in self._flags.items()}
+        bloom = None
+        if self._schema is not None and self._record['valid']:
+            error_rate = self._error_rate or bloom_error_rate()
+            bloom = BloomFilter.for_capacity(
+                len(self._bloom_keys), error_rate)
+            for key in self._bloom_keys:
+                bloom.add(key)
+            self._record['bloom'] = {
+                'size': bloom.size,
+                'hashes': bloom.hashes,
+                'error_rate': error_rate,
+            }
+        return DatasetIndex(self._record, bloom)
+
+
+def build_index(data_path, publisher=None):
+    """Build and save the index for the dataset at ``data_path``."""
+    name = splitext(basename(data_path))[0]
+    if publisher is None:
+        publisher = basename(dirname(data_path))
+    indexer = StreamIndexer(name, publisher)
+    mapping = open_mapping(data_path)
+    if mapping is not None:
+        for chunk in chunks(mapping, _CHUNK_SIZE):
+            indexer.feed(chunk)
+    index = indexer.close()
+    index.save(data_path)
+    return index
+
+
+class Catalog(object):
+    """Class representing the catalog of dataset indexes
+    for a local copy of the registry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __repr__(self):
+        return '<{} ({})>'.format(self.__class__.__name__, self.path)
+
+    def _data_paths(self):
+        return sorted(glob(join(self.path, 'data', '*', '*')))
+
+    def __iter__(self):
+        for data_path in self._data_paths():
+            index = DatasetIndex.load(data_path)
+            if index is not None:
+                yield index
+
+    def get(self, name, default=None):
+        """Return the index for the named dataset, if there's a fresh one.
+        """
+        for data_path in glob(join(self.path, 'data', '*', '*')):
+            if splitext(basename(data_path))[0] == name:
+                index = DatasetIndex.load(data_path)
+                if index is not None:
+                    return index
+        return default
+
+    def build(self, force=False):
+        """Index every dataset that is missing an up-to-date index.
+
+        Pass ``force=True`` to rebuild all indexes.
+
+        Returns the number of datasets indexed.
+        """
+        built = 0
+        for data_path in self._data_paths():
+            if not force and DatasetIndex.load(data_path) is not None:
+                continue
+            logging.getLogger(__name__).debug(
+                'Indexing dataset "%s"', data_path)
+            build_index(data_path)
+            built += 1
+        return built
+
+    def match_dates(self, **filters):
+        """Find activities that match date filters, using the
+        date indexes. Only indexed datasets are searched.
+
+        Filters are the date filters that ``ActivitySet.where`` takes,
+        e.g. ``planned_start__gte='2020-01-01'`` or
+        ``active_during=('2020-01-01', '2020-12-31')``. Yields the data
+        path of each dataset with matching activities, along with a
+        list of their ``(start, end)`` byte offsets.
+        """
+        for key in filters:
+            if key.partition('__')[0] not in \
+                    DATE_FIELDS + ('active_during',):
+                raise FilterError('Unknown date filter: {}'.format(key))
+        wheres = {key: [value] for key, value in filters.items()}
+        for data_path in self._data_paths():
+            index = DatasetIndex.load(data_path)
+            if index is None or index.dates is None or \
+                    index.offsets is None:
+                continue
+            ordinals, complete = index.dates.match(wheres)
+            if not complete:
+                raise FilterError('Invalid date filter: {}'.format(filters))
+            if ordinals is None:
+                ordinals = range(index.count)
+            if ordinals:
+                yield data_path, [index.offsets[ordinal]
+                                  for ordinal in sorted(ordinals)]
+
+    def sector_postings(self, sector, category=False):
+        """Find activities with a sector, using the sector indexes.
+        Only indexed datasets are searched.
+
+        Pass a sector category with ``category=True`` to find activities
+        with any sector in that category (like ``sector__in``). Yields a
+        ``(data_path, ordinal, percentage)`` posting for each matching
+        sector, where ``ordinal`` is the position of the activity in
+        its dataset.
+        """
+        operation = 'in' if category else 'eq'
+        for data_path in self._data_paths():
+            index = DatasetIndex.load(data_path)
+            if index is None or index.sectors is None:
+                continue
+            postings = index.sectors.postings(operation, sector)
+            if postings is None:
+                raise FilterError('Unsupported sector filter: {}'.format(
+                    sector))
+            for ordinal, percentage in postings:
+                yield data_path, ordinal, percentage
+
+    def compile(self, force=False):
+        """Compile every dataset that doesn't have an up-to-date
+        compiled form, indexing it first if necessary.
+
+        Compiled datasets are keyed by content hash, so unchanged
+        datasets aren't recompiled. Pass ``force=True`` to recompile
+        all datasets.
+
+        Returns the number of datasets compiled.
+        """
+        from .compiled import compile_dataset, compiled_path
+
+        compiled = 0
+        for data_path in self._data_paths():
+            index = DatasetIndex.load(data_path) or build_index(data_path)
+            if not force and index.sha256 and \
+                    exists(compiled_path(data_path, index.sha256)):
+                continue
+            logging.getLogger(__name__).debug(
+                'Compiling dataset "%s"', data_path)
+            if compile_dataset(data_path, index, force=force) is not None:
+                compiled += 1
+        return compiled
@@ -0,0 +1,417 @@
+from array import array
+import json
+from os import makedirs, rename
+from os.path import dirname, exists, join
+import struct
+import sys
+
+from lxml import etree as ET
+
+from ..standard.schema import get_schema
+from ..utils.abstract import GenericType
+from ..utils.exceptions import SchemaError
+from ..utils.mapping import open_mapping
+from .catalog import DatasetIndex, build_index
+
+
+_MAGIC = b'IATICMPL'
+_FORMAT = 1
+_ELEMENTS = {
+    'iati-activities': 'iati-activity',
+    'iati-organisations': 'iati-organisation',
+}
+# string length marking a missing (``None``) value
+_NONE = 0xFFFFFFFF
+_SCHEMA_FIELDS = {}
+
+
+def compiled_path(data_path, sha256):
+    """Return the path of the compiled form of a dataset. Compiled
+    datasets live alongside the ``data`` directory, at
+    ``compiled/<hash prefix>/<hash>.bin``, keyed by content hash.
+    """
+    registry_path = dirname(dirname(dirname(data_path)))
+    return join(registry_path, 'compiled', sha256[:2], sha256 + '.bin')
+
+
+def schema_fields(schema):
+    """Return a dictionary of the fields of ``schema`` that can be
+    stored in a compiled dataset, mapped to their types.
+    """
+    if schema not in _SCHEMA_FIELDS:
+        fields = {}
+        for name in dir(schema):
+            if name.startswith('_') or name in ('id', 'version'):
+                continue
+            accessor = getattr(schema, name)
+            if not callable(accessor):
+                continue
+            type_ = accessor()
+            if isinstance(type_, GenericType) and type_.get():
+                fields[name] = type_
+        _SCHEMA_FIELDS[schema] = fields
+    return _SCHEMA_FIELDS[schema]
+
+
+def _field_name(fields, shortcut, type_):
+    """Return the name of the stored field for a filter shortcut
+    (e.g. ``id`` is stored as ``iati_identifier``).
+    """
+    if shortcut in fields:
+        return shortcut
+    for name, field_type in fields.items():
+        if type(field_type) is type(type_) and \
+                field_type.get() == type_.get():
+            return name
+    return None
+
+
+def predicates(schema, wheres):
+    """Return a list of ``(field, match)`` pairs, for checking
+    ``wheres`` against a compiled dataset.
+
+    Returns ``None`` if any of the filters can't be checked that way
+    (e.g. raw XPath filters), in which case the XML should be queried.
+    """
+    fields = schema_fields(schema)
+    out = []
+    for key, values in wheres.items():
+        if '__' in key:
+            shortcut, operation = key.split('__')
+        else:
+            shortcut, operation = key, 'eq'
+        type_ = getattr(schema, shortcut)()
+        field = _field_name(fields, shortcut, type_)
+        for value in values:
+            # raise the same errors as an XPath query would
+            type_.where(operation, value)
+            match = type_.matches(operation, value) \
+                if field is not None else None
+            if match is None:
+                return None
+            out.append((field, match))
+    return out
+
+
+class _Section(object):
+    def __init__(self, typecode):
+        self.typecode = typecode
+        self.data = array(typecode)
+
+
+class _Writer(object):
+    def __init__(self, attributes):
+        self._attributes = attributes
+        self._strings = {}
+        self.heap = bytearray()
+        self.sections = {'offsets': _Section('Q')}
+        for field in attributes:
+            self.sections[field + '.index'] = _Section('I')
+            self.sections[field + '.index'].data.append(0)
+            self.sections[field + '.refs'] = _Section('I')
+
+    def _string(self, value):
+        if value is None:
+            return 0, _NONE
+        ref = self._strings.get(value)
+        if ref is None:
+            encoded = value.encode('utf-8')
+            ref = self._strings[value] = (len(self.heap), len(encoded))
+            self.heap.extend(encoded)
+        return ref
+
+    def add(self, offsets, values):
+        self.sections['offsets'].data.extend(offsets)
+        for field, attributes in self._attributes.items():
+            refs = self.sections[field + '.refs'].data
+            items = values[field]
+            for item in items:
+                if attributes is None:
+                    refs.extend(self._string(item))
+                else:
+                    for attribute in attributes:
+                        refs.extend(self._string(item.get(attribute)))
+            index = self.sections[field + '.index'].data
+            index.append(index[-1] + len(items))
+
+    def write(self, path, header):
+        chunks = []
+        position = 0
+        layout = {}
+        for name, section in sorted(self.sections.items()):
+            # (``tobytes`` is ``tostring`` on python 2)
+            tobytes = getattr(section.data, 'tobytes', None) or \
+                section.data.tostring
+            data = tobytes()
+            layout[name] = [position, len(data), section.typecode]
+            chunks.append(data)
+            position += _padded(len(data))
+        layout['heap'] = [position, len(self.heap), 'B']
+        chunks.append(bytes(self.heap))
+        header = dict(header, sections=layout, fields={
+            field: list(attributes) if attributes else None
+            for field, attributes in self._attributes.items()})
+        encoded_header = json.dumps(header).encode('utf-8')
+        if not exists(dirname(path)):
+            makedirs(dirname(path))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as handler:
+            handler.write(_MAGIC)
+            handler.write(struct.pack('<II', len(encoded_header), 0))
+            handler.write(_pad(encoded_header))
+            for chunk in chunks:
+                handler.write(_pad(chunk))
+        rename(tmp_path, path)
+
+
+def _padded(length):
+    return (length + 7) // 8 * 8
+
+
+def _pad(data):
+    return data + b'\0' * (_padded(len(data)) - len(data))
+
+
+def _cast(section, typecode):
+    """Return a view of ``section`` as an array of ``typecode``."""
+    if typecode == 'B':
+        return section
+    try:
+        return section.cast(typecode)
+    except AttributeError:
+        # python 2 memoryviews can't be cast, so copy it instead
+        values = array(typecode)
+        frombytes = getattr(values, 'frombytes', None) or values.fromstring
+        frombytes(section.tobytes())
+        return values
+
+
+def compile_dataset(data_path, index=None, force=False):
+    """Compile the dataset at ``data_path``, and return the path of
+    the compiled form.
+
+    Every schema field of every activity (or organisation) is extracted,
+    and stored along with its byte offsets in the XML, in a binary form
+    that can be memory-mapped. Returns ``None`` if the dataset can't be
+    compiled (e.g. because it's invalid XML).
+    """
+    if index is None:
+        index = DatasetIndex.load(data_path) or build_index(data_path)
+    if not index.valid or index.offsets is None or not index.sha256:
+        return None
+    element_tag = _ELEMENTS.get(index.root)
+    try:
+        schema = get_schema(index.filetype, index.version)
+    except SchemaError:
+        return None
+    if element_tag is None or schema is None:
+        return None
+    path = compiled_path(data_path, index.sha256)
+    if exists(path) and not force:
+        return path
+
+    fields = schema_fields(schema)
+    writer = _Writer({name: type_.attributes
+                      for name, type_ in fields.items()})
+    offsets = iter(index.offsets)
+    encoding = None
+    count = 0
+    for _, element in ET.iterparse(data_path, events=('end',),
+                                   tag=element_tag, huge_tree=True):
+        parent = element.getparent()
+        if parent is None or parent.getparent() is not None:
+            continue
+        if encoding is None:
+            encoding = element.getroottree().docinfo.encoding
+        writer.add(next(offsets), {
+            name: type_.extract(element) for name, type_ in fields.items()})
+        count += 1
+        # free up memory
+        element.clear()
+        while element.getprevious() is not None:
+            del parent[0]
+    if count != index.count:
+        return None
+    writer.write(path, {
+        'format': _FORMAT,
+        'byteorder': sys.byteorder,
+        'itemsizes': {typecode: array(typecode).itemsize
+                      for typecode in 'IQ'},
+        'name': index.name,
+        'sha256': index.sha256,
+        'filetype': index.filetype,
+        'version': index.version,
+        'encoding': encoding,
+        'count': count,
+    })
+    return path
+
+
+class CompiledDataset(object):
+    """Class representing the compiled form of a dataset.
+
+    The file is memory-mapped (using the shared map of each file),
+    and values are only decoded when they're read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._sections = None
+        view = self._view()
+        if view[:8].tobytes() != _MAGIC:
+            raise ValueError('Not a compiled dataset: {}'.format(path))
+        header_length, _ = struct.unpack('<II', view[8:16].tobytes())
+        header = json.loads(view[16:16 + header_length].tobytes().decode(
+            'utf-8'))
+        itemsizes = {typecode: array(typecode).itemsize
+                     for typecode in 'IQ'}
+        if header.get('format') != _FORMAT or \
+                header.get('byteorder') != sys.byteorder or \
+                header.get('itemsizes') != itemsizes:
+            raise ValueError('Incompatible compiled dataset: {}'.format(path))
+        self.header = header
+        self._data_start = 16 + _padded(header_length)
+        self._fields = header['fields']
+
+    def __getstate__(self):
+        # views of the memory map can't be copied or pickled,
+        # so they're made again when they're next needed
+        state = dict(self.__dict__)
+        state['_sections'] = None
+        return state
+
+    def _view(self):
+        mapping = open_mapping(self.path)
+        if mapping is None:
+            raise ValueError('Not a compiled dataset: {}'.format(self.path))
+        return memoryview(mapping)
+
+    @property
+    def sections(self):
+        """Return a dictionary of views of each section of the file."""
+        if self._sections is None:
+            view = self._view()
+            sections = {}
+            for name, (start, length, typecode) in \
+                    self.header['sections'].items():
+                start += self._data_start
+                section = view[start:start + length]
+                sections[name] = _cast(section, typecode)
+            self._sections = sections
+        return self._sections
+
+    def __repr__(self):
+        return '<{} ({})>'.format(self.__class__.__name__, self.name)
+
+    @classmethod
+    def load(cls, data_path, sha256):
+        """Open the compiled form of the dataset at ``data_path``.
+
+        Returns ``None`` if it hasn't been compiled, or was compiled
+        on an incompatible platform.
+        """
+        path = compiled_path(data_path, sha256)
+        if not exists(path):
+            return None
+        try:
+            return cls(path)
+        except (ValueError, struct.error):
+            return None
+
+    @property
+    def name(self):
+        return self.header['name']
+
+    @property
+    def version(self):
+        return self.header['version']
+
+    @property
+    def filetype(self):
+        return self.header['filetype']
+
+    @property
+    def encoding(self):
+        return self.header.get('encoding')
+
+    @property
+    def count(self):
+        return self.header['count']
+
+    @property
+    def fields(self):
+        return list(self._fields.keys())
+
+    def offsets(self, ordinal):
+        """Return the ``(start, end)`` byte offsets of an element
+        in the dataset XML.
+        """
+        offsets = self.sections['offsets']
+        return offsets[2 * ordinal], offsets[2 * ordinal + 1]
+
+    @staticmethod
+    def _string(heap, offset, length):
+        if length == _NONE:
+            return None
+        return heap[offset:offset + length].tobytes().decode('utf-8')
+
+    def values(self, ordinal, field):
+        """Return the stored values of ``field`` for an element,
+        as returned by the field type's ``extract``.
+        """
+        attributes = self._fields[field]
+        sections = self.sections
+        index = sections[field + '.index']
+        refs = sections[field + '.refs']
+        heap = sections['heap']
+        start, end = index[ordinal], index[ordinal + 1]
+        if attributes is None:
+            return [self._string(heap, refs[2 * idx], refs[2 * idx + 1])
+                    for idx in range(start, end)]
+        width = len(attributes)
+        items = []
+        for idx in range(start, end):
+            item = {}
+            for position, attribute in enumerate(attributes):
+                ref = 2 * (idx * width + position)
+                value = self._string(heap, refs[ref], refs[ref + 1])
+                if value is not None:
+                    item[attribute] = value
+            items.append(item)
+        return items
+
+    def matching(self, predicates):
+        """Return the ordinals of elements matching all
+        ``(field, match)`` predicates.
+        """
+        if not predicates:
+            return list(range(self.count))
+        return [ordinal for ordinal in range(self.count)
+                if all(match(self.values(ordinal, field))
+                       for field, match in predicates)]
+
+
+class CompiledValues(dict):
+    """Memo of field values for an activity or organisation,
+    that are read from a compiled dataset on demand.
+    """
+
+    def __init__(self, compiled, ordinal, schema):
+        super(CompiledValues, self).__init__()
+        self._compiled = compiled
+        self._ordinal = ordinal
+        self._types = schema_fields(schema)
+
+    def loadable(self, field):
+        """Check whether ``field`` can be read from the compiled dataset.
+        """
+        type_ = self._types.get(field)
+        return type_ is not None and type_.loadable
+
+    def __missing__(self, field):
+        if not self.loadable(field):
+            raise KeyError(field)
+        value = self._types[field].load(
+            self._compiled.values(self._ordinal, field))
+        self[field] = value
+        return value
@@ -0,0 +1,135 @@
+from bisect import bisect_left, bisect_right
+import math
+
+from ..utils.types import PeriodType, date_number
+
+
+DATE_FIELDS = ('planned_start', 'actual_start', 'planned_end', 'actual_end')
+
+
+def extract_dates(schema, element):
+    """Return the dates of ``element`` to store in the index, as
+    numbers (e.g. ``20200131``), or ``None`` for missing or invalid
+    dates. Like the XPath date filters, only the first date counts.
+    """
+    dates = {}
+    for field in DATE_FIELDS:
+        accessor = getattr(schema, field, None)
+        if accessor is None:
+            continue
+        values = accessor().extract(element)
+        number = date_number(values[0]) if values else float('nan')
+        dates[field] = None if math.isnan(number) else number
+    return dates
+
+
+class _SortedDates(object):
+    """Dates, sorted along with the ordinal of the element
+    they belong to. Missing dates are left out.
+    """
+
+    def __init__(self, dates):
+        pairs = sorted((date, ordinal) for ordinal, date in enumerate(dates)
+                       if date is not None)
+        self.dates = [date for date, _ in pairs]
+        self.ordinals = [ordinal for _, ordinal in pairs]
+
+    def between(self, low=None, high=None, low_inclusive=True,
+                high_inclusive=True):
+        """Return the set of ordinals with dates in a range."""
+        start, end = 0, len(self.dates)
+        if low is not None:
+            bisect = bisect_left if low_inclusive else bisect_right
+            start = bisect(self.dates, low)
+        if high is not None:
+            bisect = bisect_right if high_inclusive else bisect_left
+            end = bisect(self.dates, high)
+        return set(self.ordinals[start:end])
+
+
+class DateIndex(object):
+    """Index over the planned and actual start and end dates of the
+    activities in a dataset, for answering date filters (including
+    ``active_during``) without the XML.
+    """
+
+    def __init__(self, dates):
+        self._dates = dates
+        self._sorted = {}
+
+    @property
+    def fields(self):
+        return list(self._dates.keys())
+
+    def _sorted_dates(self, field):
+        if field not in self._sorted:
+            if field == 'start':
+                dates = self._combined('actual_start', 'planned_start')
+            elif field == 'end':
+                dates = self._combined('actual_end', 'planned_end')
+            else:
+                dates = self._dates[field]
+            self._sorted[field] = _SortedDates(dates)
+        return self._sorted[field]
+
+    def _combined(self, actual, planned):
+        return [actual_date if actual_date is not None else planned_date
+                for actual_date, planned_date in zip(
+                    self._dates[actual], self._dates[planned])]
+
+    def _range(self, field, operation, value):
+        dates = self._sorted_dates(field)
+        if operation == 'lt':
+            return dates.between(high=value, high_inclusive=False)
+        elif operation == 'lte':
+            return dates.between(high=value)
+        elif operation == 'gt':
+            return dates.between(low=value, low_inclusive=False)
+        elif operation == 'gte':
+            return dates.between(low=value)
+        return dates.between(low=value, high=value)
+
+    def active_during(self, start, end):
+        """Return the set of ordinals of activities that are active at
+        some point between ``start`` and ``end`` (as numbers).
+        """
+        started = self._sorted_dates('start').between(high=end)
+        ended = self._sorted_dates('end').between(high=start,
+                                                  high_inclusive=False)
+        return started - ended
+
+    def find(self, field, operation, value):
+        """Return the set of ordinals matching a filter, or ``None``
+        if it isn't a date filter this index can answer.
+        """
+        if field in DATE_FIELDS and field in self._dates and \
+                operation in ('lt', 'lte', 'gt', 'gte', 'eq'):
+            try:
+                value = float(str(value).replace('-', ''))
+            except ValueError:
+                return None
+            return self._range(field, operation, value)
+        if field == 'active_during' and operation == 'eq' and \
+                all(field in self._dates for field in DATE_FIELDS):
+            start, end = PeriodType.bounds(value)
+            return self.active_during(float(start), float(end))
+        return None
+
+    def match(self, wheres):
+        """Return the set of ordinals matching the date filters in
+        ``wheres`` (or ``None`` if there aren't any), and whether
+        every filter in ``wheres`` is a date filter.
+        """
+        ordinals = None
+        complete = True
+        for key, values in wheres.items():
+            field, _, operation = key.partition('__')
+            for value in values:
+                found = self.find(field, operation or 'eq', value)
+                if found is None:
+                    complete = False
+                elif ordinals is None:
+                    ordinals = found
+                else:
+                    ordinals &= found
+        return ordinals, complete
@@ -0,0 +1,69 @@
+from ..utils.types import _xpath_number
+
+
+def extract_sectors(schema, element):
+    """Return the sectors of ``element`` to store in the index, as
+    ``[vocabulary, code, percentage]`` lists. Vocabularies and codes
+    are kept as they appear in the XML (``None`` if missing).
+    Percentages are numbers, or ``None`` if missing or invalid.
+    """
+    sectors = []
+    for sector in schema.sector().extract(element):
+        percentage = sector.get('percentage')
+        if percentage is not None:
+            percentage = _xpath_number(percentage)
+            if percentage != percentage:
+                percentage = None
+        sectors.append([sector.get('vocabulary'), sector.get('code'),
+                        percentage])
+    return sectors
+
+
+class SectorIndex(object):
+    """Inverted index over the sectors of the activities in a dataset,
+    from ``(vocabulary, code)`` to a list of postings. Each posting is
+    the ordinal of an activity, and the percentage for that sector.
+    """
+
+    def __init__(self, postings, count, schema):
+        # postings are ``[vocabulary, code, ordinal, percentage]`` lists
+        self._postings = {}
+        self._with_sectors = set()
+        for position, (vocabulary, code, ordinal, percentage) in \
+                enumerate(postings):
+            # the position keeps postings from several keys in
+            # document order
+            self._postings.setdefault((vocabulary, code), []).append(
+                (position, ordinal, percentage))
+            self._with_sectors.add(ordinal)
+        self._count = count
+        self._schema = schema
+
+    def postings(self, operation, value):
+        """Return the sorted ``(ordinal, percentage)`` postings for a
+        sector filter (``eq`` or ``in``), or ``None`` if the index can't
+        answer it. An activity can have several matching sectors.
+        """
+        keys = self._schema.sector().index_keys(operation, value)
+        if keys is None:
+            return None
+        found = []
+        for key in keys:
+            found.extend(self._postings.get(key, []))
+        return [(ordinal, percentage)
+                for _, ordinal, percentage in sorted(found)]
+
+    def find(self, field, operation, value):
+        """Return the set of ordinals matching a filter, or ``None``
+        if it isn't a sector filter this index can answer.
+        """
+        if field != 'sector':
+            return None
+        if operation == 'exists':
+            if value:
+                return set(self._with_sectors)
+            return set(range(self._count)) - self._with_sectors
+        postings = self.postings(operation, value)
+        if postings is None:
+            return None
+        return set(ordinal for ordinal, _ in postings)
@@ -1,6 +1,6 @@
 from ..utils.exceptions import SchemaError
 from ..utils.types import StringType, DateType, SectorType, XPathType, \
-                          BooleanType
+                          BooleanType, PeriodType
 from ..utils.abstract import GenericType
 
 
@@ -20,6 +20,10 @@ class ActivitySchema101(object):
     def iati_identifier(cls):
         return StringType('iati-identifier/text()')
 
+    @classmethod
+    def reporting_org(cls):
+        return StringType('reporting-org/@ref')
+
     @classmethod
     def title(cls):
         return StringType('title/text()')
@@ -61,6 +65,11 @@ class ActivitySchema101(object):
     def humanitarian(cls):
         return BooleanType('false')
 
+    @classmethod
+    def active_during(cls):
+        return PeriodType((cls.actual_start(), cls.planned_start()),
+                          (cls.actual_end(), cls.planned_end()))
+
 
 class ActivitySchema102(ActivitySchema101):
     version = '1.02'
@@ -1,11 +1,17 @@
 import json
+from os import stat
 from os.path import exists, join
+import threading
 
 from ..utils.abstract import GenericSet
 from ..utils.exceptions import NoCodelistsError
 from ..utils.config import CONFIG
 
 
+_SECTOR_CATEGORIES = {}
+_LOCK = threading.Lock()
+
+
 class CodelistItem(object):
     def __init__(self, codelist, **kwargs):
         self.category = kwargs.get('category')
@@ -152,3 +158,30 @@ class CodelistSet(GenericSet):
 def codelists():
     """Helper function for fetching all codelists."""
     return CodelistSet()
+
+
+def sector_categories():
+    """Return a dictionary of sector categories (DAC-3 codes) to the
+    ``frozenset`` of sector (DAC-5) codes in each one.
+
+    The dictionary is built once per version of the Sector codelist.
+    """
+    path = join(CONFIG.get('paths', 'standard', raw=True),
+                'codelists', 'Sector.json')
+    try:
+        stats = stat(path)
+    except OSError:
+        stats = None
+    key = (path, stats.st_mtime, stats.st_size) if stats else None
+    with _LOCK:
+        categories = _SECTOR_CATEGORIES.get(key)
+    if categories is None:
+        codes = {}
+        for item in CodelistSet().get('Sector').data.values():
+            codes.setdefault(item['category'], set()).add(item['code'])
+        categories = {category: frozenset(category_codes)
+                      for category, category_codes in codes.items()}
+        with _LOCK:
+            _SECTOR_CATEGORIES.clear()
+            _SECTOR_CATEGORIES[key] = categories
+    return categories
@@ -1,8 +1,10 @@
+from ..utils import instrument
 from .activity_schema import get_activity_schema
 from .organisation_schema import get_organisation_schema
 
 
 def get_schema(filetype, version):
+    instrument.emit('get_schema')
     if filetype == 'activity':
         return get_activity_schema(version)
     elif filetype == 'organisation':
@@ -1,8 +1,92 @@
 from copy import deepcopy
 from itertools import islice
+import re
+import threading
+
+from lxml import etree as ET
+
 from .exceptions import FilterError
 
 
+_LOCAL = threading.local()
+
+_NAMESPACE = 'https://github.com/pwyf/iatikit'
+
+# Sets of codes that XPath queries can refer to by name,
+# using the ``iatikit:code-in`` extension function
+_CODE_SETS = {}
+_CODE_SET_NAMES = {}
+_CODE_SETS_LOCK = threading.Lock()
+_CODE_IN_RE = re.compile(r'iatikit:code-in\(([^,()]+), "(\d+)"\)')
+
+
+def code_set_name(codes):
+    """Register a ``frozenset`` of codes, and return the name to use for
+    it in XPath queries, e.g. ``iatikit:code-in(@code, "0")``. The same
+    set always gets the same name, so queries can be cached.
+    """
+    with _CODE_SETS_LOCK:
+        name = _CODE_SET_NAMES.get(codes)
+        if name is None:
+            name = _CODE_SET_NAMES[codes] = str(len(_CODE_SETS))
+            _CODE_SETS[name] = codes
+    return name
+
+
+def expand_code_sets(expr):
+    """Return XPath ``expr``, with each ``iatikit:code-in`` call replaced
+    by comparisons with the codes in its set. This is slower to run,
+    but readable (and can be run without iatikit's extensions).
+    """
+    def expand(match):
+        value, name = match.groups()
+        with _CODE_SETS_LOCK:
+            codes = _CODE_SETS.get(name)
+        if codes is None:
+            return match.group(0)
+        if not codes:
+            return 'false()'
+        return '({})'.format(' or '.join(
+            '{} = "{}"'.format(value, code) for code in sorted(codes)))
+    return _CODE_IN_RE.sub(expand, expr)
+
+
+def _code_in(context, values, name):  # pylint: disable=unused-argument
+    """XPath extension function: is any of ``values`` (e.g. a set of
+    ``@code`` attributes) in the named set of codes?
+    """
+    codes = _CODE_SETS[name]
+    return any(value in codes for value in values)
+
+
+_EXTENSIONS = {(_NAMESPACE, 'code-in'): _code_in}
+
+
+def make_xpath(expr):
+    """Return ``expr`` as an ``ET.XPath``, with iatikit's extension
+    functions available (under the ``iatikit`` prefix).
+    """
+    return ET.XPath(expr, namespaces={'iatikit': _NAMESPACE},
+                    extensions=_EXTENSIONS)
+
+
+def compiled_xpath(expr):
+    """Return ``expr`` as a compiled ``ET.XPath``.
+
+    Compiled expressions are cached (per thread, since lxml XPath
+    objects aren't thread-safe), so each is only compiled once.
+    """
+    try:
+        cache = _LOCAL.xpaths
+    except AttributeError:
+        cache = _LOCAL.xpaths = {}
+    try:
+        return cache[expr]
+    except KeyError:
+        xpath = cache[expr] = make_xpath(expr)
+        return xpath
+
+
 class GenericSet(object):
     """Class representing a generic grouping of iatikit objects.
 
@@ -98,15 +182,58 @@ class GenericSet(object):
         return self.where(**kwargs).first()
 
 
+def string_value(result):
+    """Return the XPath string-value of an XPath result."""
+    if hasattr(result, 'xpath'):
+        return result.xpath('string()')
+    return '{}'.format(result)
+
+
 class GenericType(object):
+    # Attributes to extract from each selected element, for types
+    # whose ``extract`` returns dictionaries rather than strings.
+    attributes = None
+    # Whether the type has a ``load`` method, for converting values
+    # from ``extract`` into what ``run`` returns. Types whose ``run``
+    # returns elements can't do that.
+    loadable = False
+
     def __init__(self, expr):
         self._expr = expr
 
     def get(self):
         return self._expr
 
+    def select(self, etree):
+        """Return the raw XPath results for this type."""
+        return compiled_xpath(self.get())(etree)
+
+    def convert(self, results):
+        """Convert raw XPath results into python values."""
+        return results
+
     def run(self, etree):
-        return etree.xpath(self.get())
+        return self.convert(self.select(etree))
+
+    def extract(self, etree):
+        """Return the values this type selects, as a list of strings,
+        for storing in a compiled dataset.
+        """
+        return [string_value(x)
+                for x in compiled_xpath(self.get())(etree)]
+
+    def matches(self, operation, value):
+        """Return a function that checks values from ``extract``
+        against a filter, equivalent to ``where``.
+
+        Returns ``None`` if the filter can't be checked this way.
+        """
+        if operation == 'exists':
+            return lambda values: bool(values) == bool(value)
+        elif operation == 'eq':
+            value = '{}'.format(value)
+            return lambda values: value in values
+        return None
 
     def where(self, operation, value):
         if operation == 'exists':
@@ -0,0 +1,89 @@
+"""asyncio support. This module requires python 3.5+.
+
+Parsing and querying datasets is blocking, CPU-bound work, so it is run
+in an executor. By default, that's a thread pool shared by every
+asynchronous call, with ``WORKERS`` threads. Datasets parsed ahead by
+asynchronous iterators share a semaphore of the same size. That limits
+how many datasets are parsed at once, however many coroutines are
+waiting.
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import threading
+
+from . import instrument
+
+
+WORKERS = 4
+
+_EXECUTOR = None
+_SLOTS = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def default_executor():
+    """Return the shared thread pool, creating it if necessary."""
+    global _EXECUTOR  # pylint: disable=global-statement
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=WORKERS)
+        return _EXECUTOR
+
+
+def parse_slots():
+    """Return the semaphore shared by asynchronous iterators, which
+    limits the datasets they parse ahead to ``WORKERS`` at once.
+    """
+    global _SLOTS  # pylint: disable=global-statement
+    with _EXECUTOR_LOCK:
+        if _SLOTS is None:
+            _SLOTS = threading.BoundedSemaphore(WORKERS)
+        return _SLOTS
+
+
+async def run(func, *args, executor=None):
+    """Call ``func(*args)`` in ``executor``, and return the result."""
+    if executor is None:
+        executor = default_executor()
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, partial(func, *args))
+
+
+class ElementIterator(object):
+    """Asynchronous iterator over the activities or organisations
+    in an ``ElementSet``.
+
+    Each dataset is parsed and queried in the executor, and its
+    results are then yielded one at a time.
+    """
+
+    def __init__(self, element_set, limit=4, executor=None):
+        self._element_set = element_set.prefetch(
+            limit, slots=parse_slots()) if limit else element_set
+        self._executor = executor
+        self._datasets = None
+        self._queries = {}
+        self._buffer = deque()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        element_set = self._element_set
+        while not self._buffer:
+            if self._datasets is None:
+                # pylint: disable=protected-access
+                self._datasets = element_set._datasets(cache=self._queries)
+            item = await run(next, self._datasets, None,
+                             executor=self._executor)
+            if item is None:
+                raise StopAsyncIteration
+            dataset, schema = item
+            # pylint: disable=protected-access
+            items = element_set._items(dataset, schema, self._queries)
+            self._buffer.extend(
+                await run(list, items, executor=self._executor))
+        instrument.emit('objects_yielded')
+        return self._buffer.popleft()
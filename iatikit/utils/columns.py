@@ -0,0 +1,196 @@
+"""Columnar (NumPy) output for activities and organisations.
+
+This module requires numpy, which is an optional dependency.
+"""
+from collections import OrderedDict, namedtuple
+from functools import partial
+import logging
+
+import numpy as np
+
+from .types import parse_date
+
+
+# Dictionary-encoded strings. ``codes`` are indexes into
+# ``categories``, with -1 for missing values.
+Categorical = namedtuple('Categorical', ['codes', 'categories'])
+
+# Variable-length lists. The values for row ``i`` are
+# ``values[offsets[i]:offsets[i + 1]]``, for each array in ``values``.
+Ragged = namedtuple('Ragged', ['offsets', 'values'])
+
+
+class _CategoricalBuilder(object):
+    def __init__(self):
+        self._lookup = {}
+        self._categories = []
+        self._chunks = []
+
+    def encode(self, values):
+        lookup = self._lookup
+        codes = np.empty(len(values), dtype=np.int32)
+        for idx, value in enumerate(values):
+            if value is None:
+                codes[idx] = -1
+                continue
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self._categories)
+                self._categories.append(value)
+            codes[idx] = code
+        return codes
+
+    def add(self, values):
+        self._chunks.append(self.encode(values))
+
+    def finish(self):
+        return Categorical(
+            _concatenate(self._chunks, np.int32),
+            np.array(self._categories, dtype=str))
+
+
+class _DateBuilder(object):
+    def __init__(self):
+        self._chunks = []
+
+    def add(self, values):
+        self._chunks.append(np.array(
+            [value if value is not None else 'NaT' for value in values],
+            dtype='datetime64[D]'))
+
+    def finish(self):
+        return _concatenate(self._chunks, 'datetime64[D]')
+
+
+class _BooleanBuilder(object):
+    def __init__(self):
+        self._chunks = []
+
+    def add(self, values):
+        self._chunks.append(np.array(values, dtype=bool))
+
+    def finish(self):
+        return _concatenate(self._chunks, bool)
+
+
+class _TextBuilder(object):
+    def __init__(self):
+        self._chunks = []
+
+    def add(self, values):
+        self._chunks.append(np.array(values, dtype=object))
+
+    def finish(self):
+        return {'text': _concatenate(self._chunks, object)}
+
+
+class _SectorBuilder(object):
+    def __init__(self):
+        self._codes = _CategoricalBuilder()
+        self._vocabularies = _CategoricalBuilder()
+        self._percentages = []
+
+    def add(self, values):
+        self._codes.add([
+            getattr(sector.code, 'code', sector.code) for sector in values])
+        self._vocabularies.add([
+            sector.vocabulary.code if sector.vocabulary else None
+            for sector in values])
+        self._percentages.append(np.array(
+            [sector.percentage if sector.percentage is not None else np.nan
+             for sector in values], dtype=np.float64))
+
+    def finish(self):
+        return {
+            'code': self._codes.finish(),
+            'vocabulary': self._vocabularies.finish(),
+            'percentage': _concatenate(self._percentages, np.float64),
+        }
+
+
+class _RaggedBuilder(object):
+    """Builds ``Ragged`` columns. The items of every row are flattened,
+    and passed to a builder made by ``items``, whose ``finish``
+    returns a dictionary of arrays.
+    """
+
+    def __init__(self, items):
+        self._lengths = []
+        self._items = items()
+
+    def add(self, values):
+        self._lengths.append(np.array(
+            [len(value) for value in values], dtype=np.int64))
+        self._items.add([item for value in values for item in value])
+
+    def finish(self):
+        lengths = _concatenate(self._lengths, np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return Ragged(offsets, self._items.finish())
+
+
+_BUILDERS = {
+    'id': _CategoricalBuilder,
+    'iati_identifier': _CategoricalBuilder,
+    'org_identifier': _CategoricalBuilder,
+    'version': _CategoricalBuilder,
+    'humanitarian': _BooleanBuilder,
+    'planned_start': _DateBuilder,
+    'actual_start': _DateBuilder,
+    'planned_end': _DateBuilder,
+    'actual_end': _DateBuilder,
+    'start': _DateBuilder,
+    'end': _DateBuilder,
+    'title': partial(_RaggedBuilder, _TextBuilder),
+    'description': partial(_RaggedBuilder, _TextBuilder),
+    'sector': partial(_RaggedBuilder, _SectorBuilder),
+}
+
+
+def parse_dates(date_strs):
+    """Convert a list of ``YYYY-MM-DD`` strings to a ``datetime64[D]``
+    array, with ``NaT`` for invalid dates. Invalid dates are logged,
+    the same way as when activity dates are read.
+
+    Each distinct string is only parsed once.
+    """
+    strings = np.array([str(date_str) for date_str in date_strs], dtype=str)
+    if not len(strings):
+        return np.array([], dtype='datetime64[D]')
+    uniques, inverse = np.unique(strings, return_inverse=True)
+    parsed = [parse_date(date_str) for date_str in uniques.tolist()]
+    dates = np.array(
+        [value if value is not None else 'NaT' for value in parsed],
+        dtype='datetime64[D]')[inverse.reshape(-1)]
+    logger = logging.getLogger(__name__)
+    for idx in np.flatnonzero(np.isnat(dates)):
+        logger.warning('Invalid date: "%s"', strings[idx])
+    return dates
+
+
+def _concatenate(chunks, dtype):
+    if not chunks:
+        return np.array([], dtype=dtype)
+    return np.concatenate(chunks)
+
+
+def build_columns(chunks, fields):
+    """Build a column for each of ``fields``, from ``chunks`` of rows.
+
+    Each chunk is a list of value tuples (typically, one chunk per
+    dataset). Chunks are converted to arrays as they arrive, so python
+    objects are only held for one chunk at a time.
+    """
+    builders = []
+    for field in fields:
+        try:
+            builders.append(_BUILDERS[field]())
+        except KeyError:
+            raise ValueError('Unsupported column: {}'.format(field))
+    for rows in chunks:
+        columns = list(zip(*rows)) if rows else [()] * len(fields)
+        for builder, values in zip(builders, columns):
+            builder.add(list(values))
+    return OrderedDict(
+        (field, builder.finish()) for field, builder in zip(fields, builders))
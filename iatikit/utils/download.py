@@ -1,43 +1,140 @@
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from glob import glob
+import hashlib
 import json
-from os.path import exists, join
-from os import makedirs, unlink as _unlink
+from os.path import basename, dirname, exists, getsize, join, splitext
+from os import makedirs, rename, unlink as _unlink
 import shutil
 import logging
+import threading
+import time
 import zipfile
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
 
 import requests
 import unicodecsv as csv
 
+from ..data.sector import clear_sector_cache
+from ..index.catalog import StreamIndexer
 from ..standard.codelist import CodelistSet
 from .config import CONFIG
+from .exceptions import DownloadError, NoDataError
+from .mapping import close_mappings
+from .pipeline import Pipeline
 from . import helpers
 
 
-def data():
+# downloads from https://andylolz.github.io/iati-data-dump/
+_DATA_DUMP_URL = 'https://www.dropbox.com/s/kkm80yjihyalwes/' + \
+                 'iati_dump.zip?dl=1'
+_CHUNK_SIZE = 65536
+
+
+def _verify_zip(zip_filepath):
+    """Check the zip's central directory is intact, and that
+    every member it lists lies within the file.
+    """
+    size = getsize(zip_filepath)
+    try:
+        with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                if info.header_offset + info.compress_size > size:
+                    raise DownloadError(
+                        'Zip member "{}" is truncated'.format(
+                            info.filename))
+    except zipfile.BadZipfile as error:
+        raise DownloadError('Zip file is corrupt: {}'.format(error))
+
+
+def _extract_and_index(zip_ref, info, path):
+    """Extract a dataset from the zip, feeding it to a
+    ``StreamIndexer`` (in another thread) as it is written to disk.
+    """
+    filepath = join(path, info.filename.lstrip('/'))
+    if not exists(dirname(filepath)):
+        makedirs(dirname(filepath))
+    name = splitext(basename(filepath))[0]
+    publisher = basename(dirname(filepath))
+    pipeline = Pipeline([StreamIndexer(name, publisher)])
+    try:
+        with zip_ref.open(info) as source, \
+                open(filepath, 'wb') as handler:
+            for chunk in iter(lambda: source.read(_CHUNK_SIZE), b''):
+                handler.write(chunk)
+                pipeline.feed(chunk)
+        index = pipeline.close()[0]
+    finally:
+        pipeline.abort()
+    index.save(filepath)
+
+
+def data(url=None, progress=None, retries=5, index=False):
+    """Download and unzip the IATI data dump.
+
+    Interrupted downloads are resumed with range requests, up to
+    ``retries`` times. A partial download left behind by a previous
+    call is also resumed. The zip is checked before anything is
+    extracted, so the current data is left in place if the download
+    is corrupt.
+
+    If provided, ``progress`` is called with the number of bytes
+    downloaded so far, the total size and the throughput in bytes
+    per second.
+
+    If ``index`` is ``True``, datasets are indexed as they are
+    extracted, so the catalog is ready as soon as this returns.
+
+    Returns the SHA-256 hex digest of the downloaded zip.
+    """
     path = CONFIG['paths']['registry']
-    # downloads from https://andylolz.github.io/iati-data-dump/
-    data_url = 'https://www.dropbox.com/s/kkm80yjihyalwes/' + \
-               'iati_dump.zip?dl=1'
-    shutil.rmtree(path, ignore_errors=True)
-    makedirs(path)
-    zip_filepath = join(path, 'iati_dump.zip')
+    data_url = url if url else _DATA_DUMP_URL
+    zip_filepath = join(dirname(path), 'iati_dump.zip')
+    if dirname(path) and not exists(dirname(path)):
+        makedirs(dirname(path))
 
     logging.getLogger(__name__).info('Downloading all IATI registry data...')
-    request = requests.get(data_url, stream=True)
-    with open(zip_filepath, 'wb') as handler:
-        shutil.copyfileobj(request.raw, handler)
+    content_hash = _stream_to_file(data_url, zip_filepath,
+                                   conditional=False, progress=progress,
+                                   retries=retries)
+    logging.getLogger(__name__).info(
+        'Downloaded data dump (sha256: %s)', content_hash)
+    try:
+        _verify_zip(zip_filepath)
+    except DownloadError:
+        _unlink(zip_filepath)
+        raise
+
+    close_mappings(path)
+    shutil.rmtree(path, ignore_errors=True)
+    makedirs(path)
     logging.getLogger(__name__).info('Unzipping data...')
     with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
-        zip_ref.extractall(path)
+        if index:
+            for info in zip_ref.infolist():
+                if info.filename.lstrip('/').startswith('data/') and \
+                        info.filename.endswith('.xml'):
+                    _extract_and_index(zip_ref, info, path)
+                else:
+                    zip_ref.extract(info, path)
+        else:
+            zip_ref.extractall(path)
     logging.getLogger(__name__).info('Cleaning up...')
     _unlink(zip_filepath)
+    if exists(_hidden_path(zip_filepath, '.headers')):
+        _unlink(_hidden_path(zip_filepath, '.headers'))
+    return content_hash
 
 
 def metadata():
     logging.getLogger(__name__).info(
         'Downloading metadata from the IATI registry...')
     path = join(CONFIG['paths']['registry'], 'metadata')
+    close_mappings(path)
     shutil.rmtree(path, ignore_errors=True)
     makedirs(path)
 
@@ -67,6 +164,299 @@ def metadata():
         start += 1000
 
 
+class _HostLimiter(object):
+    """Hand out one semaphore per host, so that no single publisher
+    server gets more than ``per_host`` concurrent requests.
+    """
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(
+                    self.per_host)
+            return self._semaphores[host]
+
+
+def _hidden_path(filepath, suffix):
+    # dotfiles aren't matched by the ``*`` globs that DatasetSet uses
+    return join(dirname(filepath), '.' + basename(filepath) + suffix)
+
+
+def _content_length(request, offset):
+    """Work out the full size of the file being downloaded,
+    from either ``Content-Range`` or ``Content-Length``.
+    """
+    content_range = request.headers.get('Content-Range')
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    content_length = request.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def _range_validator(validators):
+    """Return a validator for the ``If-Range`` header, or ``None``
+    if there isn't a usable one. Weak ETags can't be used.
+    """
+    etag = validators.get('part_etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return validators.get('part_last_modified')
+
+
+def _is_encoded(request):
+    encoding = request.headers.get('Content-Encoding', 'identity')
+    return encoding.strip().lower() != 'identity'
+
+
+def _stream_attempt(url, filepath, timeout, conditional, progress,
+                    indexer):
+    part_filepath = _hidden_path(filepath, '.part')
+    headers_filepath = _hidden_path(filepath, '.headers')
+
+    validators = {}
+    if exists(headers_filepath):
+        with open(headers_filepath) as handler:
+            validators = json.load(handler)
+
+    headers = {}
+    if conditional and exists(filepath):
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    offset = getsize(part_filepath) if exists(part_filepath) else 0
+    if offset:
+        range_validator = _range_validator(validators)
+        if range_validator:
+            # without If-Range, the file could have changed since the
+            # partial download, and we'd splice two versions together
+            headers['Range'] = 'bytes={}-'.format(offset)
+            headers['If-Range'] = range_validator
+            # the partial download holds decoded bytes, so ask
+            # for the rest unencoded, to keep the offsets in step
+            headers['Accept-Encoding'] = 'identity'
+        else:
+            _unlink(part_filepath)
+            offset = 0
+
+    request = requests.get(url, headers=headers, stream=True,
+                           timeout=timeout)
+    try:
+        if request.status_code == 304:
+            return None
+        if request.status_code == 416:
+            # our partial download is no good. Start again
+            request.close()
+            _unlink(part_filepath)
+            return _stream_attempt(url, filepath, timeout, conditional,
+                                   progress, indexer)
+        request.raise_for_status()
+        return _stream_response(request, url, filepath, offset,
+                                validators, progress, indexer)
+    finally:
+        request.close()
+
+
+def _stream_response(request, url, filepath, offset, validators,
+                     progress, indexer):
+    part_filepath = _hidden_path(filepath, '.part')
+    headers_filepath = _hidden_path(filepath, '.headers')
+
+    pipeline = Pipeline([indexer()]) if indexer else None
+    try:
+        content_hash = hashlib.sha256()
+        if request.status_code == 206:
+            mode = 'ab'
+            with open(part_filepath, 'rb') as handler:
+                for chunk in iter(lambda: handler.read(_CHUNK_SIZE), b''):
+                    content_hash.update(chunk)
+                    if pipeline:
+                        pipeline.feed(chunk)
+        else:
+            # the server ignored our range request, so start from scratch
+            mode = 'wb'
+            offset = 0
+        encoded = _is_encoded(request)
+        if encoded:
+            # Content-Length is the size of the encoded body, so it
+            # says nothing about the size of the file
+            total = None
+            encoded_total = _content_length(request, 0)
+        else:
+            total = _content_length(request, offset)
+
+        validators['part_etag'] = request.headers.get('ETag')
+        validators['part_last_modified'] = request.headers.get('Last-Modified')
+        with open(headers_filepath, 'w') as handler:
+            json.dump(validators, handler)
+
+        downloaded = offset
+        started = time.time()
+        with open(part_filepath, mode) as handler:
+            for chunk in request.iter_content(chunk_size=_CHUNK_SIZE):
+                handler.write(chunk)
+                content_hash.update(chunk)
+                if pipeline:
+                    pipeline.feed(chunk)
+                downloaded += len(chunk)
+                if progress is not None:
+                    elapsed = time.time() - started
+                    rate = (downloaded - offset) / elapsed if elapsed else None
+                    progress(downloaded, total, rate)
+
+        index = pipeline.close()[0] if pipeline else None
+    finally:
+        # stop the indexer's thread, if the stream failed
+        if pipeline is not None:
+            pipeline.abort()
+    if encoded:
+        # compare the encoded bytes that came over the wire
+        received, expected = request.raw.tell(), encoded_total
+    else:
+        received, expected = downloaded, total
+    if expected is not None and received != expected:
+        raise DownloadError(
+            'Download of {} is incomplete: got {} of {} bytes'.format(
+                url, received, expected))
+
+    close_mappings(filepath)
+    if exists(filepath):
+        _unlink(filepath)
+    rename(part_filepath, filepath)
+    with open(headers_filepath, 'w') as handler:
+        json.dump({
+            'etag': request.headers.get('ETag'),
+            'last_modified': request.headers.get('Last-Modified'),
+        }, handler)
+    if index is not None:
+        index.save(filepath)
+    return content_hash.hexdigest()
+
+
+def _stream_to_file(url, filepath, timeout=None, conditional=True,
+                    progress=None, retries=0, indexer=None):
+    """Stream ``url`` to ``filepath``.
+
+    The download is written to a hidden ``.part`` file first, which
+    is resumed with a range request if the connection drops (up to
+    ``retries`` times), or if a previous call was interrupted.
+    Validators (``ETag`` and ``Last-Modified``) are kept in a hidden
+    ``.headers`` file, and used to make conditional requests on
+    subsequent calls.
+
+    If provided, ``progress`` is called after every chunk with the
+    number of bytes downloaded so far, the total size (or ``None`` if
+    unknown) and the current throughput in bytes per second.
+
+    If provided, ``indexer`` is called to construct a
+    ``StreamIndexer``, which is fed the data as it arrives. The
+    resulting index is saved alongside the file.
+
+    Returns the SHA-256 hex digest of the file, or ``None`` if the
+    server reported it was unchanged.
+    """
+    attempt = 0
+    while True:
+        try:
+            return _stream_attempt(url, filepath, timeout, conditional,
+                                   progress, indexer)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout,
+                DownloadError) as error:
+            attempt += 1
+            if attempt > retries:
+                raise
+            logging.getLogger(__name__).warning(
+                'Download interrupted (%s). Resuming...', error)
+            time.sleep(min(2 ** attempt, 60))
+
+
+def datasets(publishers=None, workers=8, per_host=2, timeout=60,
+             index=False):
+    """Download datasets directly from the URLs publishers
+    registered, rather than from the data dump.
+
+    Registry metadata must already have been downloaded, using
+    ``metadata()``. Files are written to the same
+    ``data/<publisher>/<dataset>.xml`` layout as ``data()``.
+
+    ``publishers`` is an optional list of publisher names to refresh.
+    Up to ``workers`` datasets are fetched in parallel, with at most
+    ``per_host`` requests to any one host at a time.
+
+    If ``index`` is ``True``, each dataset is indexed as it downloads.
+
+    Returns a dictionary mapping each dataset name to one of
+    ``"downloaded"``, ``"not modified"`` or ``"failed"``.
+    """
+    path = CONFIG['paths']['registry']
+    metadata_path = join(path, 'metadata')
+    if not exists(metadata_path):
+        error_msg = 'Error: No metadata found! ' + \
+                    'Download fresh metadata ' + \
+                    'using:\n\n   ' + \
+                    '>>> iatikit.download.metadata()\n'
+        raise NoDataError(error_msg)
+
+    jobs = []
+    for dataset_metadata_path in sorted(
+            glob(join(metadata_path, '*', '*.json'))):
+        publisher_name = basename(dirname(dataset_metadata_path))
+        if publishers is not None and publisher_name not in publishers:
+            continue
+        with open(dataset_metadata_path) as handler:
+            resources = json.load(handler).get('resources')
+        if not resources or not resources[0].get('url'):
+            continue
+        dataset_name = splitext(basename(dataset_metadata_path))[0]
+        filepath = join(path, 'data', publisher_name, dataset_name + '.xml')
+        jobs.append((publisher_name, dataset_name,
+                     resources[0]['url'], filepath))
+
+    host_limiter = _HostLimiter(per_host)
+
+    def fetch(job):
+        publisher_name, dataset_name, url, filepath = job
+        if not exists(dirname(filepath)):
+            try:
+                makedirs(dirname(filepath))
+            except OSError:
+                # another worker got there first
+                if not exists(dirname(filepath)):
+                    raise
+        indexer = None
+        if index:
+            indexer = partial(StreamIndexer, dataset_name, publisher_name)
+        try:
+            with host_limiter(url):
+                updated = _stream_to_file(url, filepath, timeout=timeout,
+                                          indexer=indexer)
+        except (requests.exceptions.RequestException, DownloadError,
+                IOError) as error:
+            logging.getLogger(__name__).warning(
+                'Failed to download dataset "%s": %s', dataset_name, error)
+            return dataset_name, 'failed'
+        if updated is None:
+            return dataset_name, 'not modified'
+        return dataset_name, 'downloaded'
+
+    logging.getLogger(__name__).info(
+        'Downloading %d datasets from publishers...', len(jobs))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(fetch, jobs))
+
+
 _VERY_OLD_IATI_VERSIONS = ['1.01', '1.02']
 _VERY_OLD_CODELISTS_URL = 'http://codelists102.archive.iatistandard.org' + \
                          '/data/codelist.csv'
@@ -97,6 +487,7 @@ def _get_codelist_mappings(versions):
             raise Exception(mapping['codelist'])
 
     path = join(CONFIG['paths']['standard'], 'codelist_mappings')
+    close_mappings(path)
     shutil.rmtree(path, ignore_errors=True)
     makedirs(path)
 
@@ -169,6 +560,7 @@ def codelists():
         return version_codelist
 
     path = join(CONFIG['paths']['standard'], 'codelists')
+    close_mappings(path)
     shutil.rmtree(path, ignore_errors=True)
     makedirs(path)
 
@@ -217,12 +609,14 @@ def codelists():
 
         with open(join(path, codelist_name + '.json'), 'w') as handler:
             json.dump(codelist, handler)
+    clear_sector_cache()
 
     _get_codelist_mappings(all_versions)
 
 
 def schemas():
     path = join(CONFIG['paths']['standard'], 'schemas')
+    close_mappings(path)
     shutil.rmtree(path, ignore_errors=True)
     makedirs(path)
 
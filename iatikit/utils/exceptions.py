@@ -13,6 +13,11 @@ class NoDataError(Exception):
     pass
 
 
+class DownloadError(Exception):
+    """Raised when a download is incomplete or corrupt."""
+    pass
+
+
 class NoCodelistsError(Exception):
     """Raised when no codelists are found in the local cache."""
     pass
@@ -0,0 +1,189 @@
+from collections import deque
+import logging
+import re
+import threading
+import time
+
+from .config import CONFIG
+
+
+# Rough average size of an activity or organisation, in bytes.
+# Used to estimate element counts for datasets that aren't indexed.
+_AVERAGE_ELEMENT_SIZE = 2000
+# Relative cost of evaluating one predicate clause on one element,
+# compared to parsing one byte.
+_CLAUSE_COST = 100
+_CLAUSE_RE = re.compile(r'\[| or | and |=|<|>')
+
+# The most recent slow queries, most recent last.
+slow_queries = deque(maxlen=100)
+# Per-thread count of queries currently running (i.e. not paused).
+# Queries started inside another query (e.g. iterating datasets, while
+# iterating activities) aren't tracked separately.
+_RUNNING = {}
+_RUNNING_LOCK = threading.Lock()
+
+
+def _running(thread_id, change=0):
+    with _RUNNING_LOCK:
+        count = _RUNNING.get(thread_id, 0) + change
+        if count:
+            _RUNNING[thread_id] = count
+        else:
+            _RUNNING.pop(thread_id, None)
+        return count
+
+
+def count_clauses(query):
+    """Return a rough count of the predicate clauses in an
+    XPath query.
+    """
+    return len(_CLAUSE_RE.findall(query))
+
+
+class QueryPlan(object):
+    """Class describing how a query will be run: the compiled
+    XPath query per IATI version, the datasets it will touch,
+    and an estimate of the cost.
+
+    Costs are in relative units (roughly, bytes processed), and are
+    only meant for comparing queries with each other.
+    """
+
+    def __init__(self, target, filters, queries=None, datasets=None):
+        self.target = target
+        self.filters = filters
+        self.queries = queries if queries is not None else {}
+        self.datasets = datasets if datasets is not None else []
+
+    def add_dataset(self, name, size, version=None, elements=None,
+                    query=None, parse=True, compiled=False):
+        """Add a dataset to the plan, estimating the cost of
+        running ``query`` against it.
+
+        Pass ``parse=False`` if the dataset won't need to be parsed,
+        or ``compiled=True`` if the query will be checked against its
+        compiled form instead.
+        """
+        if elements is None:
+            elements = size // _AVERAGE_ELEMENT_SIZE
+        cost = 0
+        if parse:
+            clauses = count_clauses(query) if query else 0
+            cost = elements * clauses * _CLAUSE_COST
+            if not compiled:
+                cost += size
+        self.datasets.append({
+            'name': name,
+            'version': version,
+            'bytes': size,
+            'elements': elements,
+            'compiled': compiled,
+            'cost': cost,
+        })
+
+    @property
+    def estimated_cost(self):
+        return sum(dataset['cost'] for dataset in self.datasets)
+
+    def to_dict(self):
+        return {
+            'target': self.target,
+            'filters': {k: repr(v) for k, v in self.filters.items()},
+            'queries': self.queries,
+            'datasets': self.datasets,
+            'estimated_cost': self.estimated_cost,
+        }
+
+    def __repr__(self):
+        return '<{} ({}, {} datasets, cost {})>'.format(
+            self.__class__.__name__, self.target,
+            len(self.datasets), self.estimated_cost)
+
+    def __str__(self):
+        lines = ['Query plan for {}'.format(self.target)]
+        if self.filters:
+            lines.append('Filters:')
+            for key, value in sorted(self.filters.items()):
+                lines.append('  {}: {!r}'.format(key, value))
+        if self.queries:
+            lines.append('Compiled queries:')
+            for version, query in sorted(self.queries.items()):
+                label = 'all versions' if version == '*' else 'v' + version
+                lines.append('  {}: {}'.format(label, query))
+        lines.append('Datasets: {:,} ({:,} bytes)'.format(
+            len(self.datasets),
+            sum(dataset['bytes'] for dataset in self.datasets)))
+        lines.append('Estimated cost: {:,}'.format(self.estimated_cost))
+        return '\n'.join(lines)
+
+
+def slow_query_threshold():
+    """Return the slow query threshold in seconds, from the
+    ``[query_log]`` section of the config, or ``None`` if the
+    slow query log is disabled.
+    """
+    threshold = CONFIG.get('query_log', 'threshold', fallback=None)
+    if not threshold:
+        return None
+    return float(threshold)
+
+
+class QueryTracker(object):
+    """Times a query, and logs it (along with its plan) if it takes
+    longer than the slow query threshold.
+
+    Iteration can be paused while control is handed back to the
+    caller, so that only time spent inside the query is counted.
+    """
+
+    def __init__(self, query_set, operation):
+        self.query_set = query_set
+        self.operation = operation
+        self.threshold = None
+        if not _running(threading.current_thread().ident):
+            self.threshold = slow_query_threshold()
+        self.elapsed = 0.
+        self.results = 0
+        self._started = None
+        self._thread_id = None
+
+    def __enter__(self):
+        self.resume()
+        return self
+
+    def pause(self):
+        if self._started is not None:
+            self.elapsed += time.time() - self._started
+            self._started = None
+            # generators may be resumed on a different thread, so
+            # this isn't necessarily the current thread
+            _running(self._thread_id, -1)
+
+    def resume(self):
+        if self.threshold is not None:
+            self._started = time.time()
+            self._thread_id = threading.current_thread().ident
+            _running(self._thread_id, 1)
+
+    def __exit__(self, *args):
+        self.pause()
+        if self.threshold is None or self.elapsed < self.threshold:
+            return
+        # don't track the queries run to build the plan
+        thread_id = threading.current_thread().ident
+        _running(thread_id, 1)
+        try:
+            plan = self.query_set.explain()
+        finally:
+            _running(thread_id, -1)
+        record = {
+            'operation': self.operation,
+            'seconds': self.elapsed,
+            'results': self.results,
+            'plan': plan.to_dict(),
+        }
+        slow_queries.append(record)
+        logging.getLogger(__name__).warning(
+            'Slow query (%s took %.3fs, %d results):\n%s',
+            self.operation, self.elapsed, self.results, plan)
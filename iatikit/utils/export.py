@@ -0,0 +1,190 @@
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from contextlib import ExitStack
+except ImportError:
+    # python 2
+    from contextlib2 import ExitStack
+from datetime import date, datetime
+import gzip
+import json
+from os import close, unlink
+from os.path import basename, dirname
+import shutil
+import tempfile
+
+from lxml import etree as ET
+import unicodecsv as csv
+
+from .config import CONFIG
+
+
+FORMATS = ('csv', 'jsonl')
+
+
+def _json_value(value):
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, 'vocabulary') and hasattr(value, 'percentage'):
+        # a sector
+        return {
+            'code': getattr(value.code, 'code', value.code),
+            'vocabulary': value.vocabulary.code if value.vocabulary else None,
+            'percentage': value.percentage,
+        }
+    if hasattr(value, 'tag'):
+        return ET.tostring(value).decode('utf-8')
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ';'.join(_csv_value(item) for item in value)
+    value = _json_value(value)
+    if isinstance(value, dict):
+        return value['code']
+    return value
+
+
+class _Writer(object):
+    # pylint: disable=redefined-builtin
+    def __init__(self, handler, fields, format, header=True):
+        self.handler = handler
+        self.fields = fields
+        self.format = format
+        if format == 'csv':
+            self._csv = csv.writer(handler, encoding='utf-8')
+            if header:
+                self._csv.writerow(fields)
+
+    def write(self, values):
+        if self.format == 'csv':
+            self._csv.writerow([_csv_value(value) for value in values])
+        else:
+            record = {field: _json_value(value)
+                      for field, value in zip(self.fields, values)}
+            line = json.dumps(record, ensure_ascii=False) + '\n'
+            self.handler.write(line.encode('utf-8'))
+
+
+def _open(path, compress):
+    if compress == 'gzip':
+        return gzip.open(path, 'wb')
+    return open(path, 'wb')
+
+
+def _export_dataset(job):
+    """Export one dataset to a temporary file. Run in a worker process.
+
+    Returns the path of the temporary file, and the number
+    of rows written.
+    """
+    from ..data.dataset import Dataset
+
+    # pylint: disable=redefined-builtin
+    set_class, conditions, wheres, paths, fields, format, config, \
+        tmp_dir = job
+    CONFIG.read_dict(config)
+    dataset = Dataset(*paths)
+    handle, part_path = tempfile.mkstemp(dir=tmp_dir)
+    close(handle)
+    rows = 0
+    with open(part_path, 'wb') as handler:
+        writer = _Writer(handler, fields, format, header=False)
+        for values in set_class(
+                [dataset], *conditions, **wheres).records(fields):
+            writer.write(values)
+            rows += 1
+    return part_path, rows
+
+
+def export(element_set, path, fields, format='csv', compress=None,
+           processes=None):  # pylint: disable=redefined-builtin
+    """Write ``fields`` for each item in ``element_set`` to ``path``.
+
+    See ``ElementSet.export``. Returns the number of rows written.
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown export format: {}'.format(format))
+    if compress is None and path.endswith('.gz'):
+        compress = 'gzip'
+    if compress not in (None, False, 'gzip'):
+        raise ValueError('Unknown compression: {}'.format(compress))
+    fields = list(fields)
+    rows = 0
+    with _open(path, compress) as handler:
+        writer = _Writer(handler, fields, format)
+        if not processes or processes == 1:
+            for values in element_set.records(fields):
+                writer.write(values)
+                rows += 1
+            return rows
+
+        config = {section: dict(CONFIG.items(section))
+                  for section in CONFIG.sections()}
+        tmp_dir = tempfile.mkdtemp(
+            dir=dirname(path) or None, prefix='.' + basename(path))
+        try:
+            jobs = ((element_set.__class__, element_set.conditions,
+                     element_set.wheres,
+                     (dataset.data_path, dataset.metadata_path),
+                     fields, format, config, tmp_dir)
+                    for dataset in element_set.datasets)
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                # parts are appended in dataset order
+                for part_path, part_rows in executor.map(
+                        _export_dataset, jobs):
+                    with open(part_path, 'rb') as part:
+                        shutil.copyfileobj(part, handler)
+                    unlink(part_path)
+                    rows += part_rows
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return rows
+
+
+def write_xml(element_set, path):
+    """Stream each item in ``element_set`` to an IATI XML file.
+
+    See ``ElementSet.write_xml``. Returns a dictionary of
+    the number of items written to each file.
+    """
+    # pylint: disable=protected-access
+    root_tag, _ = element_set._element.strip('/').split('/')
+    generated = datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+    per_version = '{version}' in path
+    counts = {}
+    try:
+        with ExitStack() as stack:
+            writers = {}
+            for item in element_set:
+                writer = writers.get(item.version)
+                if writer is None:
+                    if writers and not per_version:
+                        raise ValueError(
+                            'This set includes more than one IATI version, '
+                            'but only one version can be written to each '
+                            'file. Add "{version}" to the path, to write '
+                            'one file per version.')
+                    output_path = path.format(version=item.version)
+                    xml_file = stack.enter_context(
+                        ET.xmlfile(output_path, encoding='utf-8'))
+                    xml_file.write_declaration()
+                    stack.enter_context(xml_file.element(root_tag, {
+                        'version': item.version,
+                        'generated-datetime': generated,
+                    }))
+                    writer = writers[item.version] = xml_file
+                    counts[output_path] = 0
+                writer.write(item.etree)
+                counts[path.format(version=item.version)] += 1
+    except ValueError:
+        for output_path in counts:
+            unlink(output_path)
+        raise
+    return counts
@@ -0,0 +1,113 @@
+from .exceptions import FilterError
+
+
+class Q(object):
+    """A combination of filters, for passing to ``where()``.
+
+    The filters in a single ``Q`` must all match. ``Q`` objects can
+    be combined with ``&`` (and), ``|`` (or) and ``~`` (not), e.g.
+    ``Q(humanitarian=True) | ~Q(version='1.03')``.
+    """
+
+    def __init__(self, **kwargs):
+        self.operator = 'and'
+        self.children = [(key, kwargs[key]) for key in sorted(kwargs)]
+
+    @classmethod
+    def _combine(cls, operator, children):
+        out = cls()
+        out.operator = operator
+        out.children = children
+        return out
+
+    def __and__(self, other):
+        return self._combine('and', [self, _check(other)])
+
+    def __or__(self, other):
+        return self._combine('or', [self, _check(other)])
+
+    def __invert__(self):
+        return self._combine('not', [self])
+
+    def __repr__(self):
+        return '<{} ({})>'.format(self.__class__.__name__, self._describe())
+
+    def _describe(self):
+        parts = [child._describe() if isinstance(child, Q)
+                 else '{}={!r}'.format(*child) for child in self.children]
+        if self.operator == 'not':
+            return 'NOT ({})'.format(parts[0])
+        return ' {} '.format(self.operator.upper()).join(
+            '({})'.format(part) if ' ' in part else part for part in parts)
+
+    def filters(self):
+        """Yield the name of every filter in this combination."""
+        for child in self.children:
+            if isinstance(child, Q):
+                for key in child.filters():
+                    yield key
+            else:
+                yield child[0]
+
+    def bounds(self, find, everything):
+        """Evaluate this combination as a bitmap, and return the
+        ``(lower, upper)`` bounds of the result.
+
+        ``find(key, value)`` returns the bitmap of items matching a
+        single filter, or ``None`` if it isn't known. Unknown filters
+        could match anything in ``everything``, so the result is only
+        exact if ``lower == upper``.
+        """
+        bounds = []
+        for child in self.children:
+            if isinstance(child, Q):
+                bounds.append(child.bounds(find, everything))
+                continue
+            bitmap = find(*child)
+            bounds.append((0, everything) if bitmap is None
+                          else (bitmap, bitmap))
+        if self.operator == 'not':
+            lower, upper = bounds[0]
+            return everything & ~upper, everything & ~lower
+        lower, upper = bounds[0] if bounds else (everything, everything)
+        for child_lower, child_upper in bounds[1:]:
+            if self.operator == 'and':
+                lower, upper = lower & child_lower, upper & child_upper
+            else:
+                lower, upper = lower | child_lower, upper | child_upper
+        return lower, upper
+
+    def xpath(self, predicate):
+        """Return this combination as an XPath predicate.
+
+        ``predicate(key, value)`` returns the XPath for a single filter,
+        or ``True`` or ``False`` if it's already known to match or not.
+        If the whole combination is known, ``True`` or ``False`` is
+        returned instead of an XPath.
+        """
+        parts = []
+        for child in self.children:
+            if isinstance(child, Q):
+                parts.append(child.xpath(predicate))
+            else:
+                parts.append(predicate(*child))
+        if self.operator == 'not':
+            part = parts[0]
+            return (not part) if isinstance(part, bool) \
+                else 'not({})'.format(part)
+        known = True if self.operator == 'and' else False
+        if (not known) in parts:
+            return not known
+        parts = [part for part in parts if not isinstance(part, bool)]
+        if not parts:
+            return known
+        if len(parts) == 1:
+            return parts[0]
+        return ' {} '.format(self.operator).join(
+            '({})'.format(part) for part in parts)
+
+
+def _check(value):
+    if not isinstance(value, Q):
+        raise FilterError('{!r} is not a Q object'.format(value))
+    return value
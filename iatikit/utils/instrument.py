@@ -0,0 +1,146 @@
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+
+
+_LISTENERS = []
+
+
+def subscribe(listener):
+    """Register a callable to receive instrumentation events.
+
+    Listeners are called with the event name, and a dictionary of
+    event data. The data always includes ``value`` (a count, e.g.
+    number of bytes) and may include ``seconds`` (a duration), plus
+    other tags (e.g. ``dataset``).
+    """
+    if listener not in _LISTENERS:
+        _LISTENERS.append(listener)
+
+
+def unsubscribe(listener):
+    """Stop sending instrumentation events to ``listener``."""
+    if listener in _LISTENERS:
+        _LISTENERS.remove(listener)
+
+
+def enabled():
+    """Return ``True`` if anything is listening for events.
+
+    Instrumented code checks this first, so that instrumentation
+    costs (almost) nothing when it isn't being used.
+    """
+    return bool(_LISTENERS)
+
+
+def emit(event, value=1, seconds=None, **tags):
+    """Send an event to all listeners."""
+    if not _LISTENERS:
+        return
+    data = dict(tags, value=value)
+    if seconds is not None:
+        data['seconds'] = seconds
+    for listener in list(_LISTENERS):
+        listener(event, data)
+
+
+class timer(object):  # pylint: disable=invalid-name
+    """Context manager that emits an event with the time
+    taken by the enclosed block.
+    """
+
+    def __init__(self, event, value=1, **tags):
+        self.event = event
+        self.value = value
+        self.tags = tags
+        self._started = None
+
+    def __enter__(self):
+        if _LISTENERS:
+            self._started = time.time()
+        return self
+
+    def __exit__(self, *args):
+        if self._started is not None:
+            emit(self.event, self.value,
+                 seconds=time.time() - self._started, **self.tags)
+
+
+class Recorder(object):
+    """Instrumentation listener that aggregates events into counters
+    and timings, plus a per-dataset breakdown of parsing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+        self.datasets = {}
+
+    def __call__(self, event, data):
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + \
+                data['value']
+            seconds = data.get('seconds')
+            if seconds is not None:
+                timing = self.timings.setdefault(
+                    event, {'count': 0, 'total': 0., 'max': 0.})
+                timing['count'] += 1
+                timing['total'] += seconds
+                timing['max'] = max(timing['max'], seconds)
+            dataset = data.get('dataset')
+            if dataset is not None:
+                stats = self.datasets.setdefault(dataset, {})
+                stats[event] = stats.get(event, 0) + data['value']
+                if seconds is not None:
+                    key = event + '_seconds'
+                    stats[key] = stats.get(key, 0.) + seconds
+
+    def summary(self):
+        """Return a (JSON-serialisable) summary of all events
+        recorded so far.
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': {k: dict(v) for k, v in self.timings.items()},
+                'datasets': {k: dict(v) for k, v in self.datasets.items()},
+            }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.summary(), **kwargs)
+
+    def log(self, logger=None, level=logging.INFO):
+        """Log the counters and timings."""
+        if logger is None:
+            logger = logging.getLogger(__name__)
+        summary = self.summary()
+        for event, count in sorted(summary['counters'].items()):
+            timing = summary['timings'].get(event)
+            if timing:
+                logger.log(level, '%s: %d (%.3fs total, %.3fs max)',
+                           event, count, timing['total'], timing['max'])
+            else:
+                logger.log(level, '%s: %d', event, count)
+
+
+@contextmanager
+def instrument(listener=None):
+    """Context manager that records instrumentation events
+    raised inside it.
+
+    Yields the listener (a new ``Recorder``, if one isn't provided)::
+
+        with instrument() as recorder:
+            registry.activities.where(sector=sector).count()
+        recorder.log()
+    """
+    if listener is None:
+        listener = Recorder()
+    subscribe(listener)
+    try:
+        yield listener
+    finally:
+        unsubscribe(listener)
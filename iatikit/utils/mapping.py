@@ -0,0 +1,71 @@
+"""Shared, read-only memory maps of dataset files.
+
+Each open map holds a file descriptor, so only the ``MAX_OPEN`` most
+recently used maps are kept. A map that's dropped is closed once
+nothing is reading from it.
+"""
+from collections import OrderedDict
+import mmap
+from os import stat
+from os.path import abspath, join
+import threading
+
+
+MAX_OPEN = 64
+
+_MAPPINGS = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def open_mapping(path):
+    """Return a read-only memory map of the file at ``path``, shared
+    with every other caller for the same (unchanged) file.
+
+    Returns ``None`` if the file is empty, since empty files
+    can't be mapped.
+    """
+    stats = stat(path)
+    key = (stats.st_mtime, stats.st_size)
+    with _LOCK:
+        cached = _MAPPINGS.pop(path, None)
+        if cached is not None and cached[0] == key:
+            # move it to the end, as the most recently used
+            _MAPPINGS[path] = cached
+            return cached[1]
+    if not stats.st_size:
+        return None
+    with open(path, 'rb') as handler:
+        mapping = mmap.mmap(handler.fileno(), 0, access=mmap.ACCESS_READ)
+    with _LOCK:
+        _MAPPINGS.pop(path, None)
+        _MAPPINGS[path] = (key, mapping)
+        while len(_MAPPINGS) > MAX_OPEN:
+            _MAPPINGS.popitem(last=False)
+    return mapping
+
+
+def close_mappings(path):
+    """Close the shared maps of the file at ``path`` (or of every file
+    under it, if it's a directory), e.g. before it's overwritten.
+    Windows doesn't allow a file to be replaced while it's mapped.
+    """
+    path = abspath(path)
+    with _LOCK:
+        paths = [key for key in _MAPPINGS
+                 if abspath(key) == path or
+                 abspath(key).startswith(join(path, ''))]
+        closing = [_MAPPINGS.pop(key)[1] for key in paths]
+    for mapping in closing:
+        try:
+            mapping.close()
+        except BufferError:
+            # it's still being read from (e.g. by a compiled dataset)
+            pass
+
+
+def chunks(mapping, size=65536):
+    """Yield successive ``size``-byte chunks of ``mapping``,
+    for feeding to a feed parser.
+    """
+    for start in range(0, len(mapping), size):
+        yield mapping[start:start + size]
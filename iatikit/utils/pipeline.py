@@ -0,0 +1,88 @@
+import threading
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+
+_DONE = object()
+_ABORT = object()
+
+
+class Pipeline(object):
+    """Fan a stream of byte chunks out to a number of stages.
+
+    Each stage runs in its own thread, and is connected to the
+    pipeline by a bounded queue. If a stage falls behind, ``feed``
+    blocks until it catches up, so memory use stays bounded.
+
+    A stage is any object with ``feed(chunk)`` and ``close()``
+    methods. The return values of each stage's ``close()`` are
+    returned by ``Pipeline.close()``.
+    """
+
+    def __init__(self, stages, maxsize=16):
+        self._stages = stages
+        self._queues = [Queue(maxsize) for _ in stages]
+        self._results = [None for _ in stages]
+        self._errors = [None for _ in stages]
+        self._finished = False
+        self._threads = [
+            threading.Thread(target=self._run, args=(idx,))
+            for idx in range(len(stages))]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _run(self, idx):
+        stage = self._stages[idx]
+        queue = self._queues[idx]
+        while True:
+            chunk = queue.get()
+            if chunk is _ABORT:
+                return
+            if chunk is _DONE:
+                break
+            if self._errors[idx] is not None:
+                # keep draining, so feed() never blocks
+                continue
+            try:
+                stage.feed(chunk)
+            except Exception as error:  # pylint: disable=broad-except
+                self._errors[idx] = error
+        if self._errors[idx] is None:
+            try:
+                self._results[idx] = stage.close()
+            except Exception as error:  # pylint: disable=broad-except
+                self._errors[idx] = error
+
+    def feed(self, chunk):
+        for queue in self._queues:
+            queue.put(chunk)
+
+    def _finish(self, message):
+        if self._finished:
+            return
+        self._finished = True
+        for queue in self._queues:
+            queue.put(message)
+        for thread in self._threads:
+            thread.join()
+
+    def close(self):
+        """Wait for every stage to finish, and return their results.
+
+        If any stage raised an exception, it is re-raised here.
+        """
+        self._finish(_DONE)
+        for error in self._errors:
+            if error is not None:
+                raise error
+        return self._results
+
+    def abort(self):
+        """Stop every stage without closing it, e.g. if the stream
+        fails part way through. Does nothing if the pipeline has
+        already been closed.
+        """
+        self._finish(_ABORT)
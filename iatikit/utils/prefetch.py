@@ -0,0 +1,59 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def prefetch(items, load, ahead=4, max_bytes=None, size=None,
+             slots=None):
+    """Yield ``(item, load(item))`` for each of ``items``, in order.
+
+    ``load`` is called in a pool of background threads, up to ``ahead``
+    items in advance of the item currently being consumed.
+
+    If ``max_bytes`` is given, items are only loaded in advance while
+    the total ``size(item)`` of loaded (but not yet consumed) items stays
+    under it. The next item is always loaded, however large it is.
+
+    If ``slots`` (a semaphore) is given, each call to ``load`` holds
+    it, so a semaphore shared between calls limits how many items
+    are loaded at once across all of them.
+    """
+    if slots is not None:
+        unlimited_load = load
+
+        def load(item):  # pylint: disable=function-redefined
+            with slots:
+                return unlimited_load(item)
+
+    items = iter(items)
+    pending = deque()
+    held = None
+    exhausted = False
+    loaded_bytes = 0
+    executor = ThreadPoolExecutor(max_workers=ahead)
+    try:
+        while True:
+            while not exhausted and len(pending) < ahead:
+                if held is None:
+                    try:
+                        held = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                item_bytes = size(held) if size is not None else 0
+                if pending and max_bytes is not None and \
+                        loaded_bytes + item_bytes > max_bytes:
+                    break
+                pending.append((held, item_bytes,
+                                executor.submit(load, held)))
+                loaded_bytes += item_bytes
+                held = None
+            if not pending:
+                return
+            item, item_bytes, future = pending.popleft()
+            yield item, future.result()
+            # the caller has moved on, so this item no longer counts
+            loaded_bytes -= item_bytes
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
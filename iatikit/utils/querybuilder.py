@@ -4,10 +4,10 @@ class XPathQueryBuilder(object):
         self._count = count
         self._prefix = prefix
 
-    def where(self, **kwargs):
+    def where(self, *predicates, **kwargs):
         query_str = self._prefix
 
-        exprs = []
+        exprs = list(predicates)
         for shortcut, values in kwargs.items():
             if '__' in shortcut:
                 shortcut, operator = shortcut.split('__')
@@ -0,0 +1,76 @@
+import re
+
+from .abstract import GenericType, compiled_xpath
+
+
+# An expression that starts by selecting (some of) the children
+# with a particular tag, e.g. ``activity-date[@type="1"]/@iso-date``.
+_CHILD_STEP_RE = re.compile(
+    r'^(?P<tag>[A-Za-z_][\w.-]*)(?P<predicate>\[[^\]]*\])?'
+    r'(?:/(?P<rest>.+))?$')
+
+
+class RecordReader(object):
+    """Extracts several schema fields from an element, in a single
+    pass over its children.
+
+    Each field's XPath expression is split into the child tag it
+    starts from, and the rest of the expression. The rest is only
+    evaluated against children with that tag. Fields that can't be
+    split (e.g. ones that read attributes of the element itself) are
+    evaluated against the whole element, as usual.
+    """
+
+    def __init__(self, schema, fields):
+        self.schema = schema
+        self._types = {}
+        self._by_tag = {}
+        self._direct = []
+        for field in fields:
+            accessor = getattr(schema, field, None)
+            if not callable(accessor) or field in self._types:
+                continue
+            type_ = accessor()
+            if not isinstance(type_, GenericType) or not type_.get():
+                continue
+            self._types[field] = type_
+            match = None
+            if type(type_).select == GenericType.select:
+                match = _CHILD_STEP_RE.match(type_.get())
+            if match is None:
+                self._direct.append(field)
+                continue
+            tag, predicate, rest = match.group('tag', 'predicate', 'rest')
+            expr = None
+            if predicate or rest:
+                expr = 'self::' + tag + (predicate or '')
+                if rest:
+                    expr += '/' + rest
+            self._by_tag.setdefault(tag, []).append((field, expr))
+
+    @property
+    def fields(self):
+        """Return the names of the fields this reader extracts."""
+        return list(self._types.keys())
+
+    def read(self, element):
+        """Return a dictionary of field values for ``element``."""
+        results = {field: [] for field in self._types
+                   if field not in self._direct}
+        by_tag = self._by_tag
+        for child in element:
+            readers = by_tag.get(child.tag)
+            if readers is None:
+                continue
+            for field, expr in readers:
+                if expr is None:
+                    results[field].append(child)
+                else:
+                    results[field].extend(compiled_xpath(expr)(child))
+        values = {}
+        for field, type_ in self._types.items():
+            if field in self._direct:
+                values[field] = type_.run(element)
+            else:
+                values[field] = type_.convert(results[field])
+        return values
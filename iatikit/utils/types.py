@@ -1,9 +1,80 @@
 import logging
-from datetime import datetime
+from datetime import date, datetime
+import operator as operators
+import re
+
+from past.builtins import unicode
 
 from ..data.sector import Sector
-from ..standard.codelist import CodelistSet, CodelistItem
-from ..utils.abstract import GenericType
+from ..standard.codelist import CodelistItem, sector_categories
+from ..utils.abstract import GenericType, code_set_name, compiled_xpath
+from ..utils.exceptions import FilterError
+
+
+# An XPath number, surrounded by (optional) whitespace
+_XPATH_NUMBER_RE = re.compile(
+    r'^[ \t\r\n]*(-?(?:\d+(?:\.\d*)?|\.\d+))[ \t\r\n]*$')
+
+
+def _xpath_number(value):
+    """Convert a string to a number, like the XPath ``number()``
+    function. Returns NaN if the string isn't a number.
+    """
+    match = _XPATH_NUMBER_RE.match(value)
+    if match is None:
+        return float('nan')
+    return float(match.group(1))
+
+
+def date_number(value):
+    """Convert a date string to a number, the way date filters do
+    in XPath, e.g. ``"2020-01-31"`` becomes ``20200131``. Returns NaN
+    if it isn't a number.
+    """
+    return _xpath_number(value.replace('-', ''))
+
+
+DATE_CACHE_SIZE = 4096
+
+# date string -> python date (or ``None``)
+_DATES = {}
+
+# Sector categories with up to this many codes are
+# filtered with inline XPath comparisons
+_INLINE_CODES = 6
+
+
+def _parse_date(date_str):
+    if len(date_str) == 10 and date_str[4] == '-' and \
+            date_str[7] == '-' and \
+            all(c in '0123456789-' for c in date_str):
+        try:
+            return date(int(date_str[:4]), int(date_str[5:7]),
+                        int(date_str[8:]))
+        except ValueError:
+            return None
+    # anything else gets the (slower, but more lenient) strptime
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def parse_date(date_str):
+    """Convert a ``YYYY-MM-DD`` string to a python ``date``. Returns
+    ``None`` if it isn't a valid date.
+
+    The same dates turn up again and again, so results are cached.
+    """
+    try:
+        return _DATES[date_str]
+    except KeyError:
+        pass
+    parsed = _parse_date(date_str)
+    if len(_DATES) >= DATE_CACHE_SIZE:
+        _DATES.clear()
+    _DATES[date_str] = parsed
+    return parsed
 
 
 class StringType(GenericType):
@@ -18,6 +89,19 @@ class StringType(GenericType):
             )
         return super(StringType, self).where(operation, value)
 
+    loadable = True
+
+    def load(self, values):
+        return list(values)
+
+    def matches(self, operation, value):
+        value = '{}'.format(value)
+        if operation == 'contains':
+            return lambda values: any(value in x for x in values)
+        elif operation == 'startswith':
+            return lambda values: any(x.startswith(value) for x in values)
+        return super(StringType, self).matches(operation, value)
+
 
 class DateType(GenericType):
     def where(self, operation, value):
@@ -35,15 +119,41 @@ class DateType(GenericType):
             )
         return super(DateType, self).where(operation, value)
 
-    def run(self, etree):
+    loadable = True
+
+    def load(self, values):
+        return self.convert(values)
+
+    def matches(self, operation, value):
+        compare = {
+            'lt': operators.lt, 'lte': operators.le,
+            'gt': operators.gt, 'gte': operators.ge,
+            'eq': operators.eq,
+        }.get(operation)
+        if compare is None:
+            return super(DateType, self).matches(operation, value)
+        try:
+            value = float(str(value).replace('-', ''))
+        except ValueError:
+            return None
+
+        def match(values):
+            # like XPath, only the first date is compared
+            number = date_number(values[0]) if values else float('nan')
+            return compare(number, value)
+        return match
+
+    def convert(self, results):
         dates = []
-        dates_str = etree.xpath(self.get())
-        for date_str in dates_str:
-            try:
-                dates.append(datetime.strptime(date_str, '%Y-%m-%d').date())
-            except ValueError:
+        for date_str in results:
+            # lxml "smart" strings hold a reference to their element,
+            # so only plain strings go in the cache
+            parsed = parse_date(unicode(date_str))
+            if parsed is None:
                 logging.getLogger(__name__).warning(
                     'Invalid date: "%s"', date_str)
+            else:
+                dates.append(parsed)
         return dates
 
 
@@ -67,15 +177,23 @@ class SectorType(GenericType):
             conditions_str = '({})'.format(conditions_str)
         return conditions_str
 
+    @staticmethod
+    def _code_condition(codes):
+        # for all but the smallest categories, one set lookup per sector
+        # beats a string comparison per code in the category
+        if len(codes) > _INLINE_CODES:
+            return 'iatikit:code-in(@code, "{}")'.format(code_set_name(codes))
+        if not codes:
+            return 'false()'
+        return '({})'.format(' or '.join(
+            '@code = "{}"'.format(code) for code in sorted(codes)))
+
     def where(self, operation, value):
         if operation == 'in':
             if not isinstance(value, Sector) or value.vocabulary.code != '2':
                 raise Exception('{} is not a sector category'.format(value))
-            codelist_items = CodelistSet().get('Sector').where(
-                category=value.code.code).all()
-            conditions = ' or '.join(['@code = "{code}"'.format(code=c.code)
-                                      for c in codelist_items])
-            conditions = ['(' + conditions + ')']
+            codes = sector_categories().get(value.code.code, frozenset())
+            conditions = [self._code_condition(codes)]
             conditions.append(
                 self._vocab_condition(self.condition.get('1')))
             return '{expr}[{conditions}]'.format(
@@ -102,23 +220,150 @@ class SectorType(GenericType):
             )
         return super(SectorType, self).where(operation, value)
 
-    def run(self, etree):
-        return [Sector(x.get('code'),
-                       vocabulary=x.get('vocabulary', '1'),
-                       percentage=x.get('percentage'))
-                for x in etree.xpath(self.get())]
+    def convert(self, results):
+        return Sector.batch((x.get('code'), x.get('vocabulary', '1'),
+                             x.get('percentage')) for x in results)
+
+    attributes = ('code', 'vocabulary', 'percentage')
+
+    def extract(self, etree):
+        return [{key: x.get(key) for key in self.attributes
+                 if x.get(key) is not None}
+                for x in compiled_xpath(self.get())(etree)]
+
+    loadable = True
+
+    def load(self, values):
+        return self.convert(values)
+
+    @staticmethod
+    def _vocab_matcher(conditions):
+        if not isinstance(conditions, list):
+            conditions = [conditions]
+        # None means no @vocabulary attribute
+        conditions = set(conditions)
+        return lambda sector: sector.get('vocabulary') in conditions
+
+    def matches(self, operation, value):
+        if operation == 'in':
+            codes = sector_categories().get(value.code.code, frozenset())
+            vocab_matches = self._vocab_matcher(self.condition.get('1'))
+            return lambda values: any(
+                x.get('code') in codes and vocab_matches(x) for x in values)
+        elif operation == 'eq':
+            code = value.code
+            if isinstance(code, CodelistItem):
+                code = code.code
+            vocab_matches = None
+            if value.vocabulary is not None:
+                vocab_matches = self._vocab_matcher(self.condition.get(
+                    value.vocabulary.code, value.vocabulary.code))
+            return lambda values: any(
+                (code is None or x.get('code') == code) and
+                (vocab_matches is None or vocab_matches(x))
+                for x in values)
+        return super(SectorType, self).matches(operation, value)
+
+    def index_keys(self, operation, value):
+        """Return the ``(vocabulary, code)`` pairs (as they appear in
+        the XML) that match a sector filter, for looking up in a sector
+        index. Returns ``None`` if the filter can't be answered that way.
+        """
+        # raises for invalid filter values, just like the XPath query
+        self.where(operation, value)
+        if operation == 'in':
+            codes = sector_categories().get(value.code.code, frozenset())
+            vocabularies = self.condition.get('1')
+        elif operation == 'eq' and value.vocabulary is not None:
+            code = value.code
+            if isinstance(code, CodelistItem):
+                code = code.code
+            codes = [code]
+            vocabularies = self.condition.get(
+                value.vocabulary.code, value.vocabulary.code)
+        else:
+            return None
+        if not isinstance(vocabularies, list):
+            vocabularies = [vocabularies]
+        return [(vocabulary, code)
+                for vocabulary in vocabularies for code in codes]
+
+
+class PeriodType(GenericType):
+    """The period an activity runs for: from its actual start date
+    (or planned, if it doesn't have a valid one) to its actual end date
+    (or planned). Activities without an end date are ongoing.
+
+    Filtering with a ``(start, end)`` tuple of dates finds activities
+    that are active at some point during that period.
+    """
+
+    def __init__(self, start, end):
+        super(PeriodType, self).__init__('')
+        # (actual, planned) date types
+        self.start = start
+        self.end = end
+
+    @staticmethod
+    def bounds(value):
+        """Return the start and end of a filter value, as number
+        strings, e.g. ``("20200101", "20201231")``.
+        """
+        try:
+            start, end = [str(x).replace('-', '') for x in value]
+            float(start), float(end)
+        except (TypeError, ValueError):
+            raise FilterError(
+                'Expected a (start, end) tuple of dates: {!r}'.format(value))
+        return start, end
+
+    def where(self, operation, value):
+        if operation != 'eq':
+            raise FilterError('Unknown filter modifier: {}'.format(operation))
+        start, end = self.bounds(value)
+        number = 'number(translate({}, "-", ""))'
+        actual_start, planned_start = [
+            number.format(type_.get()) for type_ in self.start]
+        actual_end, planned_end = [
+            number.format(type_.get()) for type_ in self.end]
+        # NaN (i.e. a missing or invalid date) is the only
+        # number that isn't equal to itself
+        tmpl = ('(({as_} = {as_} and {as_} <= {end}) or '
+                '(not({as_} = {as_}) and {ps} <= {end})) and '
+                '(({ae} = {ae} and {ae} >= {start}) or '
+                '(not({ae} = {ae}) and not({pe} < {start})))')
+        return tmpl.format(as_=actual_start, ps=planned_start,
+                           ae=actual_end, pe=planned_end,
+                           start=start, end=end)
+
+    def matches(self, operation, value):
+        return None
 
 
 class XPathType(GenericType):
     def where(self, operation, value):
         return value
 
+    def matches(self, operation, value):
+        return None
+
 
 class BooleanType(GenericType):
-    def run(self, etree):
-        return etree.xpath('{expr} = "true" or {expr} = "1"'.format(
+    def select(self, etree):
+        return compiled_xpath('{expr} = "true" or {expr} = "1"'.format(
             expr=self.get(),
-        ))
+        ))(etree)
+
+    loadable = True
+
+    def load(self, values):
+        return any(x in ('true', '1') for x in values)
+
+    def matches(self, operation, value):
+        if value:
+            return lambda values: any(x in ('true', '1') for x in values)
+        return lambda values: not values or any(
+            x in ('false', '0') for x in values)
 
     def where(self, operation, value):
         if value is not bool(value):
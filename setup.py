@@ -17,7 +17,7 @@ setup(
     author='Andy Lulham',
     author_email='a.lulham@gmail.com',
     version=data.get('__version__'),
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     license='MIT',
     keywords='IATI',
     long_description=readme,
@@ -27,7 +27,12 @@ setup(
         'requests',
         'unicodecsv',
         'future',
+        'futures; python_version < "3"',
+        'contextlib2; python_version < "3"',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
@@ -1,4 +1,6 @@
 import datetime
+import pickle
+import threading
 from os.path import abspath, dirname, join
 from unittest import TestCase
 
@@ -9,7 +11,10 @@ import pytest
 from iatikit.data.dataset import DatasetSet, Dataset
 from iatikit.data.activity import ActivitySet, Activity
 from iatikit.standard.activity_schema import ActivitySchema105
+from iatikit.utils.abstract import compiled_xpath, expand_code_sets
 from iatikit.utils.config import CONFIG
+from iatikit.utils import types
+from iatikit.utils.types import DateType, parse_date
 from iatikit import Sector
 
 
@@ -92,6 +97,26 @@ class TestActivitySet(TestCase):
             sector__in=sector).all()
         assert len(acts) == 1
 
+    def test_activities_filter_by_sector_in_code_set(self):
+        sector = Sector('151', vocabulary='2')
+        sector_type = ActivitySchema105().sector()
+        # the fixture category is small enough to compare inline
+        inline = sector_type.where('in', sector)
+        assert 'iatikit:code-in(' not in inline
+        with patch('iatikit.utils.types._INLINE_CODES', 0):
+            query = sector_type.where('in', sector)
+            acts = self.fixture_org_acts.where(sector__in=sector)
+            # one set lookup per sector, rather than a clause per code
+            assert query.count('iatikit:code-in(') == 1
+            assert '@code = ' not in query
+            assert [act.id for act in acts] == ['GB-COH-01234567-1']
+            assert acts.count() == 1
+            # explained queries list the codes
+            assert expand_code_sets(query) == inline
+            for explained in acts.explain().queries.values():
+                assert 'iatikit:code-in(' not in explained
+                assert '(@code = "15153" or @code = "15163")' in explained
+
     def test_activities_filter_by_bad_sector_in(self):
         err_msg = 'bad-sector-cat is not a sector category'
         with pytest.raises(Exception, match=err_msg):
@@ -206,3 +231,98 @@ class TestActivity(TestCase):
 
     def test_activity_end(self):
         assert self.activity1.end == datetime.date(2015, 1, 16)
+
+    def test_activity_invalid_date(self):
+        date_el = ET.fromstring(
+            '<iati-activity><activity-date type="1" iso-date="2015-02-30"/>'
+            '<activity-date type="1" iso-date="2015-2-3"/></iati-activity>')
+        with patch('logging.Logger.warning') as fake_logger_warning:
+            dates = DateType('activity-date/@iso-date').run(date_el)
+        fake_logger_warning.assert_called_once_with(
+            'Invalid date: "%s"', '2015-02-30')
+        # like strptime, unpadded dates are accepted
+        assert dates == [datetime.date(2015, 2, 3)]
+
+    def test_activity_non_ascii_date(self):
+        date_el = ET.fromstring(
+            u'<activity-date iso-date="2015-01-1\u00e9"/>')
+        with patch('logging.Logger.warning') as fake_logger_warning:
+            dates = DateType('@iso-date').run(date_el)
+        fake_logger_warning.assert_called_once_with(
+            'Invalid date: "%s"', u'2015-01-1\u00e9')
+        assert dates == []
+
+    def test_parse_date_cached(self):
+        types._DATES.clear()
+        date_el = ET.fromstring('<activity-date iso-date="2015-01-16"/>')
+        with patch.object(types, '_parse_date',
+                          wraps=types._parse_date) as fake_parse_date:
+            for _ in range(3):
+                assert DateType('@iso-date').run(date_el) == \
+                    [datetime.date(2015, 1, 16)]
+        assert fake_parse_date.call_count == 1
+        assert parse_date('2015-1-16') == datetime.date(2015, 1, 16)
+        assert parse_date('2015-01-16T00:00:00') is None
+        assert parse_date('2015-02-30') is None
+
+    def test_parse_date_cache_size(self):
+        types._DATES.clear()
+        with patch.object(types, 'DATE_CACHE_SIZE', 2):
+            for day in range(1, 6):
+                parse_date('2015-01-0{}'.format(day))
+                assert len(types._DATES) <= 2
+        types._DATES.clear()
+
+    def test_parse_date_non_ascii_digits(self):
+        # non-ASCII digits skip the fast path
+        date_str = u'\u0662\u0660\u0661\u0665-01-16'
+        try:
+            expected = datetime.datetime.strptime(
+                date_str, '%Y-%m-%d').date()
+        except ValueError:
+            expected = None
+        assert parse_date(date_str) == expected
+
+    def test_activity_values_memoized(self):
+        with patch.object(ActivitySchema105, 'title',
+                          wraps=ActivitySchema105.title) as title:
+            first = self.activity1.title
+            second = self.activity1.title
+        assert first is second
+        assert title.call_count == 1
+
+    def test_compiled_xpath_cached(self):
+        xpath = compiled_xpath('title/text()')
+        assert compiled_xpath('title/text()') is xpath
+
+        other_threads = []
+        thread = threading.Thread(target=lambda: other_threads.append(
+            compiled_xpath('title/text()')))
+        thread.start()
+        thread.join()
+        assert other_threads[0] is not xpath
+
+    def test_activity_snapshot(self):
+        snapshot = self.activity1.snapshot()
+        assert snapshot.dataset_name == 'fixture-org-activities2'
+        assert snapshot.version == '1.05'
+        assert snapshot._activity is None
+        assert snapshot.iati_identifier == self.activity1.iati_identifier
+        assert snapshot.end == datetime.date(2015, 1, 16)
+        assert snapshot.xml == ET.tostring(self.activity1.etree)
+
+    def test_activity_snapshot_pickle(self):
+        snapshot = self.activity1.snapshot()
+        snapshot.title  # pylint: disable=pointless-statement
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            unpickled = pickle.loads(pickle.dumps(snapshot, protocol))
+            assert unpickled._activity is None
+            assert unpickled.title == self.activity1.title
+            assert isinstance(unpickled.activity, Activity)
+
+    def test_activity_snapshot_slots(self):
+        snapshot = self.activity1.snapshot()
+        with pytest.raises(AttributeError):
+            snapshot.__dict__  # pylint: disable=pointless-statement
+        with pytest.raises(AttributeError):
+            snapshot.unknown_field  # pylint: disable=pointless-statement
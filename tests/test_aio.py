@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, dirname, join
+import threading
+import time
+from unittest import TestCase, skipIf
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+from mock import patch
+
+from iatikit.data.dataset import Dataset, DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.data.organisation import OrganisationSet
+from iatikit.utils.config import CONFIG
+try:
+    from iatikit.utils import aio
+except SyntaxError:
+    aio = None
+
+
+def collect(async_iterator, loop):
+    """Exhaust an asynchronous iterator, without ``async for``."""
+    items = []
+    while True:
+        try:
+            items.append(loop.run_until_complete(
+                async_iterator.__anext__()))
+        except StopAsyncIteration:
+            return items
+
+
+@skipIf(asyncio is None, 'asyncio requires python 3')
+class TestAsync(TestCase):
+    def setUp(self):
+        self.registry_path = join(dirname(abspath(__file__)),
+                                  'fixtures', 'registry')
+        self.datasets = DatasetSet(
+            join(self.registry_path, 'data', '*', '*'),
+            join(self.registry_path, 'metadata', '*', '*'),
+        )
+        self.activities = ActivitySet(self.datasets)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_aiter(self):
+        expected = [act.iati_identifier for act in self.activities]
+        activities = collect(self.activities.aiter(), self.loop)
+        assert [act.iati_identifier for act in activities] == expected
+
+    def test_aiter_filtered(self):
+        iati_identifier = 'NL-CHC-98765-NL-CHC-98765-XGG00NS00'
+        activities = self.activities.where(iati_identifier=iati_identifier)
+        results = collect(activities.aiter(limit=0), self.loop)
+        assert len(results) == 1
+        assert results[0].iati_identifier == iati_identifier
+
+    def test_aiter_organisations(self):
+        organisations = collect(
+            OrganisationSet(self.datasets).aiter(), self.loop)
+        assert len(organisations) == 1
+
+    def test_acount(self):
+        count = self.loop.run_until_complete(self.activities.acount())
+        assert count == len(self.activities)
+
+    def test_acount_concurrently(self):
+        executor = ThreadPoolExecutor(max_workers=2)
+        counts = self.loop.run_until_complete(asyncio.gather(
+            self.activities.acount(executor=executor),
+            self.activities.where(
+                iati_identifier='NL-CHC-98765-NL-CHC-98765-XGG00NS00',
+            ).acount(executor=executor),
+        ))
+        executor.shutdown()
+        assert counts == [len(self.activities), 1]
+
+    def test_aetree(self):
+        dataset = Dataset(join(self.registry_path, 'data', 'fixture-org',
+                               'fixture-org-activities.xml'))
+        etree = self.loop.run_until_complete(dataset.aetree())
+        assert etree.getroot().tag == 'iati-activities'
+        assert dataset.etree is etree
+
+    def test_aiter_parses_limited(self):
+        parsing = []
+        most_parsing = []
+        lock = threading.Lock()
+        validate_xml = Dataset.validate_xml
+
+        def slow_validate_xml(dataset):
+            with lock:
+                parsing.append(dataset)
+                most_parsing.append(len(parsing))
+            time.sleep(0.01)
+            with lock:
+                parsing.remove(dataset)
+            return validate_xml(dataset)
+
+        with patch.object(aio, 'WORKERS', 2), \
+                patch.object(aio, '_SLOTS', None), \
+                patch.object(aio, '_EXECUTOR', None), \
+                patch.object(Dataset, 'validate_xml', slow_validate_xml):
+            iterators = [self.activities.aiter() for _ in range(6)]
+            counts = [0 for _ in iterators]
+            active = list(range(len(iterators)))
+            while active:
+                results = self.loop.run_until_complete(asyncio.gather(
+                    *[iterators[idx].__anext__() for idx in active],
+                    return_exceptions=True))
+                for idx, result in list(zip(active, results)):
+                    if isinstance(result, StopAsyncIteration):
+                        active.remove(idx)
+                    else:
+                        counts[idx] += 1
+            aio.default_executor().shutdown()
+        assert counts == [len(self.activities)] * 6
+        assert max(most_parsing) == 2
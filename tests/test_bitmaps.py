@@ -0,0 +1,206 @@
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from iatikit import Q, Sector
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.index.bitmaps import BitmapIndex, from_bitmap, to_bitmap
+from iatikit.index.catalog import Catalog, DatasetIndex
+from iatikit.utils import instrument
+from iatikit.utils.config import CONFIG
+from iatikit.utils.exceptions import FilterError
+
+
+FLAGS_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<iati-activities version="2.03">
+  <iati-activity humanitarian="1">
+    <iati-identifier>XM-1</iati-identifier>
+    <sector code="15163" vocabulary="1"/>
+  </iati-activity>
+  <iati-activity humanitarian="false">
+    <iati-identifier>XM-2</iati-identifier>
+    <sector code="73010" vocabulary="1"/>
+  </iati-activity>
+  <iati-activity>
+    <iati-identifier>XM-3</iati-identifier>
+  </iati-activity>
+  <iati-activity humanitarian="true">
+    <iati-identifier>XM-4</iati-identifier>
+    <sector code="73010" vocabulary="1"/>
+  </iati-activity>
+</iati-activities>'''
+
+NAMESPACED_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<iati-activities version="2.03" xmlns:akvo="http://akvo.org/iati-activities">
+  <iati-activity humanitarian="1">
+    <iati-identifier>XM-NS-1</iati-identifier>
+    <akvo:photo-id>1</akvo:photo-id>
+  </iati-activity>
+</iati-activities>'''
+
+
+class TestBitmaps(TestCase):
+    def test_round_trip(self):
+        for ordinals in ([], [0], [3, 7, 8, 200], list(range(20))):
+            assert from_bitmap(to_bitmap(ordinals)) == ordinals
+        assert to_bitmap([0, 2]) == 0b101
+        assert to_bitmap(iter([1, 1])) == 0b10
+
+    def test_bitmap_index(self):
+        bitmaps = BitmapIndex({'humanitarian': ['5', 'a']}, 4)
+        assert bitmaps.all == 0b1111
+        assert bitmaps.bitmap('humanitarian', 'eq', True) == 0b0101
+        assert bitmaps.find('humanitarian', 'eq', False) == {1, 3}
+        assert bitmaps.find('humanitarian', 'eq', 'yes') is None
+        assert bitmaps.find('title', 'eq', True) is None
+
+
+class TestQ(TestCase):
+    def setUp(self):
+        self.bitmaps = {
+            ('humanitarian', True): 0b0011,
+            ('version', '2.03'): 0b0110,
+        }
+
+    def _find(self, key, value):
+        return self.bitmaps.get((key, value))
+
+    def test_bounds(self):
+        query = Q(humanitarian=True) & Q(version='2.03')
+        assert query.bounds(self._find, 0b1111) == (0b0010, 0b0010)
+        query = Q(humanitarian=True) | ~Q(version='2.03')
+        assert query.bounds(self._find, 0b1111) == (0b1011, 0b1011)
+        # unknown filters could match anything
+        query = Q(humanitarian=True) & Q(title='test')
+        assert query.bounds(self._find, 0b1111) == (0, 0b0011)
+        assert (~query).bounds(self._find, 0b1111) == (0b1100, 0b1111)
+
+    def test_xpath(self):
+        def predicate(key, value):
+            if key == 'version':
+                return value == '2.03'
+            return '{}="{}"'.format(key, value)
+
+        assert (Q(a=1) | Q(b=2)).xpath(predicate) == '(a="1") or (b="2")'
+        assert (Q(a=1) & ~Q(version='2.03')).xpath(predicate) is False
+        assert (Q(a=1) | Q(version='2.03')).xpath(predicate) is True
+        assert (Q(a=1) & Q(version='2.03')).xpath(predicate) == 'a="1"'
+
+    def test_repr(self):
+        query = Q(humanitarian=True) | ~Q(version='1.03', publisher='x')
+        assert repr(query) == ("<Q (humanitarian=True OR "
+                               "(NOT (publisher='x' AND version='1.03')))>")
+        assert list(query.filters()) == ['humanitarian', 'publisher',
+                                         'version']
+
+    def test_not_a_q(self):
+        with pytest.raises(FilterError):
+            Q(humanitarian=True) | {'version': '2.03'}
+
+
+class TestBitmapFilters(TestCase):
+    def setUp(self):
+        self.registry_path = tempfile.mkdtemp(
+            dir=dirname(abspath(__file__)))
+        shutil.rmtree(self.registry_path)
+        shutil.copytree(
+            join(dirname(abspath(__file__)), 'fixtures', 'registry'),
+            self.registry_path)
+        with open(join(self.registry_path, 'data', 'old-org',
+                       'flags.xml'), 'wb') as handler:
+            handler.write(FLAGS_XML)
+        metadata_path = join(self.registry_path, 'metadata', 'old-org')
+        with open(join(metadata_path, 'old-org-acts.json')) as handler:
+            metadata = handler.read()
+        with open(join(metadata_path, 'flags.json'), 'w') as handler:
+            handler.write(metadata.replace('old-org-acts', 'flags'))
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.catalog = Catalog(self.registry_path)
+        self.skips = []
+        instrument.subscribe(self._listener)
+
+    def _listener(self, event, data):
+        if event == 'index_skips':
+            self.skips.append(data['dataset'])
+
+    def _datasets(self):
+        return DatasetSet(join(self.registry_path, 'data', '*', '*'),
+                          join(self.registry_path, 'metadata', '*', '*'))
+
+    def _identifiers(self, *conditions, **kwargs):
+        activities = ActivitySet(self._datasets()).where(
+            *conditions, **kwargs)
+        return [activity.iati_identifier for activity in activities.all()]
+
+    def test_filters_match_xml(self):
+        filters = [
+            ((Q(humanitarian=True),), {}),
+            ((Q(humanitarian=True) | ~Q(version='1.03'),), {}),
+            ((~Q(humanitarian=True),), {'publisher': 'old-org'}),
+            ((Q(version='2.03') & ~Q(humanitarian=False),), {}),
+            ((Q(filetype='activity') & Q(publisher='fixture-org'),), {}),
+            ((Q(sector__in=Sector('730', vocabulary='2')) |
+              Q(humanitarian=True),), {}),
+            ((Q(humanitarian=False) & Q(iati_identifier='XM-2'),), {}),
+            ((), {'version': '2.03', 'humanitarian': False}),
+        ]
+        expected = [self._identifiers(*conditions, **kwargs)
+                    for conditions, kwargs in filters]
+        assert all(expected)
+        self.catalog.build()
+        for (conditions, kwargs), identifiers in zip(filters, expected):
+            assert self._identifiers(*conditions, **kwargs) == \
+                identifiers, conditions
+            assert len(ActivitySet(self._datasets()).where(
+                *conditions, **kwargs)) == len(identifiers)
+
+    def test_datasets_not_parsed(self):
+        self.catalog.build()
+        datasets = self._datasets().all()
+        activities = ActivitySet(
+            datasets, Q(humanitarian=True) & Q(version='2.03'))
+        identifiers = [act.iati_identifier for act in activities]
+        assert identifiers == ['GB-COH-01234567-1', 'XM-1', 'XM-4']
+        assert all(dataset._etree is None for dataset in datasets)
+        assert self.skips == ['fixture-org-activities2', 'old-org-acts',
+                              'old-org-missing-acts']
+
+    def test_detached_items_release_fallback_tree(self):
+        with open(join(self.registry_path, 'data', 'old-org',
+                       'flags.xml'), 'wb') as handler:
+            handler.write(NAMESPACED_XML)
+        self.catalog.build()
+        dataset = [dataset for dataset in self._datasets()
+                   if dataset.name == 'flags'][0]
+        activities = ActivitySet([dataset], Q(humanitarian=True))
+        activity = activities.detached().first()
+        # the item can't be parsed on its own, so the whole dataset is
+        assert activity.etree.getroottree().getroot() is activity.etree
+        assert activity.etree.find(
+            '{http://akvo.org/iati-activities}photo-id').text == '1'
+        assert dataset._etree is None
+
+    def test_index_bitmaps(self):
+        self.catalog.build()
+        dataset = [dataset for dataset in self._datasets()
+                   if dataset.name == 'flags'][0]
+        bitmaps = DatasetIndex.load(dataset.data_path).bitmaps
+        assert bitmaps.find('humanitarian', 'eq', True) == {0, 3}
+        assert bitmaps.find('humanitarian', 'eq', False) == {1, 2}
+
+    def test_unknown_filter(self):
+        with pytest.raises(FilterError):
+            ActivitySet(self._datasets()).where(Q(bad_filter=True))
+        with pytest.raises(FilterError):
+            ActivitySet(self._datasets()).where({'version': '2.03'})
+
+    def tearDown(self):
+        instrument.unsubscribe(self._listener)
+        shutil.rmtree(self.registry_path, ignore_errors=True)
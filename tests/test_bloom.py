@@ -0,0 +1,128 @@
+from os.path import abspath, dirname, exists, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.index.bloom import BloomFilter
+from iatikit.index.catalog import Catalog, bloom_path
+from iatikit.utils import instrument
+from iatikit.utils.config import CONFIG
+
+
+class TestBloomFilter(TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter.for_capacity(1000, 0.01)
+        values = ['GB-1-{}'.format(idx) for idx in range(1000)]
+        for value in values:
+            bloom.add(value)
+        assert all(value in bloom for value in values)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter.for_capacity(1000, 0.01)
+        for idx in range(1000):
+            bloom.add('GB-1-{}'.format(idx))
+        false_positives = sum(1 for idx in range(10000)
+                              if 'XM-DAC-{}'.format(idx) in bloom)
+        assert false_positives < 300
+
+    def test_invalid_error_rate(self):
+        with self.assertRaises(ValueError):
+            BloomFilter.for_capacity(10, 1.5)
+
+    def test_save_and_load(self):
+        tmp_path = tempfile.mkdtemp(dir=dirname(abspath(__file__)))
+        try:
+            bloom = BloomFilter.for_capacity(10)
+            bloom.add('GB-1-1')
+            path = join(tmp_path, 'test.bloom')
+            bloom.save(path)
+            loaded = BloomFilter.load(path)
+            assert (loaded.size, loaded.hashes) == (bloom.size, bloom.hashes)
+            assert 'GB-1-1' in loaded
+            with open(path, 'rb') as handler:
+                data = handler.read()
+            # filters hashed the old way aren't trusted
+            with open(path, 'wb') as handler:
+                handler.write(b'IATIBLM1' + data[8:])
+            assert BloomFilter.load(path) is None
+            with open(path, 'wb') as handler:
+                handler.write(b'not a bloom filter')
+            assert BloomFilter.load(path) is None
+            assert BloomFilter.load(join(tmp_path, 'missing')) is None
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+class TestDatasetBloomFilters(TestCase):
+    def setUp(self):
+        self.registry_path = tempfile.mkdtemp(
+            dir=dirname(abspath(__file__)))
+        shutil.rmtree(self.registry_path)
+        shutil.copytree(
+            join(dirname(abspath(__file__)), 'fixtures', 'registry'),
+            self.registry_path)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.catalog = Catalog(self.registry_path)
+        self.skips = []
+        instrument.subscribe(self._listener)
+
+    def _listener(self, event, data):
+        if event == 'bloom_skips':
+            self.skips.append(data['dataset'])
+
+    def _activities(self):
+        return ActivitySet(DatasetSet(
+            join(self.registry_path, 'data', '*', '*'),
+            join(self.registry_path, 'metadata', '*', '*')))
+
+    def test_bloom_sidecar(self):
+        self.catalog.build()
+        data_path = join(self.registry_path, 'data', 'old-org',
+                         'old-org-acts.xml')
+        assert exists(bloom_path(data_path))
+        index = self.catalog.get('old-org-acts')
+        assert index.may_contain('id', 'NL-CHC-98765-NL-CHC-98765-XX0D9001')
+        assert index.may_contain('reporting_org', 'NL-CHC-98765')
+        assert not index.may_contain('id', 'GB-COH-01234567-1')
+
+    def test_get_skips_datasets(self):
+        self.catalog.build()
+        identifier = 'NL-CHC-98765-NL-CHC-98765-XGG00NS00'
+        activity = self._activities().get(identifier)
+        assert activity.iati_identifier == identifier
+        assert self.skips == ['fixture-org-activities',
+                              'fixture-org-activities2']
+
+    def test_where_matches_unindexed(self):
+        filters = [
+            {'iati_identifier': 'NL-CHC-98765-NL-CHC-98765-XGG00NS00'},
+            {'id': 'missing'},
+            {'reporting_org': 'NL-CHC-98765'},
+        ]
+        expected = [[act.iati_identifier
+                     for act in self._activities().where(**wheres).all()]
+                    for wheres in filters]
+        assert self.skips == []
+        self.catalog.build()
+        for wheres, identifiers in zip(filters, expected):
+            assert [act.iati_identifier for act in
+                    self._activities().where(**wheres).all()] == identifiers
+        assert self.skips
+
+    def test_configured_error_rate(self):
+        CONFIG.read_dict({'index': {'bloom_error_rate': '0.001'}})
+        try:
+            self.catalog.build()
+        finally:
+            CONFIG.remove_section('index')
+        index = self.catalog.get('old-org-acts')
+        assert index._record['bloom']['error_rate'] == 0.001
+
+    def tearDown(self):
+        instrument.unsubscribe(self._listener)
+        shutil.rmtree(self.registry_path, ignore_errors=True)
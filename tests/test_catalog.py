@@ -0,0 +1,160 @@
+import hashlib
+from os.path import abspath, dirname, exists, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as ET
+
+from iatikit.data.dataset import Dataset, DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.index.catalog import Catalog, DatasetIndex, StreamIndexer, \
+                                  build_index, index_path
+from iatikit.utils.config import CONFIG
+from iatikit.utils.pipeline import Pipeline
+
+
+class TestStreamIndexer(TestCase):
+    def setUp(self):
+        self.data_path = join(dirname(abspath(__file__)), 'fixtures',
+                              'registry', 'data', 'old-org',
+                              'old-org-acts.xml')
+        with open(self.data_path, 'rb') as handler:
+            self.xml = handler.read()
+
+    def _index(self, chunk_size):
+        indexer = StreamIndexer('old-org-acts', 'old-org')
+        for idx in range(0, len(self.xml), chunk_size):
+            indexer.feed(self.xml[idx:idx + chunk_size])
+        return indexer.close()
+
+    def test_index_header(self):
+        index = self._index(100)
+        assert index.valid
+        assert index.root == 'iati-activities'
+        assert index.filetype == 'activity'
+        assert index.version == '1.03'
+        assert index.attributes['generated-datetime'] == \
+            '2016-07-07T10:51:16'
+
+    def test_index_activities(self):
+        index = self._index(100)
+        assert index.count == 2
+        assert index.identifiers[0] == 'NL-CHC-98765-NL-CHC-98765-XX0D9001'
+
+    def test_index_offsets(self):
+        # chunk boundaries shouldn't change the offsets found
+        for chunk_size in [1, 7, 100, 65536]:
+            index = self._index(chunk_size)
+            assert len(index.offsets) == 2
+            for (start, end), identifier in zip(index.offsets,
+                                                index.identifiers):
+                activity = ET.fromstring(self.xml[start:end])
+                assert activity.tag == 'iati-activity'
+                assert activity.find('iati-identifier').text == identifier
+
+    def test_index_invalid_xml(self):
+        indexer = StreamIndexer('broken')
+        indexer.feed(b'<iati-activities version="2.03"><iati-activity>')
+        indexer.feed(b'</iati-activities>')
+        index = indexer.close()
+        assert not index.valid
+        assert index.offsets is None
+        assert index.error
+
+    def test_index_sha256(self):
+        index = self._index(100)
+        assert index.sha256 == hashlib.sha256(self.xml).hexdigest()
+
+    def test_index_in_pipeline(self):
+        pipeline = Pipeline([StreamIndexer('old-org-acts')], maxsize=2)
+        for idx in range(0, len(self.xml), 50):
+            pipeline.feed(self.xml[idx:idx + 50])
+        index, = pipeline.close()
+        assert index.count == 2
+
+
+class TestCatalog(TestCase):
+    def setUp(self):
+        self.registry_path = tempfile.mkdtemp(
+            dir=dirname(abspath(__file__)))
+        shutil.rmtree(self.registry_path)
+        shutil.copytree(
+            join(dirname(abspath(__file__)), 'fixtures', 'registry'),
+            self.registry_path)
+        self.catalog = Catalog(self.registry_path)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+
+    def _data_path(self, publisher, name):
+        return join(self.registry_path, 'data', publisher, name + '.xml')
+
+    def test_index_path(self):
+        data_path = self._data_path('old-org', 'old-org-acts')
+        assert index_path(data_path) == join(
+            self.registry_path, 'index', 'old-org', 'old-org-acts.json')
+
+    def test_catalog_build(self):
+        assert self.catalog.build() == 4
+        assert exists(join(self.registry_path, 'index', 'fixture-org',
+                           'fixture-org-org.json'))
+        assert self.catalog.build() == 0
+        assert self.catalog.build(force=True) == 4
+
+    def test_catalog_iter(self):
+        assert list(self.catalog) == []
+        self.catalog.build()
+        names = [index.name for index in self.catalog]
+        assert names == ['fixture-org-activities', 'fixture-org-activities2',
+                         'fixture-org-org', 'old-org-acts']
+
+    def test_catalog_get(self):
+        self.catalog.build()
+        index = self.catalog.get('fixture-org-org')
+        assert index.filetype == 'organisation'
+        assert index.identifiers == ['GB-COH-01234567']
+        assert self.catalog.get('missing') is None
+
+    def test_stale_index(self):
+        data_path = self._data_path('old-org', 'old-org-acts')
+        build_index(data_path)
+        assert DatasetIndex.load(data_path) is not None
+        with open(data_path, 'ab') as handler:
+            handler.write(b'\n')
+        assert DatasetIndex.load(data_path) is None
+
+    def test_dataset_uses_index(self):
+        data_path = self._data_path('old-org', 'old-org-acts')
+        build_index(data_path)
+        dataset = Dataset(data_path)
+        assert dataset.index is not None
+        assert dataset.version == '1.03'
+        assert dataset.root == 'iati-activities'
+        assert dataset._etree is None
+
+    def test_truncated_dataset_root(self):
+        data_path = self._data_path('old-org', 'old-org-acts')
+        with open(data_path, 'rb') as handler:
+            xml = handler.read()
+        with open(data_path, 'wb') as handler:
+            handler.write(xml[:len(xml) // 2])
+        build_index(data_path)
+        dataset = Dataset(data_path)
+        assert dataset.index is not None
+        assert not dataset.index.valid
+        # same as without an index
+        assert dataset.root is None
+
+    def test_activities_len_uses_index(self):
+        self.catalog.build()
+        datasets = DatasetSet(join(self.registry_path, 'data', '*', '*'),
+                              join(self.registry_path, 'metadata', '*', '*'))
+        activities = ActivitySet(datasets)
+        assert len(activities) == 6
+        assert len(activities.where(
+            iati_identifier='GB-COH-01234567-1')) == 1
+
+    def tearDown(self):
+        shutil.rmtree(self.registry_path, ignore_errors=True)
@@ -6,7 +6,8 @@ from unittest import TestCase
 import pytest
 
 import iatikit
-from iatikit.standard.codelist import CodelistSet, Codelist
+from iatikit.standard.codelist import CodelistSet, Codelist, \
+    sector_categories
 from iatikit.utils.exceptions import NoCodelistsError
 from iatikit.utils.config import CONFIG
 
@@ -106,6 +107,12 @@ class TestCodelist(TestCase):
         for codelist_item in codelist_items:
             assert codelist_item.name in codelist_item_names
 
+    def test_sector_categories(self):
+        categories = sector_categories()
+        assert categories['151'] == frozenset(
+            item.code for item in self.codelist.filter(category='151'))
+        assert sector_categories() is categories
+
     def test_codelist_item(self):
         codelist_item = self.codelist.get('73010')
         item_repr = '<CodelistItem (Reconstruction relief and ' + \
@@ -0,0 +1,117 @@
+import datetime
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from iatikit.data.dataset import Dataset, DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.utils.config import CONFIG
+from iatikit.utils.columns import parse_dates
+
+np = pytest.importorskip('numpy')
+
+
+SECTOR_XML = b'''<iati-activities version="2.03">
+  <iati-activity>
+    <iati-identifier>XM-1</iati-identifier>
+    <sector code="15153" vocabulary="1" percentage="60"/>
+    <sector code="73010" vocabulary="1" percentage="40"/>
+  </iati-activity>
+  <iati-activity>
+    <iati-identifier>XM-2</iati-identifier>
+  </iati-activity>
+  <iati-activity>
+    <iati-identifier>XM-3</iati-identifier>
+    <sector code="15153"/>
+  </iati-activity>
+</iati-activities>'''
+
+
+class TestColumns(TestCase):
+    def setUp(self):
+        registry_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'registry')
+        self.activities = ActivitySet(DatasetSet(
+            join(registry_path, 'data', '*', '*'),
+            join(registry_path, 'metadata', '*', '*'),
+        ))
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.tmp_path = tempfile.mkdtemp(dir=dirname(abspath(__file__)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_columns(self):
+        fields = ['iati_identifier', 'version', 'humanitarian',
+                  'planned_start', 'end', 'title']
+        columns = self.activities.to_columns(fields)
+        records = list(self.activities.records(fields))
+
+        assert list(columns.keys()) == fields
+        identifiers = columns['iati_identifier']
+        assert list(identifiers.categories[identifiers.codes]) == \
+            [record[0] for record in records]
+        versions = columns['version']
+        assert sorted(versions.categories) == ['1.03', '1.05', '2.03']
+        assert versions.codes.dtype == np.int32
+        assert columns['humanitarian'].dtype == bool
+        assert list(columns['humanitarian']) == \
+            [record[2] for record in records]
+        assert columns['planned_start'].dtype == np.dtype('datetime64[D]')
+        assert [None if np.isnat(date) else date.astype(object)
+                for date in columns['planned_start']] == \
+            [record[3] for record in records]
+        titles = columns['title']
+        assert len(titles.offsets) == len(records) + 1
+        for idx, record in enumerate(records):
+            start, end = titles.offsets[idx], titles.offsets[idx + 1]
+            assert list(titles.values['text'][start:end]) == record[5]
+
+    def test_parse_dates(self):
+        logger = 'iatikit.utils.columns'
+        with self.assertLogs(logger, level='WARNING') as logs:
+            dates = parse_dates(['2015-01-16', 'bad', '2015-01-16',
+                                 '2015-02-30'])
+        assert dates.dtype == np.dtype('datetime64[D]')
+        assert list(dates[[0, 2]].astype(object)) == \
+            [datetime.date(2015, 1, 16)] * 2
+        assert np.isnat(dates[1]) and np.isnat(dates[3])
+        assert logs.output == [
+            'WARNING:{}:Invalid date: "bad"'.format(logger),
+            'WARNING:{}:Invalid date: "2015-02-30"'.format(logger),
+        ]
+        assert len(parse_dates([])) == 0
+
+    def test_sector_columns(self):
+        data_path = join(self.tmp_path, 'sectors.xml')
+        with open(data_path, 'wb') as handler:
+            handler.write(SECTOR_XML)
+        columns = ActivitySet([Dataset(data_path)]).to_columns(['sector'])
+
+        sectors = columns['sector']
+        assert list(sectors.offsets) == [0, 2, 2, 3]
+        codes = sectors.values['code']
+        assert list(codes.categories[codes.codes]) == \
+            ['15153', '73010', '15153']
+        vocabularies = sectors.values['vocabulary']
+        assert list(vocabularies.categories[vocabularies.codes]) == \
+            ['1', '1', '1']
+        percentages = sectors.values['percentage']
+        assert list(percentages[:2]) == [60., 40.]
+        assert np.isnan(percentages[2])
+
+    def test_empty_columns(self):
+        columns = self.activities.where(
+            iati_identifier='unknown').to_columns(['iati_identifier', 'end'])
+        assert len(columns['iati_identifier'].codes) == 0
+        assert len(columns['end']) == 0
+
+    def test_unsupported_column(self):
+        with self.assertRaises(ValueError):
+            self.activities.to_columns(['location'])
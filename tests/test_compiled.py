@@ -0,0 +1,187 @@
+from array import array
+from os.path import abspath, dirname, exists, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as ET
+
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.data.organisation import OrganisationSet
+from iatikit.index.catalog import Catalog
+from iatikit.index.compiled import CompiledDataset, _cast, compiled_path
+from iatikit.utils.config import CONFIG
+
+
+FILTERS = [
+    {},
+    {'humanitarian': True},
+    {'humanitarian': False},
+    {'planned_start__gte': '2012-01-01'},
+    {'planned_start__lt': '2013-02-01', 'humanitarian': False},
+    {'actual_start__exists': True},
+    {'iati_identifier': 'GB-COH-01234567-1'},
+    {'id': 'NL-CHC-98765-NL-CHC-98765-XGG00NS00'},
+    {'title__contains': 'Implement'},
+    {'iati_identifier__startswith': 'NL-CHC'},
+]
+
+
+LATIN_1_XML = u'''<?xml version="1.0" encoding="ISO-8859-1"?>
+<iati-activities version="2.03">
+  <iati-activity>
+    <iati-identifier>XM-1</iati-identifier>
+    <title><narrative>Caf\xe9</narrative></title>
+  </iati-activity>
+</iati-activities>'''.encode('iso-8859-1')
+
+
+class TestCompiled(TestCase):
+    def setUp(self):
+        self.registry_path = tempfile.mkdtemp(
+            dir=dirname(abspath(__file__)))
+        shutil.rmtree(self.registry_path)
+        shutil.copytree(
+            join(dirname(abspath(__file__)), 'fixtures', 'registry'),
+            self.registry_path)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.catalog = Catalog(self.registry_path)
+
+    def _datasets(self):
+        return DatasetSet(join(self.registry_path, 'data', '*', '*'),
+                          join(self.registry_path, 'metadata', '*', '*'))
+
+    def _identifiers(self, **kwargs):
+        activities = ActivitySet(self._datasets()).where(**kwargs)
+        return [activity.iati_identifier for activity in activities.all()]
+
+    def test_catalog_compile(self):
+        assert self.catalog.compile() == 4
+        index = self.catalog.get('old-org-acts')
+        data_path = join(self.registry_path, 'data', 'old-org',
+                         'old-org-acts.xml')
+        assert exists(compiled_path(data_path, index.sha256))
+        assert self.catalog.compile() == 0
+        assert self.catalog.compile(force=True) == 4
+
+    def test_compiled_dataset(self):
+        self.catalog.compile()
+        dataset = self._datasets().get('old-org-acts')
+        compiled = dataset.compiled
+        assert isinstance(compiled, CompiledDataset)
+        assert compiled.version == '1.03'
+        assert compiled.count == 2
+        assert compiled.values(0, 'iati_identifier') == \
+            ['NL-CHC-98765-NL-CHC-98765-XX0D9001']
+        start, end = compiled.offsets(0)
+        with open(dataset.data_path, 'rb') as handler:
+            xml = handler.read()
+        assert ET.fromstring(xml[start:end]).tag == 'iati-activity'
+
+    def test_cast_without_memoryview_cast(self):
+        # e.g. python 2, where memoryviews can't be cast
+        section = array('B', array('I', [1, 2, 3]).tobytes())
+        assert not hasattr(section, 'cast')
+        assert _cast(section, 'I') == array('I', [1, 2, 3])
+        assert _cast(section, 'B') is section
+
+    def test_filters_match_xml(self):
+        expected = [self._identifiers(**wheres) for wheres in FILTERS]
+        self.catalog.compile()
+        for wheres, identifiers in zip(FILTERS, expected):
+            assert self._identifiers(**wheres) == identifiers, wheres
+            assert len(ActivitySet(self._datasets()).where(**wheres)) == \
+                len(identifiers)
+
+    def test_datasets_not_parsed(self):
+        self.catalog.compile()
+        datasets = self._datasets().all()
+        activities = ActivitySet(
+            datasets, planned_start__gte=['2012-01-01'])
+        activity = activities.first()
+        assert activity.planned_start.isoformat() == '2013-04-15'
+        assert activity._etree is None
+        assert all(dataset._etree is None for dataset in datasets)
+        # the XML is parsed on demand
+        assert activity.etree.tag == 'iati-activity'
+        assert activity.etree.find('iati-identifier').text == \
+            activity.iati_identifier
+        assert all(dataset._etree is None for dataset in datasets)
+
+    def test_xpath_filter_uses_xml(self):
+        expected = self._identifiers(xpath='sector')
+        self.catalog.compile()
+        datasets = self._datasets().all()
+        activities = ActivitySet(datasets, xpath=['sector'])
+        assert [activity.iati_identifier
+                for activity in activities.all()] == expected
+        assert any(dataset._etree is not None for dataset in datasets)
+        assert activities.explain().datasets[0]['compiled'] is False
+
+    def test_records_match_xml(self):
+        fields = ['iati_identifier', 'title', 'planned_start',
+                  'humanitarian', 'version']
+        expected = list(ActivitySet(self._datasets()).records(fields))
+        self.catalog.compile()
+        assert list(ActivitySet(self._datasets()).records(fields)) == \
+            expected
+
+    def test_organisations(self):
+        self.catalog.compile()
+        organisations = OrganisationSet(self._datasets()).all()
+        assert [org.org_identifier for org in organisations] == \
+            ['GB-COH-01234567']
+        assert organisations[0].etree.tag == 'iati-organisation'
+
+    def _add_dataset(self, name, xml):
+        with open(join(self.registry_path, 'data', 'old-org',
+                       name + '.xml'), 'wb') as handler:
+            handler.write(xml)
+        metadata_path = join(self.registry_path, 'metadata', 'old-org')
+        with open(join(metadata_path, 'old-org-acts.json')) as handler:
+            metadata = handler.read()
+        with open(join(metadata_path, name + '.json'), 'w') as handler:
+            handler.write(metadata.replace('old-org-acts', name))
+
+    def test_where_after_iterating(self):
+        self._add_dataset('latin-1', LATIN_1_XML)
+        self._add_dataset('empty', b'')
+        self.catalog.compile()
+        datasets = self._datasets().all()
+        activities = ActivitySet(datasets)
+        activities.count()
+        assert [act.iati_identifier for act in activities]
+        assert any(dataset.compiled for dataset in datasets)
+        # sets are copied by where(), along with their datasets
+        filtered = activities.where(planned_start__gte='2012-01-01')
+        assert [act.iati_identifier for act in filtered] == \
+            self._identifiers(planned_start__gte='2012-01-01')
+        for dataset in datasets:
+            assert dataset.activities.where(
+                iati_identifier='XM-1').count() == \
+                (1 if dataset.name == 'latin-1' else 0)
+
+    def test_stale_compiled_dataset(self):
+        self.catalog.compile()
+        dataset = self._datasets().get('old-org-acts')
+        with open(dataset.data_path, 'ab') as handler:
+            handler.write(b'\n')
+        dataset = self._datasets().get('old-org-acts')
+        assert dataset.compiled is None
+        assert len(dataset.activities) == 2
+
+    def test_explain_compiled(self):
+        self.catalog.compile()
+        activities = ActivitySet(self._datasets()).where(
+            humanitarian=True)
+        plan = activities.explain()
+        assert all(dataset['compiled'] for dataset in plan.datasets)
+        assert plan.estimated_cost < sum(
+            dataset['bytes'] for dataset in plan.datasets)
+
+    def tearDown(self):
+        shutil.rmtree(self.registry_path, ignore_errors=True)
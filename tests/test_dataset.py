@@ -1,9 +1,13 @@
+from os import close, unlink
 from os.path import abspath, dirname, join
+import tempfile
 from unittest import TestCase
 
+from lxml import etree as ET
 from mock import patch
 
-from iatikit.data.dataset import DatasetSet, Dataset
+from iatikit.data.dataset import DatasetSet, Dataset, _parse_mapping
+from iatikit.utils import mapping
 from iatikit.utils.config import CONFIG
 
 
@@ -110,3 +114,71 @@ class TestDataset(TestCase):
         dataset_metadata = self.old_org_acts.metadata
         assert dataset_metadata.get('extras') \
             .get('publisher_organization_type') == '21'
+
+    def test_dataset_mapping(self):
+        with open(self.old_org_acts.data_path, 'rb') as handler:
+            xml = handler.read()
+        assert self.old_org_acts.mapping[:] == xml
+        # the map is shared by datasets for the same file
+        dataset = Dataset(self.old_org_acts.data_path)
+        assert dataset.mapping is self.old_org_acts.mapping
+
+    def test_dataset_etree_from_mapping(self):
+        etree = self.old_org_acts.etree
+        assert etree.getroot().tag == 'iati-activities'
+        assert etree.docinfo.URL == self.old_org_acts.data_path
+        assert len(etree.findall('iati-activity')) == 2
+
+    def test_mapping_limit(self):
+        paths = [self.old_org_acts.data_path,
+                 self.fixture_org_acts.data_path]
+        with patch.object(mapping, 'MAX_OPEN', 1), \
+                patch.dict(mapping._MAPPINGS, clear=True):
+            for path in paths:
+                mapping.open_mapping(path)
+            assert list(mapping._MAPPINGS.keys()) == paths[1:]
+
+    def test_etree_without_buffer_parsing(self):
+        # lxml < 6 can only parse strings
+        fromstring = ET.fromstring
+
+        def parse_strings(text, *args, **kwargs):
+            if isinstance(text, memoryview):
+                raise ValueError('can only parse strings')
+            return fromstring(text, *args, **kwargs)
+
+        with patch.object(ET, 'fromstring', parse_strings):
+            etree = Dataset(self.old_org_acts.data_path).etree
+            assert etree.docinfo.URL == self.old_org_acts.data_path
+            assert len(etree.findall('iati-activity')) == 2
+            xml = self.old_org_acts.mapping[:]
+            start = xml.index(b'<iati-activity ')
+            end = xml.index(b'</iati-activity>') + len(b'</iati-activity>')
+            element = _parse_mapping(self.old_org_acts.mapping,
+                                     ET.XMLParser(), start, end)
+            assert element.tag == 'iati-activity'
+
+    def test_close_mappings(self):
+        data_path = self.old_org_acts.data_path
+        with patch.dict(mapping._MAPPINGS, clear=True):
+            shared = mapping.open_mapping(data_path)
+            mapping.open_mapping(self.fixture_org_acts.data_path)
+            mapping.close_mappings(dirname(data_path))
+            assert shared.closed
+            assert list(mapping._MAPPINGS.keys()) == [
+                self.fixture_org_acts.data_path]
+            # it's mapped again when it's next needed
+            assert self.old_org_acts.mapping is not shared
+            assert not self.old_org_acts.mapping.closed
+
+    def test_empty_dataset_mapping(self):
+        handle, data_path = tempfile.mkstemp(
+            suffix='.xml', dir=dirname(abspath(__file__)))
+        close(handle)
+        try:
+            dataset = Dataset(data_path)
+            assert dataset.mapping is None
+            assert dataset._read_header() == (None, {})
+            assert not dataset.validate_xml()
+        finally:
+            unlink(data_path)
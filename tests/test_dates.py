@@ -0,0 +1,165 @@
+from datetime import date
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as ET
+
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.index.catalog import Catalog
+from iatikit.index.dates import DateIndex
+from iatikit.utils import instrument
+from iatikit.utils.config import CONFIG
+from iatikit.utils.exceptions import FilterError
+
+
+FILTERS = [
+    {'planned_start__gte': '2012-01-01'},
+    {'planned_start__lt': '2013-02-01'},
+    {'actual_start__lte': '2013-01-16'},
+    {'actual_start__gt': '2013-01-16'},
+    {'actual_end__eq': '2015-12-31'},
+    {'planned_end__gte': '2030-01-01'},
+    {'active_during': ('2014-01-01', '2014-06-30')},
+    {'active_during': ('2016-01-01', '2016-12-31')},
+    {'active_during': ('2015-12-31', '2015-12-31'),
+     'planned_start__lt': '2013-01-01'},
+    {'active_during': ('2014-01-01', '2014-12-31'), 'humanitarian': True},
+]
+
+
+class TestDateIndex(TestCase):
+    def setUp(self):
+        self.dates = DateIndex({
+            'planned_start': [20100101, 20120101, None, 20140101],
+            'actual_start': [None, 20120201, None, None],
+            'planned_end': [20110101, None, None, 20150101],
+            'actual_end': [None, 20130101, None, None],
+        })
+
+    def test_ranges(self):
+        assert self.dates.match(
+            {'planned_start__gte': ['2012-01-01']}) == ({1, 3}, True)
+        assert self.dates.match(
+            {'planned_start__gt': ['2012-01-01']}) == ({3}, True)
+        assert self.dates.match(
+            {'planned_start__lt': ['2012-01-01']}) == ({0}, True)
+        assert self.dates.match(
+            {'planned_start__lte': ['2012-01-01']}) == ({0, 1}, True)
+        assert self.dates.match(
+            {'planned_start': ['2012-01-01']}) == ({1}, True)
+
+    def test_active_during(self):
+        # activity 1 runs from 2012-02-01 to 2013-01-01
+        assert self.dates.active_during(20120101, 20120131) == set()
+        assert self.dates.active_during(20121231, 20130101) == {1}
+        # activity 3 has no actual dates
+        assert self.dates.active_during(20141231, 20141231) == {3}
+        assert self.dates.active_during(20100101, 20200101) == {0, 1, 3}
+
+    def test_other_filters(self):
+        ordinals, complete = self.dates.match({
+            'planned_start__gte': ['2012-01-01'],
+            'humanitarian': [True],
+        })
+        assert ordinals == {1, 3}
+        assert not complete
+        assert self.dates.match({'title': ['test']}) == (None, False)
+
+
+class TestDateFilters(TestCase):
+    def setUp(self):
+        self.registry_path = tempfile.mkdtemp(
+            dir=dirname(abspath(__file__)))
+        shutil.rmtree(self.registry_path)
+        shutil.copytree(
+            join(dirname(abspath(__file__)), 'fixtures', 'registry'),
+            self.registry_path)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.catalog = Catalog(self.registry_path)
+        self.skips = []
+        instrument.subscribe(self._listener)
+
+    def _listener(self, event, data):
+        if event == 'index_skips':
+            self.skips.append(data['dataset'])
+
+    def _datasets(self):
+        return DatasetSet(join(self.registry_path, 'data', '*', '*'),
+                          join(self.registry_path, 'metadata', '*', '*'))
+
+    def _identifiers(self, **kwargs):
+        activities = ActivitySet(self._datasets()).where(**kwargs)
+        return [activity.iati_identifier for activity in activities.all()]
+
+    def test_active_during_xpath(self):
+        start, end = date(2014, 1, 1), date(2014, 12, 31)
+        expected = [
+            activity.iati_identifier
+            for activity in ActivitySet(self._datasets()).all()
+            if activity.start is not None and activity.start <= end and
+            (activity.end is None or activity.end >= start)]
+        assert expected
+        assert self._identifiers(
+            active_during=('2014-01-01', '2014-12-31')) == expected
+
+    def test_active_during_invalid(self):
+        with self.assertRaises(FilterError):
+            self._identifiers(active_during='2014-01-01')
+
+    def test_filters_match_xml(self):
+        expected = [self._identifiers(**wheres) for wheres in FILTERS]
+        self.catalog.build()
+        for wheres, identifiers in zip(FILTERS, expected):
+            assert self._identifiers(**wheres) == identifiers, wheres
+            assert len(ActivitySet(self._datasets()).where(**wheres)) == \
+                len(identifiers)
+
+    def test_datasets_not_parsed(self):
+        self.catalog.build()
+        datasets = self._datasets().all()
+        activities = ActivitySet(
+            datasets, active_during=[('2015-06-01', '2015-06-30')])
+        identifiers = [act.iati_identifier for act in activities]
+        # activities without an end date are still ongoing
+        assert identifiers == ['GB-COH-01234567-1',
+                               'GB-COH-01234567-Humanitarian Aid-0',
+                               'GB-COH-01234567-Humanitarian Aid-2',
+                               'NL-CHC-98765-NL-CHC-98765-XX0D9001',
+                               'NL-CHC-98765-NL-CHC-98765-XGG00NS00']
+        assert all(dataset._etree is None for dataset in datasets)
+
+    def test_index_skips(self):
+        self.catalog.build()
+        activities = ActivitySet(
+            self._datasets().all(), actual_start__gte=['2015-01-01'])
+        assert len([act for act in activities]) == 2
+        assert self.skips == ['fixture-org-activities',
+                              'fixture-org-activities2']
+
+    def test_match_dates(self):
+        self.catalog.build()
+        results = list(self.catalog.match_dates(
+            active_during=('2015-06-01', '2015-06-30'),
+            actual_start__gte='2015-01-01'))
+        assert len(results) == 1
+        data_path, offsets = results[0]
+        assert data_path.endswith('old-org-acts.xml')
+        with open(data_path, 'rb') as handler:
+            xml = handler.read()
+        identifiers = [
+            ET.fromstring(xml[start:end]).findtext('iati-identifier')
+            for start, end in offsets]
+        assert identifiers == ['NL-CHC-98765-NL-CHC-98765-XX0D9001',
+                               'NL-CHC-98765-NL-CHC-98765-XGG00NS00']
+        with self.assertRaises(FilterError):
+            list(self.catalog.match_dates(title='test'))
+
+    def tearDown(self):
+        instrument.unsubscribe(self._listener)
+        shutil.rmtree(self.registry_path, ignore_errors=True)
@@ -0,0 +1,63 @@
+from os.path import abspath, dirname, join
+from unittest import TestCase
+
+from iatikit.data.dataset import Dataset, DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.utils.config import CONFIG
+
+
+class TestDetached(TestCase):
+    def setUp(self):
+        self.registry_path = join(dirname(abspath(__file__)),
+                                  'fixtures', 'registry')
+        datasets = DatasetSet(
+            join(self.registry_path, 'data', '*', '*'),
+            join(self.registry_path, 'metadata', '*', '*'),
+        )
+        self.activities = ActivitySet(datasets)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+
+    def test_detached_activities(self):
+        expected = [(act.iati_identifier, act.title)
+                    for act in self.activities]
+        activities = self.activities.detached().all()
+
+        assert [(act.iati_identifier, act.title)
+                for act in activities] == expected
+        for activity in activities:
+            # a standalone copy, rather than part of the dataset tree
+            assert activity.etree.getroottree().getroot() is activity.etree
+            # the dataset tree has been released
+            assert activity.dataset._etree is None
+
+    def test_detached_releases_as_iteration_moves_on(self):
+        activities = iter(self.activities.detached())
+        first = next(activities)
+        assert first.dataset._etree is not None
+        for activity in activities:
+            if activity.dataset is not first.dataset:
+                break
+        assert first.dataset._etree is None
+        activities.close()
+
+    def test_detached_keeps_existing_trees(self):
+        dataset = Dataset(join(self.registry_path, 'data', 'fixture-org',
+                               'fixture-org-activities.xml'))
+        etree = dataset.etree
+        activities = ActivitySet([dataset]).detached().all()
+        assert len(activities) == 1
+        assert dataset._etree is etree
+
+    def test_detached_caps_prefetching(self):
+        activities = self.activities.prefetch(4)
+        assert activities._prefetch_options()['ahead'] == 4
+        assert activities.detached(max_trees=3)._prefetch_options()[
+            'ahead'] == 2
+        assert activities.detached(max_trees=1)._prefetch_options() is None
+
+        expected = [act.iati_identifier for act in self.activities]
+        assert [act.iati_identifier for act in
+                activities.detached(max_trees=2)] == expected
@@ -1,28 +1,90 @@
+import hashlib
+import json
 from io import BytesIO
 import os
-from os.path import abspath, dirname, join
+from os.path import abspath, dirname, exists, join
 import shutil
 import tempfile
+import threading
 from unittest import TestCase
 import zipfile
 
 from mock import patch
+import pytest
+import requests
 
 from iatikit.utils import download
 from iatikit.utils.config import CONFIG
+from iatikit.utils.exceptions import DownloadError
+
+
+def _zip_fixtures():
+    registry_path = join(dirname(abspath(__file__)),
+                         'fixtures', 'registry')
+    raw = BytesIO()
+    with zipfile.ZipFile(raw, 'w') as ziph:
+        for root, _, files in os.walk(registry_path):
+            for file in files:
+                fullpath = join(root, file)
+                ziph.write(fullpath, fullpath[len(registry_path):])
+    return raw.getvalue()
 
 
 class MockRequest():
-    def __init__(self, url, stream=False):
-        registry_path = join(dirname(abspath(__file__)),
-                             'fixtures', 'registry')
-        self.raw = BytesIO()
-        with zipfile.ZipFile(self.raw, 'w') as ziph:
-            for root, _, files in os.walk(registry_path):
-                for file in files:
-                    fullpath = join(root, file)
-                    ziph.write(fullpath, fullpath[len(registry_path):])
-        self.raw.seek(0)
+    content = _zip_fixtures()
+    # number of bytes to send before dropping the connection
+    drop_after = None
+    calls = []
+
+    def __init__(self, url, headers=None, stream=False, timeout=None):
+        self.calls.append(headers)
+        headers = headers or {}
+        self.status_code = 200
+        self.headers = {'ETag': '"dump"'}
+        self.body = self.content
+        if 'Range' in headers:
+            self.status_code = 206
+            offset = int(headers['Range'][6:-1])
+            self.body = self.content[offset:]
+            self.headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                offset, len(self.content) - 1, len(self.content))
+        self.headers['Content-Length'] = str(len(self.body))
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        # simulate data arriving in small packets
+        chunk_size = 1024
+        sent = 0
+        for idx in range(0, len(self.body), chunk_size):
+            chunk = self.body[idx:idx + chunk_size]
+            if self.drop_after is not None and \
+                    sent + len(chunk) > self.drop_after:
+                MockRequest.drop_after = None
+                raise requests.exceptions.ChunkedEncodingError(
+                    'Connection broken')
+            sent += len(chunk)
+            yield chunk
+
+
+class _Counter(object):
+    """An indexer that just counts the bytes it's fed."""
+
+    def __init__(self):
+        self.size = 0
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+
+    def close(self):
+        return self
+
+    def save(self, filepath):
+        pass
 
 
 class TestDownloadData(TestCase):
@@ -30,26 +92,91 @@ class TestDownloadData(TestCase):
         self.data_path = tempfile.mkdtemp(dir=dirname(abspath(__file__)))
         config_dict = {'paths': {'registry': self.data_path}}
         CONFIG.read_dict(config_dict)
+        MockRequest.calls = []
+        MockRequest.drop_after = None
+
+    def _list_files(self, path):
+        all_files = []
+        for root, _, files in os.walk(path):
+            for file in files:
+                all_files.append(join(root, file)[len(path):])
+        return all_files
 
     @patch('requests.get', MockRequest)
     def test_download_data(self):
-        def list_files(path):
-            all_files = []
-            for root, _, files in os.walk(path):
-                for file in files:
-                    all_files.append(join(root, file)[len(path):])
-            return all_files
-
-        download.data()
+        content_hash = download.data()
 
         registry_path = join(dirname(abspath(__file__)),
                              'fixtures', 'registry')
-        source_files = list_files(registry_path)
-        dest_files = list_files(self.data_path)
+        source_files = self._list_files(registry_path)
+        dest_files = self._list_files(self.data_path)
 
         assert len(source_files) == len(dest_files)
         for dest_file in dest_files:
             assert dest_file in source_files
+        assert content_hash == hashlib.sha256(
+            MockRequest.content).hexdigest()
+        assert not exists(join(dirname(self.data_path), 'iati_dump.zip'))
+
+    @patch('time.sleep')
+    @patch('requests.get', MockRequest)
+    def test_download_data_resumes(self, fake_sleep):
+        MockRequest.drop_after = len(MockRequest.content) // 2
+        progress = []
+        content_hash = download.data(
+            progress=lambda done, total, rate: progress.append(
+                (done, total)))
+
+        assert content_hash == hashlib.sha256(
+            MockRequest.content).hexdigest()
+        assert len(MockRequest.calls) == 2
+        assert MockRequest.calls[1]['Range'].startswith('bytes=')
+        assert progress[-1] == (len(MockRequest.content),
+                                len(MockRequest.content))
+        assert exists(join(self.data_path, 'metadata.json'))
+
+    @patch('requests.get', MockRequest)
+    def test_download_data_corrupt_zip(self):
+        with open(join(self.data_path, 'existing.txt'), 'w') as handler:
+            handler.write('existing data')
+
+        with patch.object(MockRequest, 'content',
+                          MockRequest.content[:-100]):
+            with pytest.raises(DownloadError):
+                download.data()
+
+        # existing data is untouched
+        assert exists(join(self.data_path, 'existing.txt'))
+        assert not exists(join(dirname(self.data_path), 'iati_dump.zip'))
+
+    @patch('requests.get', MockRequest)
+    def test_download_data_with_index(self):
+        download.data(index=True)
+
+        index_path = join(self.data_path, 'index', 'old-org',
+                          'old-org-acts.json')
+        assert exists(index_path)
+        with open(index_path) as handler:
+            assert json.load(handler)['count'] == 2
+
+    @patch('time.sleep')
+    @patch('requests.get', MockRequest)
+    def test_failed_stream_stops_indexer(self, fake_sleep):
+        MockRequest.drop_after = len(MockRequest.content) // 2
+        zip_filepath = join(dirname(self.data_path), 'iati_dump.zip')
+        threads = threading.active_count()
+        download._stream_to_file(
+            'http://example.com/iati_dump.zip', zip_filepath, retries=3,
+            indexer=_Counter)
+        assert len(MockRequest.calls) == 2
+        assert threading.active_count() == threads
 
     def tearDown(self):
         shutil.rmtree(self.data_path, ignore_errors=True)
+        zip_filepath = join(dirname(self.data_path), 'iati_dump.zip')
+        for filepath in [
+                zip_filepath,
+                download._hidden_path(zip_filepath, '.part'),
+                download._hidden_path(zip_filepath, '.headers')]:
+            if exists(filepath):
+                os.unlink(filepath)
@@ -0,0 +1,209 @@
+from glob import glob
+import gzip
+from io import BytesIO
+import json
+import os
+from os.path import abspath, dirname, exists, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+import pytest
+
+from iatikit.utils import download
+from iatikit.utils.config import CONFIG
+from iatikit.utils.exceptions import NoDataError
+
+
+FIXTURE_URLS = {
+    'http://fixture.org/iati/activity.xml':
+        join('fixture-org', 'fixture-org-activities.xml'),
+    'http://fixture.org/iati/activity2.xml':
+        join('fixture-org', 'fixture-org-activities2.xml'),
+    'http://fixture.org/iati/organisation.xml':
+        join('fixture-org', 'fixture-org-org.xml'),
+    'https://old-org.nl/sites/default/files/IATI/activities.xml':
+        join('old-org', 'old-org-acts.xml'),
+}
+
+
+class MockRequest():
+    calls = []
+
+    def __init__(self, url, headers=None, stream=False, timeout=None):
+        self.calls.append((url, headers))
+        headers = headers or {}
+        self.headers = {'ETag': '"etag-{}"'.format(url)}
+        fixture = FIXTURE_URLS.get(url)
+        if fixture is None:
+            self.status_code = 404
+            self.content = b''
+            return
+        with open(join(dirname(abspath(__file__)), 'fixtures', 'registry',
+                       'data', fixture), 'rb') as handler:
+            self.content = handler.read()
+        if headers.get('If-None-Match') == self.headers['ETag']:
+            self.status_code = 304
+        elif 'Range' in headers:
+            self.status_code = 206
+            offset = int(headers['Range'][6:-1])
+            self.content = self.content[offset:]
+        else:
+            self.status_code = 200
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise download.requests.exceptions.HTTPError(self.status_code)
+
+    def iter_content(self, chunk_size=1):
+        for idx in range(0, len(self.content), chunk_size):
+            yield self.content[idx:idx + chunk_size]
+
+
+class MockRaw(object):
+    def __init__(self, size):
+        self.size = size
+
+    def tell(self):
+        return self.size
+
+
+class GzipMockRequest(MockRequest):
+    """A response with ``Content-Encoding: gzip``. ``Content-Length``
+    is the size of the compressed body, while ``iter_content()``
+    yields the decoded file.
+    """
+    # stop sending the compressed body halfway through
+    truncate = False
+
+    def __init__(self, url, headers=None, stream=False, timeout=None):
+        MockRequest.__init__(self, url, headers, stream, timeout)
+        if self.status_code != 200:
+            return
+        buf = BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as handler:
+            handler.write(self.content)
+        compressed = buf.getvalue()
+        self.headers['Content-Encoding'] = 'gzip'
+        self.headers['Content-Length'] = str(len(compressed))
+        sent = len(compressed) // 2 if self.truncate else len(compressed)
+        self.raw = MockRaw(sent)
+
+
+class TestDownloadDatasets(TestCase):
+    def setUp(self):
+        self.registry_path = tempfile.mkdtemp(
+            dir=dirname(abspath(__file__)))
+        shutil.copytree(
+            join(dirname(abspath(__file__)), 'fixtures', 'registry',
+                 'metadata'),
+            join(self.registry_path, 'metadata'))
+        config_dict = {'paths': {'registry': self.registry_path}}
+        CONFIG.read_dict(config_dict)
+        MockRequest.calls = []
+
+    def _data_filepath(self, *args):
+        return join(self.registry_path, 'data', *args)
+
+    @patch('requests.get', MockRequest)
+    def test_download_datasets(self):
+        statuses = download.datasets()
+
+        assert statuses == {
+            'fixture-org-activities': 'downloaded',
+            'fixture-org-activities2': 'downloaded',
+            'fixture-org-org': 'downloaded',
+            'old-org-acts': 'downloaded',
+            'old-org-missing-acts': 'failed',
+        }
+        assert sorted(glob(self._data_filepath('fixture-org', '*'))) == [
+            self._data_filepath('fixture-org', 'fixture-org-activities.xml'),
+            self._data_filepath('fixture-org', 'fixture-org-activities2.xml'),
+            self._data_filepath('fixture-org', 'fixture-org-org.xml'),
+        ]
+        assert exists(self._data_filepath('old-org', 'old-org-acts.xml'))
+
+    @patch('requests.get', MockRequest)
+    def test_download_datasets_by_publisher(self):
+        statuses = download.datasets(publishers=['old-org'])
+        assert sorted(statuses.keys()) == [
+            'old-org-acts', 'old-org-missing-acts']
+        assert not exists(self._data_filepath('fixture-org'))
+
+    @patch('requests.get', MockRequest)
+    def test_download_datasets_not_modified(self):
+        download.datasets(publishers=['fixture-org'])
+        statuses = download.datasets(publishers=['fixture-org'])
+        assert set(statuses.values()) == {'not modified'}
+
+    @patch('requests.get', MockRequest)
+    def test_download_datasets_resumes_partial_download(self):
+        filepath = self._data_filepath('old-org', 'old-org-acts.xml')
+        with open(join(dirname(abspath(__file__)), 'fixtures', 'registry',
+                       'data', 'old-org', 'old-org-acts.xml'), 'rb') as f:
+            expected = f.read()
+        url = 'https://old-org.nl/sites/default/files/IATI/activities.xml'
+        os.makedirs(dirname(filepath))
+        with open(download._hidden_path(filepath, '.part'), 'wb') as f:
+            f.write(expected[:100])
+        with open(download._hidden_path(filepath, '.headers'), 'w') as f:
+            json.dump({'part_etag': '"etag-{}"'.format(url)}, f)
+
+        download.datasets(publishers=['old-org'])
+
+        assert (url, {'Range': 'bytes=100-',
+                      'If-Range': '"etag-{}"'.format(url),
+                      'Accept-Encoding': 'identity'}) in MockRequest.calls
+        with open(filepath, 'rb') as handler:
+            assert handler.read() == expected
+        assert not exists(download._hidden_path(filepath, '.part'))
+
+    @patch('requests.get', MockRequest)
+    def test_download_datasets_restarts_without_validator(self):
+        # without a validator for If-Range, the partial download
+        # could be from another version of the file
+        filepath = self._data_filepath('old-org', 'old-org-acts.xml')
+        with open(join(dirname(abspath(__file__)), 'fixtures', 'registry',
+                       'data', 'old-org', 'old-org-acts.xml'), 'rb') as f:
+            expected = f.read()
+        os.makedirs(dirname(filepath))
+        with open(download._hidden_path(filepath, '.part'), 'wb') as f:
+            f.write(b'<stale>' * 20)
+
+        download.datasets(publishers=['old-org'])
+
+        assert all('Range' not in (headers or {})
+                   for _, headers in MockRequest.calls)
+        with open(filepath, 'rb') as handler:
+            assert handler.read() == expected
+
+    @patch('requests.get', GzipMockRequest)
+    def test_download_datasets_gzip_encoded(self):
+        statuses = download.datasets(publishers=['old-org'])
+        assert statuses['old-org-acts'] == 'downloaded'
+        filepath = self._data_filepath('old-org', 'old-org-acts.xml')
+        with open(join(dirname(abspath(__file__)), 'fixtures', 'registry',
+                       'data', 'old-org', 'old-org-acts.xml'), 'rb') as f:
+            assert open(filepath, 'rb').read() == f.read()
+
+    @patch('requests.get', GzipMockRequest)
+    def test_download_datasets_gzip_encoded_truncated(self):
+        GzipMockRequest.truncate = True
+        try:
+            statuses = download.datasets(publishers=['old-org'])
+        finally:
+            GzipMockRequest.truncate = False
+        assert statuses['old-org-acts'] == 'failed'
+        assert not exists(self._data_filepath('old-org', 'old-org-acts.xml'))
+
+    def test_download_datasets_without_metadata(self):
+        shutil.rmtree(join(self.registry_path, 'metadata'))
+        with pytest.raises(NoDataError):
+            download.datasets()
+
+    def tearDown(self):
+        shutil.rmtree(self.registry_path, ignore_errors=True)
@@ -0,0 +1,96 @@
+import logging
+from os.path import abspath, dirname, join
+from unittest import TestCase
+
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.data.organisation import OrganisationSet
+from iatikit.data.sector import Sector
+from iatikit.utils import explain
+from iatikit.utils.config import CONFIG
+
+
+class TestExplain(TestCase):
+    def setUp(self):
+        registry_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'registry')
+        self.datasets = DatasetSet(
+            join(registry_path, 'data', '*', '*'),
+            join(registry_path, 'metadata', '*', '*'),
+        )
+        self.activities = ActivitySet(self.datasets)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+
+    def tearDown(self):
+        CONFIG.remove_section('query_log')
+        explain.slow_queries.clear()
+
+    def test_explain_activities(self):
+        sector = Sector('15153', vocabulary='DAC')
+        plan = self.activities.where(sector=sector).explain()
+
+        assert sorted(plan.queries.keys()) == ['1.03', '1.05', '2.03']
+        assert '@vocabulary = "1"' in plan.queries['2.03']
+        assert '@vocabulary = "DAC"' in plan.queries['1.05']
+        names = [dataset['name'] for dataset in plan.datasets]
+        assert names == [
+            'fixture-org-activities',
+            'fixture-org-activities2',
+            'old-org-acts',
+        ]
+        assert plan.estimated_cost > sum(
+            dataset['bytes'] for dataset in plan.datasets)
+        assert 'v2.03: /iati-activities/iati-activity[' in str(plan)
+
+    def test_explain_filters_increase_cost(self):
+        unfiltered = self.activities.explain()
+        filtered = self.activities.where(
+            iati_identifier='NL-CHC-98765-NL-CHC-98765-XGG00NS00').explain()
+        assert filtered.estimated_cost > unfiltered.estimated_cost
+
+    def test_explain_does_not_parse(self):
+        datasets = list(self.datasets)
+        ActivitySet(datasets).explain()
+        assert all(dataset._etree is None for dataset in datasets)
+
+    def test_explain_organisations(self):
+        plan = OrganisationSet(self.datasets).explain()
+        assert list(plan.queries.keys()) == ['2.03']
+        assert [dataset['name'] for dataset in plan.datasets] == [
+            'fixture-org-org']
+
+    def test_explain_datasets(self):
+        plan = self.datasets.where(filetype='activity').explain()
+        assert plan.queries == {}
+        assert plan.estimated_cost == 0
+
+        plan = self.datasets.where(xpath='//sector').explain()
+        assert plan.queries == {'*': '//sector'}
+        assert plan.estimated_cost > 0
+
+    def test_slow_query_log(self):
+        CONFIG.read_dict({'query_log': {'threshold': '0'}})
+        logger = logging.getLogger('iatikit.utils.explain')
+        with self.assertLogs(logger, level='WARNING') as logs:
+            count = self.activities.count()
+
+        assert len(logs.output) == 1
+        assert 'Slow query (count took' in logs.output[0]
+        record = explain.slow_queries[-1]
+        assert record['operation'] == 'count'
+        assert record['results'] == count
+        assert record['plan']['target'] == 'ActivitySet'
+
+    def test_slow_query_log_iteration(self):
+        CONFIG.read_dict({'query_log': {'threshold': '0'}})
+        activities = self.activities.all()
+        record = explain.slow_queries[-1]
+        assert record['operation'] == 'iterate'
+        assert record['results'] == len(activities)
+
+    def test_slow_query_log_disabled(self):
+        self.activities.all()
+        assert len(explain.slow_queries) == 0
@@ -0,0 +1,140 @@
+import gzip
+import json
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+import unicodecsv as csv
+
+from iatikit.data.dataset import Dataset, DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.data.organisation import OrganisationSet
+from iatikit.utils.config import CONFIG
+
+
+FIELDS = ['iati_identifier', 'title', 'planned_start', 'humanitarian']
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        registry_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'registry')
+        self.datasets = DatasetSet(
+            join(registry_path, 'data', '*', '*'),
+            join(registry_path, 'metadata', '*', '*'),
+        )
+        self.activities = ActivitySet(self.datasets)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.tmp_path = tempfile.mkdtemp(dir=dirname(abspath(__file__)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def _read_csv(self, path, opener=open):
+        with opener(path, 'rb') as handler:
+            return list(csv.reader(handler, encoding='utf-8'))
+
+    def test_export_csv(self):
+        path = join(self.tmp_path, 'activities.csv')
+        rows = self.activities.export(path, FIELDS)
+
+        lines = self._read_csv(path)
+        assert rows == 6
+        assert lines[0] == FIELDS
+        assert len(lines) == 7
+        assert lines[1] == [
+            'GB-COH-01234567-1', 'Development work', '2011-11-01', 'true']
+        assert lines[5][2] == ''
+
+    def test_export_jsonl_gzip(self):
+        path = join(self.tmp_path, 'activities.jsonl.gz')
+        self.activities.export(path, FIELDS, format='jsonl')
+
+        with gzip.open(path, 'rb') as handler:
+            records = [json.loads(line.decode('utf-8'))
+                       for line in handler]
+        assert len(records) == 6
+        assert records[0] == {
+            'iati_identifier': 'GB-COH-01234567-1',
+            'title': ['Development work'],
+            'planned_start': '2011-11-01',
+            'humanitarian': True,
+        }
+
+    def test_export_processes(self):
+        serial_path = join(self.tmp_path, 'serial.csv')
+        parallel_path = join(self.tmp_path, 'parallel.csv.gz')
+        activities = self.activities.where(planned_start__gte='2010-01-01')
+        activities.export(serial_path, FIELDS)
+        rows = activities.export(parallel_path, FIELDS, processes=2)
+
+        assert rows == 3
+        assert self._read_csv(parallel_path, gzip.open) == \
+            self._read_csv(serial_path)
+
+    def test_export_organisations(self):
+        path = join(self.tmp_path, 'organisations.csv')
+        rows = OrganisationSet(self.datasets).export(
+            path, ['org_identifier'])
+        assert rows == 1
+        assert len(self._read_csv(path)) == 2
+
+    def test_export_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.activities.export(join(self.tmp_path, 'out.xls'), FIELDS,
+                                   format='xls')
+
+
+class TestWriteXML(TestCase):
+    def setUp(self):
+        registry_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'registry')
+        self.activities = ActivitySet(DatasetSet(
+            join(registry_path, 'data', '*', '*'),
+            join(registry_path, 'metadata', '*', '*'),
+        ))
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.tmp_path = tempfile.mkdtemp(dir=dirname(abspath(__file__)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_write_xml(self):
+        activities = self.activities.where(planned_start__gte='2012-01-01')
+        path = join(self.tmp_path, 'activities.xml')
+        counts = activities.write_xml(path)
+
+        assert counts == {path: 2}
+        dataset = Dataset(path)
+        assert dataset.root == 'iati-activities'
+        assert dataset.version == '1.05'
+        assert dataset.etree.getroot().get('generated-datetime')
+        assert [act.iati_identifier for act in dataset.activities] == \
+            [act.iati_identifier for act in activities]
+
+    def test_write_xml_per_version(self):
+        path = join(self.tmp_path, 'activities-{version}.xml')
+        counts = self.activities.write_xml(path)
+
+        assert counts == {
+            path.format(version='1.03'): 2,
+            path.format(version='1.05'): 3,
+            path.format(version='2.03'): 1,
+        }
+        for version in ['1.03', '1.05', '2.03']:
+            dataset = Dataset(path.format(version=version))
+            assert dataset.version == version
+            assert len(dataset.activities) == \
+                counts[path.format(version=version)]
+
+    def test_write_xml_mixed_versions(self):
+        path = join(self.tmp_path, 'activities.xml')
+        with self.assertRaises(ValueError):
+            self.activities.write_xml(path)
@@ -0,0 +1,47 @@
+import re
+import subprocess
+import sys
+from unittest import TestCase
+
+import pytest
+
+
+# Maximum cumulative time (in microseconds) that
+# ``import iatikit`` may take
+IMPORT_TIME_BUDGET = 100000
+
+
+def _run(code, *args):
+    return subprocess.run(
+        [sys.executable] + list(args) + ['-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='requires python3.7 or higher')
+class TestImportTime(TestCase):
+    def test_import_time(self):
+        # run a few times, and take the fastest, to smooth out noise
+        timings = []
+        for _ in range(3):
+            result = _run('import iatikit', '-X', 'importtime')
+            match = re.search(r'^import time:\s+\d+ \|\s+(\d+) \| iatikit$',
+                              result.stderr, re.MULTILINE)
+            timings.append(int(match.group(1)))
+        assert min(timings) < IMPORT_TIME_BUDGET
+
+    def test_import_is_lazy(self):
+        code = 'import sys, iatikit; ' + \
+               'print(" ".join(sorted(sys.modules)))'
+        modules = _run(code).stdout.split()
+        for module in ['requests', 'lxml', 'unicodecsv',
+                       'iatikit.utils.download', 'iatikit.data.registry']:
+            assert module not in modules
+
+    def test_lazy_attributes(self):
+        code = 'import iatikit; ' + \
+               'print(iatikit.download.__name__, ' + \
+               'iatikit.Activity.__name__, callable(iatikit.data))'
+        assert _run(code).stdout.split() == [
+            'iatikit.utils.download', 'Activity', 'True']
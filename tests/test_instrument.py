@@ -0,0 +1,75 @@
+import json
+import logging
+from os.path import abspath, dirname, join
+from unittest import TestCase
+
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.utils import instrument
+from iatikit.utils.config import CONFIG
+
+
+class TestInstrument(TestCase):
+    def setUp(self):
+        registry_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'registry')
+        datasets = DatasetSet(
+            join(registry_path, 'data', 'fixture-org', '*'),
+            join(registry_path, 'metadata', 'fixture-org', '*'),
+        )
+        self.activities = ActivitySet(datasets)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+
+    def test_instrument_iteration(self):
+        with instrument.instrument() as recorder:
+            activities = self.activities.all()
+        summary = recorder.summary()
+
+        assert summary['counters']['objects_yielded'] == len(activities)
+        assert summary['counters']['datasets_yielded'] == 3
+        # the organisation dataset is skipped, based on its metadata
+        assert summary['counters']['files_opened'] == 2
+        assert summary['counters']['bytes_parsed'] > 0
+        assert summary['timings']['parse']['count'] == 2
+        assert summary['timings']['xpath_compile']['count'] == 2
+        assert summary['timings']['xpath_eval']['count'] == 2
+        dataset_stats = summary['datasets']['fixture-org-activities']
+        assert dataset_stats['files_opened'] == 1
+        assert 'parse_seconds' in dataset_stats
+        json.dumps(summary)
+
+    def test_instrument_count(self):
+        with instrument.instrument() as recorder:
+            self.activities.where(humanitarian=True).count()
+        summary = recorder.summary()
+        assert summary['counters']['etree_cache_hit'] > 0
+        assert summary['counters']['etree_cache_miss'] == 2
+
+    def test_unsubscribed_after_context(self):
+        events = []
+
+        def listener(event, data):
+            events.append(event)
+
+        with instrument.instrument(listener):
+            list(self.activities)
+        count = len(events)
+        assert count > 0
+        assert not instrument.enabled()
+        list(self.activities)
+        assert len(events) == count
+
+    def test_recorder_log(self):
+        recorder = instrument.Recorder()
+        recorder('parse', {'value': 1, 'seconds': 0.5})
+        recorder('files_opened', {'value': 2})
+        logger = logging.getLogger('test_recorder_log')
+        with self.assertLogs(logger, level='INFO') as logs:
+            recorder.log(logger)
+        assert logs.output == [
+            'INFO:test_recorder_log:files_opened: 2',
+            'INFO:test_recorder_log:parse: 1 (0.500s total, 0.500s max)',
+        ]
@@ -0,0 +1,100 @@
+from os.path import abspath, dirname, join
+import threading
+import time
+from unittest import TestCase
+
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.utils.config import CONFIG
+from iatikit.utils.prefetch import prefetch
+
+
+class TestPrefetch(TestCase):
+    def test_prefetch_order(self):
+        def load(item):
+            # finish out of order
+            time.sleep(0.01 * (5 - item))
+            return item * 2
+        results = list(prefetch(range(5), load, ahead=3))
+        assert results == [(0, 0), (1, 2), (2, 4), (3, 6), (4, 8)]
+
+    def test_prefetch_ahead(self):
+        lock = threading.Lock()
+        loaded = []
+
+        def load(item):
+            with lock:
+                loaded.append(item)
+            return item
+
+        items = prefetch(range(10), load, ahead=2)
+        next(items)
+        time.sleep(0.05)
+        assert sorted(loaded) == [0, 1]
+        items.close()
+
+    def test_prefetch_max_bytes(self):
+        lock = threading.Lock()
+        loaded = []
+
+        def load(item):
+            with lock:
+                loaded.append(item)
+            return item
+
+        items = prefetch(range(10), load, ahead=5,
+                         max_bytes=25, size=lambda item: 10)
+        next(items)
+        time.sleep(0.05)
+        # at most 2 items' worth of bytes are loaded at once
+        assert sorted(loaded) == [0, 1]
+        next(items)
+        time.sleep(0.05)
+        assert sorted(loaded) == [0, 1, 2]
+        items.close()
+
+    def test_prefetch_oversized_item(self):
+        items = prefetch(range(3), lambda item: item, ahead=2,
+                         max_bytes=5, size=lambda item: 10)
+        assert list(items) == [(0, 0), (1, 1), (2, 2)]
+
+    def test_prefetch_error(self):
+        def load(item):
+            if item == 1:
+                raise ValueError('bad item')
+            return item
+        items = prefetch(range(3), load)
+        assert next(items) == (0, 0)
+        with self.assertRaises(ValueError):
+            next(items)
+
+
+class TestPrefetchActivities(TestCase):
+    def setUp(self):
+        registry_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'registry')
+        datasets = DatasetSet(
+            join(registry_path, 'data', '*', '*'),
+            join(registry_path, 'metadata', '*', '*'),
+        )
+        self.activities = ActivitySet(datasets)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+
+    def test_prefetch_activities(self):
+        expected = [act.iati_identifier for act in self.activities]
+        activities = self.activities.prefetch(2)
+        assert [act.iati_identifier for act in activities] == expected
+        assert len(activities) == len(expected)
+
+    def test_prefetch_filtered(self):
+        activities = self.activities.prefetch(2, max_bytes=1).where(
+            iati_identifier='NL-CHC-98765-NL-CHC-98765-XGG00NS00')
+        assert len(activities.all()) == 1
+
+    def test_prefetch_off(self):
+        activities = self.activities.prefetch(2).prefetch(0)
+        assert activities._prefetch is None
+        assert self.activities._prefetch is None
@@ -0,0 +1,99 @@
+from os.path import abspath, dirname, join
+from unittest import TestCase
+
+from lxml import etree as ET
+
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.data.organisation import OrganisationSet
+from iatikit.standard.activity_schema import ActivitySchema105, \
+    ActivitySchema203
+from iatikit.utils.config import CONFIG
+from iatikit.utils.records import RecordReader
+
+
+FIELDS = [
+    'iati_identifier', 'title', 'description', 'location',
+    'humanitarian', 'planned_start', 'actual_start', 'planned_end',
+    'actual_end', 'start', 'end', 'version',
+]
+
+
+class TestRecords(TestCase):
+    def setUp(self):
+        registry_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'registry')
+        self.datasets = DatasetSet(
+            join(registry_path, 'data', '*', '*'),
+            join(registry_path, 'metadata', '*', '*'),
+        )
+        self.activities = ActivitySet(self.datasets)
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+
+    @staticmethod
+    def _comparable(values):
+        out = []
+        for value in values:
+            if isinstance(value, list):
+                value = [repr(x) if hasattr(x, 'vocabulary') else
+                         (ET.tostring(x) if hasattr(x, 'tag') else x)
+                         for x in value]
+            out.append(value)
+        return tuple(out)
+
+    def test_records_match_properties(self):
+        expected = [
+            self._comparable(getattr(activity, field) for field in FIELDS)
+            for activity in self.activities]
+        records = [self._comparable(record)
+                   for record in self.activities.records(FIELDS)]
+        assert len(records) == 6
+        assert records == expected
+
+    def test_records_as_dict(self):
+        iati_identifier = 'NL-CHC-98765-NL-CHC-98765-XGG00NS00'
+        records = list(self.activities.where(
+            iati_identifier=iati_identifier,
+        ).records(['iati_identifier', 'humanitarian'], as_dict=True))
+        assert records == [{
+            'iati_identifier': iati_identifier,
+            'humanitarian': False,
+        }]
+
+    def test_organisation_records(self):
+        records = list(OrganisationSet(self.datasets).records(
+            ['org_identifier']))
+        assert len(records) == 1
+        assert records[0][0] is not None
+
+    def test_reader_splits_on_child_tag(self):
+        reader = RecordReader(ActivitySchema203, [
+            'title', 'planned_start', 'humanitarian', 'start', 'xpath'])
+        assert sorted(reader.fields) == [
+            'humanitarian', 'planned_start', 'title']
+        assert reader._direct == ['humanitarian']
+        assert sorted(reader._by_tag.keys()) == ['activity-date', 'title']
+
+    def test_reader_values(self):
+        element = ET.fromstring(
+            '<iati-activity>'
+            '<iati-identifier>AA-1</iati-identifier>'
+            '<activity-date type="start-planned" iso-date="2012-01-02"/>'
+            '<activity-date type="end-planned" iso-date="2013-01-02"/>'
+            '<title>Title 1</title>'
+            '<title>Title 2</title>'
+            '<sector code="15153" vocabulary="DAC" percentage="50"/>'
+            '</iati-activity>')
+        reader = RecordReader(ActivitySchema105, [
+            'iati_identifier', 'title', 'planned_end', 'actual_end',
+            'sector'])
+        values = reader.read(element)
+        assert values['iati_identifier'] == ['AA-1']
+        assert values['title'] == ['Title 1', 'Title 2']
+        assert str(values['planned_end'][0]) == '2013-01-02'
+        assert values['actual_end'] == []
+        assert values['sector'][0].code.code == '15153'
+        assert values['sector'][0].percentage == 50.
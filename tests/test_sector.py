@@ -1,9 +1,11 @@
 from os.path import abspath, dirname, join
 from unittest import TestCase
 
+from mock import patch
 import pytest
 
 from iatikit import Sector
+from iatikit.data import sector as sector_module
 from iatikit.standard.codelist import Codelist
 from iatikit.utils.exceptions import UnknownSectorVocabError, \
                                     UnknownSectorCodeError, \
@@ -64,3 +66,35 @@ class TestSector(TestCase):
         codelist_item = codelist.get('DAC')
         with pytest.raises(InvalidSectorCodeError):
             Sector(codelist_item)
+
+    def test_sector_shared_codes(self):
+        sector = Sector('73010', vocabulary='1', percentage=60)
+        other = Sector('73010', vocabulary='1', percentage='40')
+        assert sector.code is other.code
+        assert sector.vocabulary is other.vocabulary
+        assert (sector.percentage, other.percentage) == (60.0, 40.0)
+        assert sector != other
+
+    def test_sector_slots(self):
+        sector = Sector('73010', vocabulary='1')
+        with pytest.raises(AttributeError):
+            sector.__dict__  # pylint: disable=pointless-statement
+
+    def test_sector_codes_looked_up_once(self):
+        with patch.dict(sector_module._SECTORS, clear=True), \
+                patch.object(sector_module, '_lookup',
+                             wraps=sector_module._lookup) as lookup:
+            for _ in range(3):
+                Sector('73010', vocabulary='1')
+                with pytest.raises(UnknownSectorCodeError):
+                    Sector(12345, vocabulary=1)
+        assert lookup.call_count == 2
+
+    def test_sector_batch(self):
+        sectors = Sector.batch([('73010', '1', '60'), ('73010', '1', None),
+                                ('ABCD', None, '10')])
+        assert sectors == [Sector('73010', vocabulary='1', percentage=60),
+                           Sector('73010', vocabulary='1'),
+                           Sector('ABCD', percentage=10)]
+        with pytest.raises(UnknownSectorVocabError):
+            Sector.batch([('12345', '10', None)])
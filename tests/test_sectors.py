@@ -0,0 +1,165 @@
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from iatikit import Sector
+from iatikit.data.dataset import DatasetSet
+from iatikit.data.activity import ActivitySet
+from iatikit.index.catalog import Catalog
+from iatikit.index.sectors import SectorIndex
+from iatikit.standard.schema import get_schema
+from iatikit.utils import instrument
+from iatikit.utils.config import CONFIG
+
+
+SECTOR_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<iati-activities version="2.03">
+  <iati-activity>
+    <iati-identifier>XM-1</iati-identifier>
+    <sector code="15153" vocabulary="1" percentage="60"/>
+    <sector code="15163" vocabulary="1" percentage="40"/>
+  </iati-activity>
+  <iati-activity>
+    <iati-identifier>XM-2</iati-identifier>
+  </iati-activity>
+  <iati-activity>
+    <iati-identifier>XM-3</iati-identifier>
+    <sector code="15163" percentage="bad"/>
+    <sector code="73010" vocabulary="1" percentage="100"/>
+  </iati-activity>
+</iati-activities>'''
+
+
+class TestSectorIndex(TestCase):
+    def setUp(self):
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.sectors = SectorIndex([
+            ['1', '15153', 0, 60.0],
+            ['1', '15163', 0, 40.0],
+            [None, '15163', 2, None],
+            ['1', '73010', 2, 100.0],
+            ['2', '151', 3, None],
+        ], 4, get_schema('activity', '2.03'))
+
+    def test_postings(self):
+        assert self.sectors.postings(
+            'eq', Sector('15163', vocabulary='1')) == \
+            [(0, 40.0), (2, None)]
+        assert self.sectors.postings(
+            'in', Sector('151', vocabulary='2')) == \
+            [(0, 60.0), (0, 40.0), (2, None)]
+        assert self.sectors.postings(
+            'eq', Sector('151', vocabulary='2')) == [(3, None)]
+        # without a vocabulary, any vocabulary matches
+        assert self.sectors.postings('eq', Sector('15163')) is None
+
+    def test_find(self):
+        assert self.sectors.find(
+            'sector', 'in', Sector('151', vocabulary='2')) == {0, 2}
+        assert self.sectors.find('sector', 'exists', True) == {0, 2, 3}
+        assert self.sectors.find('sector', 'exists', False) == {1}
+        assert self.sectors.find('title', 'eq', 'test') is None
+
+    def test_invalid_filter(self):
+        with pytest.raises(Exception, match='is not a sector category'):
+            self.sectors.find('sector', 'in', Sector('15163', vocabulary='1'))
+
+
+class TestSectorFilters(TestCase):
+    def setUp(self):
+        self.registry_path = tempfile.mkdtemp(
+            dir=dirname(abspath(__file__)))
+        shutil.rmtree(self.registry_path)
+        shutil.copytree(
+            join(dirname(abspath(__file__)), 'fixtures', 'registry'),
+            self.registry_path)
+        with open(join(self.registry_path, 'data', 'old-org',
+                       'sectors.xml'), 'wb') as handler:
+            handler.write(SECTOR_XML)
+        metadata_path = join(self.registry_path, 'metadata', 'old-org')
+        with open(join(metadata_path, 'old-org-acts.json')) as handler:
+            metadata = handler.read()
+        with open(join(metadata_path, 'sectors.json'), 'w') as handler:
+            handler.write(metadata.replace('old-org-acts', 'sectors'))
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+        self.catalog = Catalog(self.registry_path)
+        self.skips = []
+        instrument.subscribe(self._listener)
+
+    def _listener(self, event, data):
+        if event == 'index_skips':
+            self.skips.append(data['dataset'])
+
+    def _datasets(self):
+        return DatasetSet(join(self.registry_path, 'data', '*', '*'),
+                          join(self.registry_path, 'metadata', '*', '*'))
+
+    def _identifiers(self, **kwargs):
+        activities = ActivitySet(self._datasets()).where(**kwargs)
+        return [activity.iati_identifier for activity in activities.all()]
+
+    def test_filters_match_xml(self):
+        filters = [
+            {'sector': Sector('15163', vocabulary='1')},
+            {'sector': Sector('15163', vocabulary='DAC')},
+            {'sector': Sector('73010', vocabulary='1')},
+            {'sector': Sector('73010')},
+            {'sector__in': Sector('151', vocabulary='2')},
+            {'sector__exists': False},
+            {'sector__exists': True,
+             'planned_start__lt': '2013-02-01'},
+            {'sector__in': Sector('730', vocabulary='2'),
+             'humanitarian': False},
+        ]
+        expected = [self._identifiers(**wheres) for wheres in filters]
+        assert all(expected)
+        self.catalog.build()
+        for wheres, identifiers in zip(filters, expected):
+            assert self._identifiers(**wheres) == identifiers, wheres
+            assert len(ActivitySet(self._datasets()).where(**wheres)) == \
+                len(identifiers)
+
+    def test_datasets_not_parsed(self):
+        self.catalog.build()
+        datasets = self._datasets().all()
+        activities = ActivitySet(
+            datasets, sector__in=[Sector('151', vocabulary='2')])
+        identifiers = [act.iati_identifier for act in activities]
+        assert identifiers == ['GB-COH-01234567-1', 'XM-1', 'XM-3']
+        assert all(dataset._etree is None for dataset in datasets)
+        assert self.skips == ['fixture-org-activities2', 'old-org-acts']
+
+    def test_bad_sector_filter(self):
+        self.catalog.build()
+        with pytest.raises(Exception, match='is not a sector category'):
+            self._identifiers(sector__in='bad-sector-cat')
+
+    def test_sector_postings(self):
+        self.catalog.build()
+        postings = [
+            (data_path.split('/')[-1], ordinal, percentage)
+            for data_path, ordinal, percentage in self.catalog.sector_postings(
+                Sector('151', vocabulary='2'), category=True)]
+        assert postings == [
+            ('fixture-org-activities.xml', 0, None),
+            ('sectors.xml', 0, 60.0),
+            ('sectors.xml', 0, 40.0),
+            ('sectors.xml', 2, None),
+        ]
+        postings = list(self.catalog.sector_postings(
+            Sector('73010', vocabulary='1')))
+        assert [posting[1:] for posting in postings] == \
+            [(0, None), (1, None), (2, 100.0)]
+
+    def tearDown(self):
+        instrument.unsubscribe(self._listener)
+        shutil.rmtree(self.registry_path, ignore_errors=True)
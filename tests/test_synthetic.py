@@ -0,0 +1,71 @@
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+from unittest import TestCase
+
+from benchmarks.suite import Context, run
+from benchmarks.synthetic import generate_registry
+from iatikit.data.registry import Registry
+from iatikit.utils.config import CONFIG
+
+
+class TestSyntheticRegistry(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(dir=dirname(abspath(__file__)))
+        self.registry_path = join(self.workdir, 'registry')
+        standard_path = join(dirname(abspath(__file__)),
+                             'fixtures', 'standard')
+        config_dict = {'paths': {'standard': standard_path}}
+        CONFIG.read_dict(config_dict)
+
+    def test_generate_registry(self):
+        summary = generate_registry(
+            self.registry_path, publishers=2, datasets_per_publisher=3,
+            activities_per_dataset=4)
+        registry = Registry(self.registry_path)
+
+        assert summary['datasets'] == 8
+        assert len(registry.publishers) == 2
+        assert len(registry.datasets) == 8
+        assert len(registry.datasets.where(filetype='activity')) == 6
+        assert len(registry.activities) == 24
+        assert len(registry.organisations) == 2
+        versions = set(dataset.version for dataset in registry.datasets)
+        assert versions == {'1.03', '2.03'}
+
+    def test_generate_broken_registry(self):
+        summary = generate_registry(
+            self.registry_path, publishers=2, datasets_per_publisher=3,
+            activities_per_dataset=4, broken=1.0)
+        registry = Registry(self.registry_path)
+
+        assert summary['broken_datasets'] == 8
+        assert all(not dataset.validate_xml()
+                   for dataset in registry.datasets)
+
+    def test_generate_registry_is_reproducible(self):
+        generate_registry(self.registry_path, publishers=1, seed=1)
+        dataset_path = join(self.registry_path, 'data', 'synthetic-0000',
+                            'synthetic-0000-activities-0.xml')
+        with open(dataset_path, 'rb') as handler:
+            first = handler.read()
+        shutil.rmtree(self.registry_path)
+        generate_registry(self.registry_path, publishers=1, seed=1)
+        with open(dataset_path, 'rb') as handler:
+            assert handler.read() == first
+
+    def test_run_benchmarks(self):
+        summary = generate_registry(
+            self.registry_path, publishers=2, datasets_per_publisher=2,
+            activities_per_dataset=3)
+        context = Context(self.workdir, summary, None)
+        results = run(context, names=['activities.iterate',
+                                      'activities.get'], repeat=2)
+
+        assert [result['name'] for result in results] == [
+            'activities.iterate', 'activities.get']
+        assert results[0]['items'] == 12
+        assert len(results[0]['timings']) == 2
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)